@@ -1,24 +1,92 @@
 from flask import Flask
 from flask_cors import CORS
+import multiprocessing
 import os
 
 # Import blueprints
 from auth import auth_bp
 from routes.people import people_bp
 from routes.scan import scan_bp
+from routes.stream import stream_bp
+from routes.scan_jobs import scan_jobs_bp
+from routes.attendance import attendance_bp
+from routes.health import health_bp
+from database import pool
+from services.gallery import gallery
+from services.gallery_listener import gallery_listener
+from services.shared_gallery import shared_gallery
+from services import metrics
+from services.tokens import require_token
+from services.workers import face_workers
 
 # Create Flask app
 app = Flask(__name__)
-CORS(app)  # This will allow requests from your frontend
+# This will allow requests from your frontend; the listing, trace, job and
+# rate-limit headers must be exposed explicitly for the browser to let scripts read them
+CORS(app, expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", "Location", "Retry-After"])
+
+# Request latency histograms, plus a Server-Timing stage breakdown for
+# requests sent with an `X-Trace: 1` header
+metrics.init_app(app)
 
 # Set upload folder configuration
-from config import UPLOAD_FOLDER
+from config import UPLOAD_FOLDER, GALLERY_LISTEN
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# API routes need a signed login token when AUTH_REQUIRED is set
+for blueprint in (people_bp, scan_bp, stream_bp, scan_jobs_bp, attendance_bp):
+    blueprint.before_request(require_token)
+
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(people_bp)
 app.register_blueprint(scan_bp)
+app.register_blueprint(stream_bp)
+app.register_blueprint(scan_jobs_bp)
+app.register_blueprint(attendance_bp)
+app.register_blueprint(health_bp)
+
+def load_gallery():
+    """Load the face gallery from the database and apply changes to it as they commit"""
+    try:
+        gallery.load()
+        app.logger.info(f"Loaded {len(gallery)} face embeddings into the gallery")
+    finally:
+        # Enrollments and deletions made by other web workers arrive by NOTIFY
+        if GALLERY_LISTEN:
+            gallery_listener.start()
+
+def warm_up():
+    """Open the pooled DB connections, load the face gallery and start the face workers"""
+    # Load the enrolled face gallery once so scans don't hit the database per frame
+    try:
+        pool.warm()
+        if shared_gallery is not None:
+            # One process on the host loads and publishes the gallery; the rest map it
+            shared_gallery.on_writer = load_gallery
+            if not shared_gallery.start():
+                app.logger.info(f"Mapped {len(gallery)} shared face embeddings")
+        else:
+            load_gallery()
+    except Exception as e:
+        # The scan route retries the load on first use
+        app.logger.warning(f"Could not load face gallery at startup: {e}")
+
+    # Preload the dlib models before the first scan: in the worker processes,
+    # or in this process when face jobs run inline
+    if face_workers.processes > 0:
+        face_workers.start()
+    else:
+        try:
+            from services.face_engine import face_engine
+            face_engine.warm_up()
+        except Exception as e:
+            app.logger.warning(f"Could not load the face models at startup: {e}")
+
+# Face worker processes re-import this module when they start; only the
+# web process itself should warm up
+if multiprocessing.parent_process() is None:
+    warm_up()
 
 if __name__ == '__main__':
     if not os.getenv('DB_PASSWORD'):
@@ -26,4 +94,6 @@ if __name__ == '__main__':
     
     # Note: Your frontend is trying to reach http://localhost:8000
     # This Flask app runs on port 5000 by default.
+    # Development server only; serve production traffic with
+    #   gunicorn -c gunicorn.conf.py wsgi:app
     app.run(debug=True, port=5000)
\ No newline at end of file
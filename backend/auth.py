@@ -1,10 +1,58 @@
 from flask import Blueprint, request, jsonify, current_app
-import secrets
-from database import get_db_connection, hash_password, check_password
+import math
+import threading
+import time
+from config import (
+    AUTH_TOKEN_TTL, LOGIN_RATE_WINDOW, LOGIN_RATE_LIMIT_IP, LOGIN_RATE_LIMIT_EMAIL, AUTH_UNKNOWN_EMAIL_TTL
+)
+from database import db_connection, hash_password, check_password
+from services.metrics import registry
+from services.rate_limit import SlidingWindowLimiter
+from services.tokens import issue_token
 from psycopg2.extras import RealDictCursor
 
 auth_bp = Blueprint('auth', __name__)
 
+# Login attempts are limited per client IP and per email before any bcrypt work
+login_by_ip = SlidingWindowLimiter(LOGIN_RATE_LIMIT_IP, LOGIN_RATE_WINDOW)
+login_by_email = SlidingWindowLimiter(LOGIN_RATE_LIMIT_EMAIL, LOGIN_RATE_WINDOW)
+
+login_attempts = registry.counter("frs_login_attempts_total", "Login attempts by outcome")
+
+# Emails recently looked up with no account: _email_key(email) -> expiry (monotonic seconds)
+_unknown_emails = {}
+_unknown_emails_lock = threading.Lock()
+_UNKNOWN_EMAILS_MAX = 10000
+
+def _email_key(email):
+    """One key per address for the login limiter and the unknown-email cache"""
+    return email.strip().lower()
+
+def _is_unknown_email(email):
+    with _unknown_emails_lock:
+        expires = _unknown_emails.get(email)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del _unknown_emails[email]
+            return False
+        return True
+
+def _remember_unknown_email(email):
+    if not AUTH_UNKNOWN_EMAIL_TTL:
+        return
+    with _unknown_emails_lock:
+        if len(_unknown_emails) >= _UNKNOWN_EMAILS_MAX:
+            # Drop expired entries, or everything if they are all still fresh
+            now = time.monotonic()
+            for key in [key for key, expires in _unknown_emails.items() if expires <= now] or list(_unknown_emails):
+                del _unknown_emails[key]
+        _unknown_emails[email] = time.monotonic() + AUTH_UNKNOWN_EMAIL_TTL
+
+def _forget_unknown_email(email):
+    with _unknown_emails_lock:
+        _unknown_emails.pop(email, None)
+
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     data = request.get_json()
@@ -15,46 +63,41 @@ def signup():
     if not all([full_name, email, password]):
         return jsonify({"error": "Missing data"}), 400
 
+    # Stored the way login looks it up (migrations/006_users_email_lower.sql)
+    email = _email_key(email)
     hashed_pw = hash_password(password)
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Check if email already exists
-        cur.execute("SELECT email FROM users WHERE email = %s", (email,))
-        if cur.fetchone():
-            return jsonify({"error": "Email already registered", "field": "email"}), 409
-            
-        # Check if username already exists
-        cur.execute("SELECT username FROM users WHERE username = %s", (full_name,))
-        if cur.fetchone():
-            return jsonify({"error": "Username already taken, please try a different name", "field": "username"}), 409
-
-        # Proceed with registration if username and email are unique
-        cur.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id",
-            (full_name, email, hashed_pw.decode('utf-8')) 
-        )
-        user_id_data = cur.fetchone()
-        if not user_id_data or 'id' not in user_id_data:
-             current_app.logger.error("User ID not returned after insert.")
-             return jsonify({"error": "Failed to register user"}), 500
-        user_id = user_id_data['id']
-        conn.commit()
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Check if email already exists
+            cur.execute("SELECT email FROM users WHERE email = %s", (email,))
+            if cur.fetchone():
+                return jsonify({"error": "Email already registered", "field": "email"}), 409
+                
+            # Check if username already exists
+            cur.execute("SELECT username FROM users WHERE username = %s", (full_name,))
+            if cur.fetchone():
+                return jsonify({"error": "Username already taken, please try a different name", "field": "username"}), 409
+
+            # Proceed with registration if username and email are unique
+            cur.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id",
+                (full_name, email, hashed_pw.decode('utf-8')) 
+            )
+            user_id_data = cur.fetchone()
+            if not user_id_data or 'id' not in user_id_data:
+                 current_app.logger.error("User ID not returned after insert.")
+                 return jsonify({"error": "Failed to register user"}), 500
+            user_id = user_id_data['id']
+            conn.commit()
+        # Signups in other web workers are seen once their cache entry expires
+        _forget_unknown_email(email)
         
         return jsonify({"message": "User registered successfully!", "user_id": user_id}), 201
     except Exception as e:
-        if conn:
-            conn.rollback()
+        # Uncommitted work is rolled back when the connection returns to the pool
         current_app.logger.error(f"Database error during signup: {e}")
         return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        if conn:
-            if 'cur' in locals():  # Check if cur exists before trying to close it
-                cur.close()
-            conn.close()
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -65,25 +108,42 @@ def login():
     if not all([email, password]):
         return jsonify({'error': 'Missing email or password'}), 400
 
-    conn = None
-    cur = None  # Initialize cur to prevent the UnboundLocalError
+    # Throttle before touching the database or bcrypt, so credential stuffing stays cheap
+    email_key = _email_key(email)
+    retry_after = login_by_ip.hit(request.remote_addr or 'unknown') or login_by_email.hit(email_key)
+    if retry_after:
+        login_attempts.inc(outcome="rate_limited")
+        return jsonify({'error': 'Too many login attempts, please try again later'}), 429, \
+            {'Retry-After': str(math.ceil(retry_after))}
+
+    if _is_unknown_email(email_key):
+        login_attempts.inc(outcome="unknown_email")
+        return jsonify({'error': 'Invalid email or password'}), 401
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Check if user exists
-        cur.execute("SELECT id, username, email, password_hash FROM users WHERE email = %s", (email,))
-        user = cur.fetchone()
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Check if user exists; emails are stored in the same form as the cache key
+            cur.execute(
+                "SELECT id, username, email, password_hash FROM users WHERE email = %s",
+                (email_key,)
+            )
+            user = cur.fetchone()
         
         if not user:
+            _remember_unknown_email(email_key)
+            login_attempts.inc(outcome="unknown_email")
             return jsonify({'error': 'Invalid email or password'}), 401
             
-        # Check password
+        # Check password (after the connection is back in the pool; bcrypt is slow)
         if not check_password(password, user['password_hash']):
+            login_attempts.inc(outcome="bad_password")
             return jsonify({'error': 'Invalid email or password'}), 401
-            
-        # Generate token (you would use a proper JWT here)
-        token = secrets.token_hex(16)
+
+        login_by_email.reset(email_key)
+        login_attempts.inc(outcome="success")
+
+        # Signed and expiring; verified by the API routes without a database lookup
+        token = issue_token(user)
         
         # Don't return the password hash to the client
         user.pop('password_hash', None)
@@ -91,13 +151,9 @@ def login():
         return jsonify({
             'message': 'Login successful',
             'token': token,
+            'expires_in': AUTH_TOKEN_TTL,
             'user': user
         }), 200
     except Exception as e:
         current_app.logger.error(f"Login error: {e}")
-        return jsonify({'error': 'Login failed'}), 500
-    finally:
-        if cur:  # Only try to close the cursor if it exists
-            cur.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        return jsonify({'error': 'Login failed'}), 500
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Latency and detection recall of the face pipeline at different detection sizes.
+
+For every image in a directory, runs load -> detect -> encode once per
+DETECTION_MAX_SIDE setting and compares the detected boxes with those found at
+full resolution (the reference). A reference face counts as recalled when a
+box at the reduced setting overlaps it with IoU >= 0.5.
+
+Usage (from the backend directory):
+    python -m benchmarks.detection_resolution <image_dir> [--sizes 0,1280,960,640,480,320]
+                                              [--repeat 3] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from config import IMAGE_MAX_SIDE  # noqa: E402
+from face_utils import load_image, detect_faces, encode_faces  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union else 0.0
+
+
+def run_pipeline(image_data, max_side):
+    """Returns (boxes in decoded-image coordinates, seconds)"""
+    started = time.perf_counter()
+    image, _ = load_image(image_data, IMAGE_MAX_SIDE)
+    boxes = detect_faces(image, max_side=max_side)
+    encode_faces(image, boxes)
+    return boxes, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir')
+    parser.add_argument('--sizes', default='0,1280,960,640,480,320',
+                        help='Comma-separated DETECTION_MAX_SIDE values; 0 = full resolution')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    paths = sorted(
+        os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        sys.exit(1)
+    images = [open(path, 'rb').read() for path in paths]
+
+    # Full-resolution detections are the ground truth for recall
+    reference = [run_pipeline(data, 0)[0] for data in images]
+    total_reference = sum(len(boxes) for boxes in reference)
+
+    results = []
+    for max_side in sizes:
+        latencies, recalled = [], 0
+        for data, expected in zip(images, reference):
+            for _ in range(args.repeat):
+                boxes, seconds = run_pipeline(data, max_side)
+                latencies.append(seconds)
+            recalled += sum(1 for box in expected if any(iou(box, found) >= 0.5 for found in boxes))
+
+        latencies_ms = np.array(latencies) * 1000
+        results.append({
+            "max_side": max_side,
+            "images": len(images),
+            "mean_ms": float(latencies_ms.mean()),
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p95_ms": float(np.percentile(latencies_ms, 95)),
+            "recall": recalled / total_reference if total_reference else None,
+        })
+
+    print(f"{len(images)} images, {total_reference} faces at full resolution\n")
+    print(f"{'max_side':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'recall':>8}")
+    for row in results:
+        recall = f"{row['recall']:.3f}" if row['recall'] is not None else "n/a"
+        label = row['max_side'] or 'full'
+        print(f"{label:>9} {row['mean_ms']:>9.1f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {recall:>8}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({"reference_faces": total_reference, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
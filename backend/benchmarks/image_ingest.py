@@ -0,0 +1,85 @@
+"""
+Decode time and peak memory of the image ingest path against the old one.
+
+"legacy" reads the upload into new bytes, wraps it in BytesIO and converts
+with np.asarray(img) (what face_utils.load_image did); "ingest" uses
+services.image_ingest (reused upload buffer, decode into a reused array).
+Each mode runs in a fresh process so its peak RSS is measured on its own.
+
+Usage (from the backend directory; Unix only, peak RSS comes from getrusage):
+    python -m benchmarks.image_ingest <image> [--repeat 20] [--max-side 2048]
+"""
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak_rss_kb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def legacy(stream, max_side):
+    import numpy as np
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(stream.read()))
+    if max_side and max(img.size) > max_side:
+        ratio = max_side / max(img.size)
+        img.draft('RGB', (int(img.size[0] * ratio), int(img.size[1] * ratio)))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(img)
+
+
+def ingest(stream, max_side):
+    from services.image_ingest import read_upload, decode_image
+    return decode_image(read_upload(stream), max_side)[0]
+
+
+def run(mode, path, repeat, max_side):
+    """Child process: time `repeat` decodes and report the peak RSS they added"""
+    decode = {"legacy": legacy, "ingest": ingest}[mode]
+    with open(path, 'rb') as f:
+        stream = io.BytesIO(f.read())
+    import services.image_ingest  # noqa: F401 - imports (numpy, PIL) are not part of the measurement
+    baseline = peak_rss_kb()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        stream.seek(0)
+        image = decode(stream, max_side)
+    seconds = (time.perf_counter() - started) / repeat
+    print(f"{mode:7s} {image.shape[1]}x{image.shape[0]}  {seconds * 1000:7.1f} ms/image  "
+          f"peak RSS +{(peak_rss_kb() - baseline) / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-side', type=int, default=2048)
+    parser.add_argument('--mode', choices=("legacy", "ingest"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.image, args.repeat, args.max_side)
+        return
+    for mode in ("legacy", "ingest"):
+        subprocess.run([
+            sys.executable, '-m', 'benchmarks.image_ingest', args.image,
+            '--repeat', str(args.repeat), '--max-side', str(args.max_side), '--mode', mode
+        ], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,519 @@
+"""
+Load test: replay scan and enroll traffic against the full Flask stack at rising concurrency.
+
+Every step keeps N clients busy for --duration seconds (after --warmup
+seconds that are not measured). A client sends its next request as soon as
+the previous one is answered, over one keep-alive connection, the way a
+webcam client posts frames. Per step the report shows:
+
+  rps        answered requests per second, without 429s and errors
+  p50..p99   latency of those requests (ms)
+  shed       share refused with 429 because the face worker queue was full
+  errors     share of 5xx answers, timeouts and connection failures
+  db waits   pooled connection checkouts that had to wait (from /api/health)
+
+The server is saturated at the first step where throughput grows less than
+--saturation-gain over the step before, or where shed + errors exceed
+--max-error-rate. The step before that is the most concurrency it serves well.
+
+Traffic:
+  --traffic FILE.jsonl   Recorded requests, one JSON object per line:
+                           {"kind": "scan", "image": "frames/0001.jpg", "camera_id": "door-1"}
+                           {"kind": "stream", "image": "frames/0002.jpg"}
+                           {"kind": "enroll", "image": "people/ada.jpg", "fields": {"full_name": "Ada {n}"}}
+                         Image paths are relative to the file. "stream" frames go to a
+                         streaming session each client opens; "{n}" in enroll fields
+                         becomes a unique number.
+  --images DIR           Every photo in DIR, replayed as a scan (e.g. frames saved
+                         from the cameras, or the benchmark suite's test frames)
+
+Each client replays the traffic in order from its own starting point. A few
+bytes are appended after every image (decoders ignore them), so a replayed
+frame is not answered from the embedding cache; --allow-cache-hits sends the
+images unchanged.
+
+Server:
+  --serve sqlite         (default) Start the app against the in-memory SQLite
+                         stand-in, with --gallery-size synthetic people plus the
+                         faces of the first --enroll-known scan images, so scans
+                         find matches. One web process: the stand-in is not
+                         shared between processes.
+  --serve postgres       Start `gunicorn -c gunicorn.conf.py wsgi:app` against the
+                         configured database
+  --url URL              Test a server that is already running
+
+Both --serve modes run gunicorn with the settings of gunicorn.conf.py; where
+it is not installed the sqlite stand-in falls back to werkzeug's threaded server.
+
+Usage (from the backend directory):
+    python -m benchmarks.loadtest (--traffic FILE.jsonl | --images DIR)
+        [--serve sqlite|postgres | --url http://host:5000] [--concurrency 1,2,4,8,16,32,64]
+        [--duration 20] [--warmup 3] [--token TOKEN] [--json results.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import runpy
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.suite import IMAGE_EXTENSIONS, random_unit_vectors, summarize  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KINDS = ("scan", "stream", "enroll")
+# Seconds a started server is given to load the gallery and the face models
+SERVER_START_TIMEOUT = 300
+# Seconds a client waits for one response before counting it as an error
+REQUEST_TIMEOUT = 60
+
+
+# --- Traffic ---
+
+def load_traffic(traffic_path=None, image_dir=None):
+    """
+    Returns:
+        list: {"kind", "image" (bytes), "filename", "fields", "camera_id"} per request
+    """
+    entries = []
+    if traffic_path:
+        base = os.path.dirname(os.path.abspath(traffic_path))
+        with open(traffic_path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.get("kind", "scan")
+                if kind not in KINDS:
+                    raise ValueError(f"{traffic_path}:{line_number}: kind must be one of {', '.join(KINDS)}")
+                with open(os.path.join(base, record["image"]), 'rb') as image:
+                    data = image.read()
+                entries.append({
+                    "kind": kind,
+                    "image": data,
+                    "filename": os.path.basename(record["image"]),
+                    "fields": record.get("fields", {}),
+                    "camera_id": record.get("camera_id", ""),
+                })
+    if image_dir:
+        for name in sorted(os.listdir(image_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(image_dir, name), 'rb') as image:
+                    entries.append({"kind": "scan", "image": image.read(), "filename": name,
+                                    "fields": {}, "camera_id": ""})
+    return entries
+
+
+def multipart(fields, image, filename):
+    """(body, content type) of a multipart/form-data upload with the image as faceImage"""
+    boundary = secrets.token_hex(16)
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="faceImage"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+    parts.append(image)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Replayer:
+    """Turns traffic entries into HTTP requests; shared by all clients of a run"""
+
+    def __init__(self, entries, unique_frames=True, token=None):
+        self.entries = entries
+        self.unique_frames = unique_frames
+        self.token = token
+        self.run_id = secrets.token_hex(4)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next_number(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def headers(self, content_type=None):
+        headers = {}
+        if content_type:
+            headers["Content-Type"] = content_type
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def image(self, entry, number):
+        if not self.unique_frames:
+            return entry["image"]
+        # Trailing bytes after the image data change its content hash, not its pixels
+        return entry["image"] + number.to_bytes(8, "little")
+
+    def request(self, entry, session_id=None):
+        """(method, path, body, headers) for one replayed entry"""
+        number = self.next_number()
+        image = self.image(entry, number)
+        if entry["kind"] == "stream":
+            return ("POST", f"/api/scan/sessions/{session_id}/frames", image,
+                    self.headers("application/octet-stream"))
+        if entry["kind"] == "enroll":
+            fields = {
+                "full_name": "Load Test {n}",
+                "email": f"loadtest-{self.run_id}-{{n}}@example.com",
+                **entry["fields"],
+            }
+            fields = {name: str(value).replace("{n}", str(number)) for name, value in fields.items()}
+            body, content_type = multipart(fields, image, entry["filename"])
+            return "POST", "/api/people", body, self.headers(content_type)
+        fields = {"camera_id": entry["camera_id"]} if entry["camera_id"] else {}
+        body, content_type = multipart(fields, image, entry["filename"])
+        return "POST", "/api/scan", body, self.headers(content_type)
+
+
+# --- Clients ---
+
+class Client:
+    """One keep-alive connection replaying the traffic from its own offset"""
+
+    def __init__(self, target, replayer, offset):
+        self.target = target
+        self.replayer = replayer
+        self.position = offset
+        self.session_id = None
+        self.samples = []  # (started_at, seconds, status, kind); status 0 = no response
+        self._conn = None
+
+    def send(self, method, path, body=None, headers=None):
+        """Returns (status, response body); status 0 when the request failed"""
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.target.hostname, self.target.port or 80,
+                                                        timeout=REQUEST_TIMEOUT)
+            self._conn.request(method, path, body=body, headers=headers or {})
+            response = self._conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, b""
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def open_session(self):
+        status, body = self.send("POST", "/api/scan/sessions", headers=self.replayer.headers())
+        self.session_id = json.loads(body)["session_id"] if status == 201 else None
+        return status
+
+    def run(self, stop_at):
+        entries = self.replayer.entries
+        while time.perf_counter() < stop_at:
+            entry = entries[self.position % len(entries)]
+            self.position += 1
+            started = time.perf_counter()
+            if entry["kind"] == "stream" and self.session_id is None:
+                status = self.open_session()
+                if self.session_id is None:
+                    self.samples.append((started, time.perf_counter() - started, status, "stream"))
+                    continue
+            status, _ = self.send(*self.replayer.request(entry, self.session_id))
+            if entry["kind"] == "stream" and status == 404:
+                # The session expired; the next stream frame opens another
+                self.session_id = None
+            self.samples.append((started, time.perf_counter() - started, status, entry["kind"]))
+
+
+def server_stats(target):
+    """Database pool and face worker stats from /api/health, or None"""
+    try:
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=10)
+        conn.request("GET", "/api/health")
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return json.loads(body) if response.status == 200 else None
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+
+
+def run_step(target, replayer, concurrency, duration, warmup):
+    """Keep `concurrency` clients busy for warmup + duration seconds and summarize the measured part"""
+    before = server_stats(target)
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    clients = [Client(target, replayer, i * len(replayer.entries) // concurrency) for i in range(concurrency)]
+    threads = [threading.Thread(target=client.run, args=(stop_at,), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        if client.session_id is not None:
+            client.send("DELETE", f"/api/scan/sessions/{client.session_id}", headers=replayer.headers())
+        client.close()
+    after = server_stats(target)
+
+    samples = [sample for client in clients for sample in client.samples if sample[0] >= measure_from]
+    statuses = {}
+    for _, _, status, _ in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    shed = statuses.get(429, 0)
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+    answered = [seconds for _, seconds, status, _ in samples if status and status != 429 and status < 500]
+    kinds = sorted({kind for _, _, _, kind in samples})
+
+    def pool_delta(key):
+        if not before or not after:
+            return None
+        return after["db_pool"].get(key, 0) - before["db_pool"].get(key, 0)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "rps": len(answered) / duration,
+        "latency": summarize(answered),
+        "latency_by_kind": {
+            kind: summarize([seconds for _, seconds, status, k in samples
+                             if k == kind and status and status != 429 and status < 500])
+            for kind in kinds
+        },
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "shed_rate": shed / len(samples) if samples else 0.0,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "db_pool_waits": pool_delta("waits"),
+        "db_pool_timeouts": pool_delta("timeouts"),
+        "face_workers": after["face_workers"] if after else None,
+    }
+
+
+def find_saturation(steps, saturation_gain, max_error_rate):
+    """
+    Returns:
+        tuple: (concurrency, reason) of the first saturated step, or (None, None)
+    """
+    previous = None
+    for step in steps:
+        if step["shed_rate"] + step["error_rate"] > max_error_rate:
+            return step["concurrency"], f"shed + errors above {max_error_rate * 100:g}%"
+        if previous is not None and step["rps"] < previous["rps"] * (1 + saturation_gain):
+            return step["concurrency"], f"throughput gained less than {saturation_gain * 100:g}%"
+        previous = step
+    return None, None
+
+
+# --- Servers ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port):
+    """Start the app in a child process on 127.0.0.1:port"""
+    if args.serve == "postgres":
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '--bind', f'127.0.0.1:{port}', 'wsgi:app']
+    else:
+        # The child rebuilds the traffic to enroll the faces it contains
+        command = [sys.executable, '-m', 'benchmarks.loadtest', *sys.argv[1:], '--standin-port', str(port)]
+    return subprocess.Popen(command, cwd=BACKEND_DIR)
+
+
+def wait_until_ready(target, server):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server.returncode} while starting")
+        if server_stats(target) is not None:
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"The server did not answer /api/health within {SERVER_START_TIMEOUT} seconds")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def build_standin(args):
+    """The app over the SQLite stand-in, enrolled with synthetic people and the traffic's faces"""
+    import numpy as np
+    import database as db
+    import face_utils
+    from config import EMBEDDING_DIM
+    from benchmarks.sqlite_shim import SQLitePool
+
+    db.pool = SQLitePool()
+    rng = np.random.default_rng(args.seed)
+    db.pool.add_people(
+        [{"full_name": f"Person {i}", "email": f"person{i}@example.com"} for i in range(args.gallery_size)],
+        random_unit_vectors(rng, args.gallery_size, EMBEDDING_DIM),
+    )
+
+    known, seen = [], set()
+    for entry in load_traffic(args.traffic, args.images):
+        if len(seen) >= args.enroll_known:
+            break
+        if entry["kind"] == "enroll" or entry["filename"] in seen:
+            continue
+        seen.add(entry["filename"])
+        encodings, _, _, _ = face_utils.process_image_with_multiple_faces(entry["image"])
+        known.extend(encodings)
+    if known:
+        db.pool.add_people([{"full_name": f"Known {i}", "email": f"known{i}@example.com"}
+                            for i in range(len(known))], known)
+
+    from app import app
+    return app
+
+
+def serve_standin(args):
+    """Child process of --serve sqlite: serve the stand-in app until terminated"""
+    # Set before config is imported: the stand-in stores packed embeddings and
+    # has no PostgreSQL to LISTEN on or other processes to share the gallery with
+    os.environ["EMBEDDING_STORAGE"] = "float32"
+    os.environ["GALLERY_LISTEN"] = "false"
+    os.environ["GALLERY_SHARED_DIR"] = ""
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+
+    if BaseApplication is None:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        print("gunicorn is not installed; serving with werkzeug's threaded server (a thread per connection)")
+        server = make_server("127.0.0.1", args.standin_port, build_standin(args), threaded=True,
+                             request_handler=QuietHandler)
+        # Stop the face worker processes too when the load test terminates the server
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            server.serve_forever()
+        finally:
+            from services.workers import face_workers
+            face_workers.shutdown()
+        return
+
+    class StandIn(BaseApplication):
+        def load_config(self):
+            settings = runpy.run_path(os.path.join(BACKEND_DIR, "gunicorn.conf.py"))
+            for name, value in settings.items():
+                if name in self.cfg.settings and value is not None:
+                    self.cfg.set(name, value)
+            # The in-memory stand-in lives in one process
+            self.cfg.set("workers", 1)
+            self.cfg.set("bind", f"127.0.0.1:{args.standin_port}")
+
+        def load(self):
+            return build_standin(args)
+
+    StandIn().run()
+
+
+# --- Reporting ---
+
+def print_steps(steps, saturation, reason):
+    print(f"{'clients':>7} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'shed':>7} {'errors':>7} {'db waits':>9}")
+    for step in steps:
+        latency = step["latency"] or {"p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0}
+        waits = "-" if step["db_pool_waits"] is None else str(step["db_pool_waits"])
+        print(f"{step['concurrency']:7d} {step['rps']:8.1f} {latency['p50_ms']:8.1f} {latency['p90_ms']:8.1f} "
+              f"{latency['p99_ms']:8.1f} {step['shed_rate'] * 100:6.1f}% {step['error_rate'] * 100:6.1f}% "
+              f"{waits:>9}")
+
+    peak = max(steps, key=lambda step: step["rps"])
+    if saturation is None:
+        print(f"\nNo saturation up to {steps[-1]['concurrency']} clients; "
+              f"peak {peak['rps']:.1f} rps at {peak['concurrency']} clients")
+    else:
+        print(f"\nSaturated at {saturation} clients ({reason}); "
+              f"peak {peak['rps']:.1f} rps at {peak['concurrency']} clients")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--traffic', help='Recorded requests (.jsonl)')
+    parser.add_argument('--images', help='Directory of photos replayed as scans')
+    server = parser.add_mutually_exclusive_group()
+    server.add_argument('--url', help='Base URL of a running server')
+    server.add_argument('--serve', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32,64', help='Clients per step')
+    parser.add_argument('--duration', type=float, default=20, help='Measured seconds per step')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds at the start of a step')
+    parser.add_argument('--saturation-gain', type=float, default=0.1,
+                        help='Smallest throughput gain over the previous step that is not saturation')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Shed + error share that counts as saturation')
+    parser.add_argument('--allow-cache-hits', action='store_true', help='Replay images byte for byte')
+    parser.add_argument('--token', help='Login token sent as Authorization: Bearer')
+    parser.add_argument('--gallery-size', type=int, default=10000, help='Synthetic people in the SQLite stand-in')
+    parser.add_argument('--enroll-known', type=int, default=20,
+                        help='Scan images whose faces the SQLite stand-in enrolls')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path')
+    parser.add_argument('--standin-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not args.traffic and not args.images:
+        parser.error("pass --traffic or --images")
+    if args.standin_port:
+        serve_standin(args)
+        return
+
+    entries = load_traffic(args.traffic, args.images)
+    if not entries:
+        parser.error("the traffic contains no requests")
+    kinds = {kind: sum(1 for entry in entries if entry["kind"] == kind) for kind in KINDS}
+    print("Traffic: " + ", ".join(f"{count} {kind}" for kind, count in kinds.items() if count))
+
+    server = None
+    if args.url:
+        target = urlsplit(args.url)
+    else:
+        port = free_port()
+        target = urlsplit(f"http://127.0.0.1:{port}")
+        server = start_server(args, port)
+    try:
+        if server is not None:
+            wait_until_ready(target, server)
+        replayer = Replayer(entries, unique_frames=not args.allow_cache_hits, token=args.token)
+        steps = []
+        for concurrency in (int(c) for c in args.concurrency.split(',') if c):
+            steps.append(run_step(target, replayer, concurrency, args.duration, args.warmup))
+            step = steps[-1]
+            print(f"  {concurrency} clients: {step['rps']:.1f} rps, statuses {step['statuses']}")
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    saturation, reason = find_saturation(steps, args.saturation_gain, args.max_error_rate)
+    print()
+    print_steps(steps, saturation, reason)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({"arguments": vars(args), "traffic": kinds, "steps": steps,
+                       "saturated_at": saturation, "saturation_reason": reason}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Calibrate the quantized matcher: accuracy lost against exact matching, per compression level.
+
+Every level is trained on the gallery, then decides the same probe faces as
+the exact brute-force matcher at MATCH_THRESHOLD. A decision is the accepted
+person or no match. Per level the report shows:
+
+  bytes     code size per row (float32 rows are 512 bytes)
+  agree     probes decided exactly as the exact matcher decided them
+  lost      the exact matcher accepted someone, this level nobody
+  swapped   this level accepted a different person
+
+The shortlist is re-ranked with exact distances, so a level can never accept
+a probe the exact matcher rejects; all errors come from a true match falling
+outside the shortlist.
+
+Probes are gallery rows plus noise of random direction, with norms spread
+evenly over 0..--max-noise, so many land near the threshold where decisions
+are most fragile. For real numbers pass --probes: a .npy (n x 128) of
+embeddings from photos that were not enrolled, e.g. exported face_templates.
+
+Levels are <code>/<dims>: code 'float', 'sq8' or 'pq<subvectors>', and dims
+the PCA dimensions kept (128 = no reduction).
+
+Usage (from the backend directory):
+    python -m benchmarks.quantization [--embeddings FILE.npy | --synthetic N] [--probes FILE.npy]
+        [--levels float/64,sq8/128,sq8/64,sq8/32,pq16/64,pq8/32] [--rerank 100]
+        [--queries 2000] [--max-noise 0.8] [--json results.json]
+
+Without --embeddings or --synthetic the gallery is loaded from people_records.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from config import EMBEDDING_DIM, MATCH_THRESHOLD  # noqa: E402
+from services.matchers import BruteForceMatcher, QuantizedMatcher  # noqa: E402
+
+# Queries timed one at a time per level, as a single face per frame would be
+TIMED_QUERIES = 200
+# Probes searched together when deciding
+PROBE_BATCH = 16
+
+
+def load_gallery(args):
+    if args.embeddings:
+        return np.ascontiguousarray(np.load(args.embeddings), dtype=np.float32)
+    if args.synthetic:
+        # Unit-norm rows from a low-rank model; only good for trying the tool out
+        rng = np.random.default_rng(args.seed)
+        latent = rng.standard_normal((args.synthetic, 32), dtype=np.float32)
+        rows = latent @ rng.standard_normal((32, EMBEDDING_DIM), dtype=np.float32)
+        rows += 0.05 * rng.standard_normal(rows.shape, dtype=np.float32)
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+        return rows
+    from services.gallery import Gallery
+    gallery = Gallery(matcher=BruteForceMatcher())
+    gallery.load()
+    return np.array(gallery.embeddings)
+
+
+def make_probes(embeddings, count, max_noise, seed):
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal((count, embeddings.shape[1]), dtype=np.float32)
+    noise *= (np.linspace(0, max_noise, count, dtype=np.float32) / np.linalg.norm(noise, axis=1))[:, None]
+    return embeddings[rng.integers(0, len(embeddings), count)] + noise
+
+
+def parse_level(text):
+    code, _, dims = text.partition('/')
+    kwargs = {"pca_dim": int(dims or 0)}
+    if code.startswith('pq'):
+        kwargs.update(code="pq", pq_subvectors=int(code[2:] or 16))
+    else:
+        kwargs["code"] = code
+    return kwargs
+
+
+def decide(matcher, index, embeddings, sq_norms, probes, threshold):
+    """Accepted row per probe, -1 for no match"""
+    decisions = np.empty(len(probes), dtype=np.int64)
+    # Batches bound the (probes x rows) distance matrix
+    for start in range(0, len(probes), PROBE_BATCH):
+        indices, distances = matcher.search(index, embeddings, sq_norms, probes[start:start + PROBE_BATCH], k=1)
+        decisions[start:start + len(indices)] = np.where(distances[:, 0] < threshold, indices[:, 0], -1)
+    return decisions
+
+
+def time_queries(matcher, index, embeddings, sq_norms, probes):
+    """Mean milliseconds of a one-face search"""
+    started = time.perf_counter()
+    for probe in probes[:TIMED_QUERIES]:
+        matcher.search(index, embeddings, sq_norms, probe[None, :], k=1)
+    return (time.perf_counter() - started) / min(len(probes), TIMED_QUERIES) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--embeddings', help='Gallery as a .npy (n x 128) file')
+    source.add_argument('--synthetic', type=int, help='Use N synthetic rows instead of people_records')
+    parser.add_argument('--probes', help='Probe embeddings as a .npy (n x 128) file')
+    parser.add_argument('--levels', default='float/64,sq8/128,sq8/64,sq8/32,pq16/64,pq8/32')
+    parser.add_argument('--rerank', type=int, default=100, help='Shortlist re-ranked exactly per query')
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD)
+    parser.add_argument('--queries', type=int, default=2000, help='Generated probes (without --probes)')
+    parser.add_argument('--max-noise', type=float, default=0.8, help='Largest distance of a generated probe')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    embeddings = load_gallery(args)
+    sq_norms = np.einsum("ij,ij->i", embeddings, embeddings)
+    if args.probes:
+        probes = np.ascontiguousarray(np.load(args.probes), dtype=np.float32)
+    else:
+        probes = make_probes(embeddings, args.queries, args.max_noise, args.seed)
+    print(f"Gallery: {len(embeddings)} rows; {len(probes)} probes; threshold {args.threshold}")
+
+    brute = BruteForceMatcher()
+    exact = decide(brute, None, embeddings, sq_norms, probes, args.threshold)
+    accepted = exact >= 0
+    results = [{
+        "level": "exact", "bytes_per_row": embeddings.shape[1] * 4, "agree": 1.0, "lost": 0, "swapped": 0,
+        "train_seconds": 0.0, "ms_per_query": time_queries(brute, None, embeddings, sq_norms, probes),
+    }]
+    print(f"Exact matcher accepts {accepted.sum()} of {len(probes)} probes\n")
+
+    for level in args.levels.split(','):
+        matcher = QuantizedMatcher(rerank=args.rerank, min_train_size=0, seed=args.seed, **parse_level(level))
+        started = time.perf_counter()
+        matcher.train(embeddings)
+        codes = matcher.encode(embeddings)
+        index = matcher.prepare(codes)
+        train_seconds = time.perf_counter() - started
+
+        decided = decide(matcher, index, embeddings, sq_norms, probes, args.threshold)
+        results.append({
+            "level": level,
+            "bytes_per_row": codes.shape[1] * codes.itemsize,
+            "agree": float(np.mean(decided == exact)),
+            "lost": int(np.sum(accepted & (decided < 0))),
+            "swapped": int(np.sum(accepted & (decided >= 0) & (decided != exact))),
+            "train_seconds": train_seconds,
+            "ms_per_query": time_queries(matcher, index, embeddings, sq_norms, probes),
+        })
+
+    print(f"{'level':10s} {'bytes':>6s} {'agree':>8s} {'lost':>6s} {'swapped':>8s} {'ms/query':>9s} {'train s':>8s}")
+    for result in results:
+        print(f"{result['level']:10s} {result['bytes_per_row']:6d} {result['agree'] * 100:7.2f}% "
+              f"{result['lost']:6d} {result['swapped']:8d} {result['ms_per_query']:9.2f} "
+              f"{result['train_seconds']:8.1f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({"arguments": vars(args), "gallery_size": len(embeddings), "probes": len(probes),
+                       "exact_accepted": int(accepted.sum()), "levels": results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+In-memory SQLite stand-in for the PostgreSQL connection pool.
+
+Lets the benchmarks (and other offline tools) drive the real gallery and
+route code without a database server. It only covers the SQL those paths
+use: people_records reads, count/max probes and simple inserts (with
+psycopg2.Binary values). Optional tables probed with to_regclass() (face
+templates, the listing counter) are reported missing. `%s` placeholders are translated to SQLite's `?`, and any cursor_factory (e.g.
+RealDictCursor) yields dict rows.
+
+Usage:
+    import database
+    from benchmarks.sqlite_shim import SQLitePool
+    database.pool = SQLitePool()
+    database.pool.add_people(people, encodings)
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE people_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    department TEXT,
+    email TEXT UNIQUE,
+    phone_number TEXT,
+    face_embedding BLOB,
+    face_embedding_packed BLOB,
+    age INTEGER,
+    home_address TEXT,
+    occupation TEXT,
+    education TEXT,
+    interests TEXT,
+    hobbies TEXT,
+    bio TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class _Cursor:
+    def __init__(self, cursor, dict_rows):
+        self._cursor = cursor
+        self._dict_rows = dict_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, sql, params=()):
+        # psycopg2.Binary() wraps packed embeddings; SQLite binds the bytes inside
+        params = tuple(getattr(param, "adapted", param) for param in params or ())
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def _row(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def close(self):
+        self._cursor.close()
+
+
+class _Connection:
+    closed = False
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def cursor(self, name=None, cursor_factory=None):
+        return _Cursor(self._conn.cursor(), dict_rows=cursor_factory is not None)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+class SQLitePool:
+    """Drop-in for database.ConnectionPool backed by one in-memory SQLite database"""
+
+    def __init__(self):
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._conn.execute(SCHEMA)
+        self._conn.create_function("to_regclass", 1, lambda name: None)
+        self._lock = threading.Lock()
+        self._stats = {"acquisitions": 0}
+
+    def add_people(self, people, encodings):
+        """Enroll people (dicts of person fields) with float32-packed embeddings"""
+        encodings = np.asarray(encodings, dtype="<f4")
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO people_records (full_name, department, email, phone_number, face_embedding_packed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (person.get("full_name"), person.get("department"), person.get("email"),
+                     person.get("phone_number"), encoding.tobytes())
+                    for person, encoding in zip(people, encodings)
+                ),
+            )
+            self._conn.commit()
+
+    def getconn(self, timeout=None):
+        # SQLite serialises access to the shared in-memory database
+        self._lock.acquire()
+        self._stats["acquisitions"] += 1
+        return _Connection(self._conn, self._lock)
+
+    def putconn(self, conn, discard=False):
+        self._conn.rollback()
+        self._lock.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def warm(self):
+        pass
+
+    def closeall(self):
+        pass
+
+    def stats(self):
+        in_use = 1 if self._lock.locked() else 0
+        return dict(self._stats, size=1, in_use=in_use, idle=1 - in_use, max_size=1,
+                    utilisation=float(in_use), waits=0, timeouts=0, wait_seconds_total=0.0)
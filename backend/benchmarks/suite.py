@@ -0,0 +1,402 @@
+"""
+Offline benchmark suite for the recognition pipeline.
+
+Three benchmarks, each run in a fresh process so its peak RSS is its own:
+
+  matcher    Gallery.match() on synthetic galleries of random unit-norm
+             128-d vectors, per matcher backend, gallery size and faces per
+             frame.
+  detection  face_utils.process_image_with_multiple_faces() on test frames
+             at several resolutions and face counts, with the decode / detect
+             / encode breakdown.
+  e2e        POST /api/scan through the Flask test client, against an
+             in-memory SQLite stand-in (default) or the configured PostgreSQL
+             database. Stage timings come from the Server-Timing trace header.
+
+Test frames are composed from a portrait (--face-image): the face is tiled
+1, 2, 4... times onto a canvas of each resolution, so every run uses the same
+deterministic set. Any photos in --images are added as they are.
+
+Results are written as JSON (default benchmarks/results/<timestamp>.json);
+pass an earlier file with --compare to print the throughput change.
+
+Usage (from the backend directory):
+    python -m benchmarks.suite --face-image face.jpg
+        [--benchmarks matcher,detection,e2e] [--gallery-sizes 1000,10000,100000,1000000]
+        [--matchers brute,ivf,quantized] [--resolutions 640x480,1280x720,1920x1080,4032x3024]
+        [--face-counts 1,2,4,8] [--repeat 5] [--database sqlite|postgres]
+        [--output FILE] [--compare OLD.json]
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Queries are perturbed gallery rows at about this distance, well under MATCH_THRESHOLD
+KNOWN_QUERY_DISTANCE = 0.3
+
+
+# --- Helpers ---
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(seconds):
+    """Mean and percentile latencies (ms) of a list of durations"""
+    if not seconds:
+        return None
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def summarize_stages(stage_runs):
+    """Per-stage percentiles from a list of {stage: seconds} dicts"""
+    names = sorted({name for run in stage_runs for name in run})
+    return {name: summarize([run[name] for run in stage_runs if name in run]) for name in names}
+
+
+def random_unit_vectors(rng, n, dim):
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def run_isolated(function, **kwargs):
+    """Run one benchmark in a fresh spawned process and return its result"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, **kwargs).result()
+
+
+# --- Test frames ---
+
+def compose_frame(face, width, height, faces, quality=90):
+    """JPEG of `faces` copies of a portrait laid out in a grid on a width x height canvas"""
+    from PIL import Image
+
+    columns = math.ceil(math.sqrt(faces))
+    rows = math.ceil(faces / columns)
+    cell_w, cell_h = width // columns, height // rows
+    canvas = Image.new('RGB', (width, height), (128, 128, 128))
+    tile = face.copy()
+    tile.thumbnail((int(cell_w * 0.9), int(cell_h * 0.9)), Image.BILINEAR)
+    for i in range(faces):
+        row, column = divmod(i, columns)
+        canvas.paste(tile, (column * cell_w + (cell_w - tile.width) // 2,
+                            row * cell_h + (cell_h - tile.height) // 2))
+    buffer = io.BytesIO()
+    canvas.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_frames(face_image, resolutions, face_counts, image_dir=None):
+    """
+    Returns:
+        list: (label, image bytes, expected faces or None)
+    """
+    from PIL import Image
+
+    frames = []
+    if face_image:
+        face = Image.open(face_image).convert('RGB')
+        for width, height in resolutions:
+            for faces in face_counts:
+                frames.append((f"{width}x{height}/{faces}f", compose_frame(face, width, height, faces), faces))
+    if image_dir:
+        for name in sorted(os.listdir(image_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(image_dir, name), 'rb') as f:
+                    frames.append((name, f.read(), None))
+    return frames
+
+
+# --- Benchmarks (each runs in its own process) ---
+
+def bench_matcher(matcher_name, size, faces, repeat, seed):
+    from config import EMBEDDING_DIM, MATCH_THRESHOLD
+    from services.gallery import Gallery
+    from services.matchers import IVFMatcher, QuantizedMatcher, create_matcher
+
+    rng = np.random.default_rng(seed)
+    embeddings = random_unit_vectors(rng, size, EMBEDDING_DIM)
+
+    if matcher_name == IVFMatcher.name:
+        # Size the index for the synthetic gallery rather than the configured one
+        matcher = IVFMatcher(n_lists=max(1, min(int(4 * math.sqrt(size)), size // 39)), min_train_size=0)
+    elif matcher_name == QuantizedMatcher.name:
+        matcher = QuantizedMatcher(min_train_size=0)
+    else:
+        matcher = create_matcher(matcher_name)
+
+    started = time.perf_counter()
+    gallery = Gallery(EMBEDDING_DIM, matcher=matcher)
+    if not getattr(matcher, "trained", True):
+        matcher.train(embeddings)
+    gallery.add_many([{"id": i} for i in range(size)], embeddings)
+    build_seconds = time.perf_counter() - started
+
+    # Half the faces per frame are enrolled people, the rest strangers
+    known = (faces + 1) // 2
+    latencies, hits, expected_hits = [], 0, 0
+    for _ in range(repeat * 20):
+        rows = rng.integers(0, size, known)
+        noise = random_unit_vectors(rng, known, EMBEDDING_DIM) * KNOWN_QUERY_DISTANCE
+        queries = np.concatenate([embeddings[rows] + noise,
+                                  random_unit_vectors(rng, faces - known, EMBEDDING_DIM)])
+        started = time.perf_counter()
+        matches = gallery.match(queries, threshold=MATCH_THRESHOLD)
+        latencies.append(time.perf_counter() - started)
+        hits += sum(1 for row, match in zip(rows, matches) if match is not None and match.person["id"] == row)
+        expected_hits += known
+
+    total = sum(latencies)
+    return {
+        "matcher": matcher_name,
+        "gallery_size": size,
+        "faces": faces,
+        "build_seconds": build_seconds,
+        "fps": len(latencies) / total if total else None,
+        "latency": summarize(latencies),
+        "recall": hits / expected_hits if expected_hits else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_detection(frames, repeat):
+    import face_utils
+    from services.metrics import collect_stages
+
+    results = []
+    for label, image_data, expected in frames:
+        # Untimed first run so model loading is not counted
+        face_utils.process_image_with_multiple_faces(image_data)
+        totals, stage_runs, found = [], [], 0
+        for _ in range(repeat):
+            with collect_stages() as stages:
+                started = time.perf_counter()
+                encodings, _, _, _ = face_utils.process_image_with_multiple_faces(image_data)
+                totals.append(time.perf_counter() - started)
+            stage_runs.append(dict(stages))
+            found = len(encodings)
+        total = sum(totals)
+        results.append({
+            "frame": label,
+            "expected_faces": expected,
+            "faces_found": found,
+            "fps": len(totals) / total if total else None,
+            "latency": summarize(totals),
+            "stages": summarize_stages(stage_runs),
+        })
+    return {"frames": results, "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_e2e(frames, repeat, database, gallery_size, face_image, seed):
+    # The SQLite stand-in stores packed embeddings, and repeated frames must not
+    # be answered from the cache; set before config is imported
+    if database == "sqlite":
+        os.environ["EMBEDDING_STORAGE"] = "float32"
+    os.environ.setdefault("EMBEDDING_CACHE_ENTRIES", "0")
+    os.environ.setdefault("FACE_WORKER_PROCESSES", "0")
+
+    import database as db
+    from config import EMBEDDING_DIM
+
+    if database == "sqlite":
+        import face_utils
+        from benchmarks.sqlite_shim import SQLitePool
+
+        db.pool = SQLitePool()
+        rng = np.random.default_rng(seed)
+        db.pool.add_people(
+            [{"full_name": f"Person {i}", "email": f"person{i}@example.com"} for i in range(gallery_size)],
+            random_unit_vectors(rng, gallery_size, EMBEDDING_DIM),
+        )
+        if face_image:
+            # Enroll the portrait the frames are made from, so scans find a match
+            with open(face_image, 'rb') as f:
+                encoding, error = face_utils.process_face_image(f.read())
+            if encoding is not None:
+                db.pool.add_people([{"full_name": "Benchmark Face", "email": "benchmark@example.com"}], [encoding])
+
+    from app import app
+    from services.gallery import gallery
+
+    client = app.test_client()
+    gallery.load()
+
+    def scan(image_data):
+        started = time.perf_counter()
+        response = client.post(
+            '/api/scan',
+            data={'faceImage': (io.BytesIO(image_data), 'frame.jpg')},
+            content_type='multipart/form-data',
+            headers={'X-Trace': '1'},
+        )
+        return response, time.perf_counter() - started
+
+    results = []
+    for label, image_data, expected in frames:
+        scan(image_data)
+        totals, stage_runs, statuses = [], [], {}
+        for _ in range(repeat):
+            response, seconds = scan(image_data)
+            totals.append(seconds)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            stage_runs.append(parse_server_timing(response.headers.get('Server-Timing', '')))
+        total = sum(totals)
+        results.append({
+            "frame": label,
+            "expected_faces": expected,
+            "statuses": {str(code): count for code, count in statuses.items()},
+            "fps": len(totals) / total if total else None,
+            "latency": summarize(totals),
+            "stages": summarize_stages(stage_runs),
+        })
+    return {"database": database, "gallery_size": len(gallery), "frames": results,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def parse_server_timing(header):
+    """{stage: seconds} from a Server-Timing header"""
+    stages = {}
+    for item in filter(None, (part.strip() for part in header.split(','))):
+        name, _, params = item.partition(';')
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'dur':
+                stages[name] = float(value) / 1000
+    return stages
+
+
+# --- Reporting ---
+
+def print_results(results):
+    for row in results.get("matcher", []):
+        latency = row["latency"]
+        print(f"matcher {row['matcher']:>6} n={row['gallery_size']:>8} faces={row['faces']}: "
+              f"{row['fps']:9.1f} fps  p50 {latency['p50_ms']:8.3f} ms  p99 {latency['p99_ms']:8.3f} ms  "
+              f"recall {row['recall']:.3f}  rss {row['peak_rss_mb'] or 0:.0f} MB")
+    for section in ("detection", "e2e"):
+        if section not in results:
+            continue
+        for row in results[section]["frames"]:
+            stages = "  ".join(f"{name} {s['p50_ms']:.1f}" for name, s in row["stages"].items())
+            print(f"{section:>9} {row['frame']:>22}: {row['fps']:7.2f} fps  "
+                  f"p50 {row['latency']['p50_ms']:8.1f} ms  [{stages}]")
+        print(f"{section:>9} peak rss {results[section]['peak_rss_mb'] or 0:.0f} MB")
+
+
+def compare(old, new):
+    """Print the fps change of every case present in both runs"""
+    def cases(results):
+        for row in results.get("matcher", []):
+            yield ("matcher", row["matcher"], row["gallery_size"], row["faces"]), row["fps"]
+        for section in ("detection", "e2e"):
+            for row in results.get(section, {}).get("frames", []):
+                yield (section, row["frame"]), row["fps"]
+
+    previous = dict(cases(old))
+    print("\nChange in fps versus the baseline:")
+    for key, fps in cases(new):
+        if previous.get(key) and fps:
+            change = (fps / previous[key] - 1) * 100
+            print(f"  {' '.join(str(part) for part in key):>40}: {previous[key]:9.2f} -> {fps:9.2f} ({change:+.1f}%)")
+
+
+def parse_sizes(text):
+    return [int(size) for size in text.split(',') if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--benchmarks', default='matcher,detection,e2e')
+    parser.add_argument('--gallery-sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--matchers', default='brute')
+    parser.add_argument('--matcher-faces', default='1,4', help='Faces per frame for the matcher benchmark')
+    parser.add_argument('--face-image', help='Portrait used to compose the test frames')
+    parser.add_argument('--images', help='Directory of extra test photos')
+    parser.add_argument('--resolutions', default='640x480,1280x720,1920x1080,4032x3024')
+    parser.add_argument('--face-counts', default='1,2,4,8')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database', choices=('sqlite', 'postgres'), default='sqlite',
+                        help='Database behind the end-to-end benchmark')
+    parser.add_argument('--e2e-gallery-size', type=int, default=10000,
+                        help='Synthetic people enrolled in the SQLite stand-in')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    benchmarks = set(args.benchmarks.split(','))
+    resolutions = [tuple(int(v) for v in r.split('x')) for r in args.resolutions.split(',') if r]
+    frames = build_frames(args.face_image, resolutions, parse_sizes(args.face_counts), args.images)
+    if benchmarks & {"detection", "e2e"} and not frames:
+        print("Detection and end-to-end benchmarks need --face-image or --images; skipping them.")
+        benchmarks -= {"detection", "e2e"}
+
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "arguments": vars(args),
+    }
+
+    if "matcher" in benchmarks:
+        results["matcher"] = [
+            run_isolated(bench_matcher, matcher_name=name, size=size, faces=faces,
+                         repeat=args.repeat, seed=args.seed)
+            for name in args.matchers.split(',')
+            for size in parse_sizes(args.gallery_sizes)
+            for faces in parse_sizes(args.matcher_faces)
+        ]
+    if "detection" in benchmarks:
+        results["detection"] = run_isolated(bench_detection, frames=frames, repeat=args.repeat)
+    if "e2e" in benchmarks:
+        results["e2e"] = run_isolated(bench_e2e, frames=frames, repeat=args.repeat, database=args.database,
+                                      gallery_size=args.e2e_gallery_size, face_image=args.face_image,
+                                      seed=args.seed)
+
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,174 @@ def get_database_url():
         "dbname": DB_NAME
     }
 
+# Connection pool shared by all request handlers
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))  # Connections opened at startup
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))  # Hard cap on open connections
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))  # Seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))  # Recycle connections after this many seconds
+DB_POOL_CHECK_AFTER = float(os.getenv('DB_POOL_CHECK_AFTER', '30'))  # Ping connections idle longer than this
+
+# --- Authentication ---
+# Key signing login tokens; every web worker must share it, and it is required with
+# AUTH_REQUIRED. When unset a random key is made at startup, so tokens do not
+# survive a restart.
+AUTH_SECRET_KEY = os.getenv('AUTH_SECRET_KEY', '')
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', str(12 * 3600)))  # Seconds a login token stays valid
+# Require a valid token (Authorization: Bearer ...) on the /api/people and /api/scan routes
+AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', 'false').lower() in ('1', 'true', 'yes')
+# Login attempts allowed per client IP and per email within a sliding window, checked before bcrypt
+LOGIN_RATE_WINDOW = float(os.getenv('LOGIN_RATE_WINDOW', '60'))  # Seconds
+LOGIN_RATE_LIMIT_IP = int(os.getenv('LOGIN_RATE_LIMIT_IP', '20'))
+LOGIN_RATE_LIMIT_EMAIL = int(os.getenv('LOGIN_RATE_LIMIT_EMAIL', '5'))
+# Seconds an email with no account is remembered, so repeated attempts skip the database
+AUTH_UNKNOWN_EMAIL_TTL = float(os.getenv('AUTH_UNKNOWN_EMAIL_TTL', '30'))
+
+# --- Face Matching Configuration ---
+EMBEDDING_DIM = 128  # Length of a face_recognition (dlib ResNet) encoding
+MATCH_THRESHOLD = float(os.getenv('MATCH_THRESHOLD', '0.6'))  # Lower distance = better match
+
+# How face_embedding is stored in people_records:
+#   'array'   - DOUBLE PRECISION[] in face_embedding (original layout)
+#   'float32' - packed little-endian float32 bytes in face_embedding_packed (BYTEA)
+#   'float16' - packed float16 bytes, half the size again
+# The packed modes need migrations/001_packed_face_embeddings.sql applied.
+EMBEDDING_STORAGE = os.getenv('EMBEDDING_STORAGE', 'array')
+
+# Seconds between checks for people_records rows written by other processes; 0 disables
+GALLERY_SYNC_INTERVAL = float(os.getenv('GALLERY_SYNC_INTERVAL', '10'))
+# Apply changes pushed by PostgreSQL NOTIFY instead (needs migrations/004_gallery_notify.sql);
+# the gallery generation is compared with the database whenever the channel is quiet this long
+GALLERY_LISTEN = os.getenv('GALLERY_LISTEN', 'true').lower() in ('1', 'true', 'yes')
+GALLERY_LISTEN_CHECK_INTERVAL = float(os.getenv('GALLERY_LISTEN_CHECK_INTERVAL', '30'))
+# Share one gallery between the web workers of a host through memory-mapped files in this
+# directory (ideally on tmpfs, e.g. /dev/shm/frs-gallery); empty = each worker loads its own
+GALLERY_SHARED_DIR = os.getenv('GALLERY_SHARED_DIR', '')
+GALLERY_SHARED_PUBLISH_DELAY = float(os.getenv('GALLERY_SHARED_PUBLISH_DELAY', '0.5'))  # Seconds changes are batched
+GALLERY_SHARED_CHECK_INTERVAL = float(os.getenv('GALLERY_SHARED_CHECK_INTERVAL', '1'))  # Seconds between reader checks
+
+# Gallery search backend: 'brute' (exact), or 'ivf' / 'quantized' (approximate, for very large galleries)
+MATCHER_BACKEND = os.getenv('MATCHER_BACKEND', 'brute')
+IVF_LISTS = int(os.getenv('IVF_LISTS', '1024'))  # Number of k-means clusters
+IVF_PROBE = int(os.getenv('IVF_PROBE', '16'))  # Clusters scanned per query (recall vs latency)
+IVF_MIN_TRAIN_SIZE = int(os.getenv('IVF_MIN_TRAIN_SIZE', '50000'))  # Smaller galleries are searched exactly
+IVF_INDEX_PATH = os.getenv('IVF_INDEX_PATH', '')  # Trained centroids (.npz); empty = train at load
+# Quantized two-stage search (MATCHER_BACKEND=quantized): rows are reduced to QUANT_PCA_DIM
+# principal components (0 = keep all) and stored as compact codes; a query scans the codes
+# and re-ranks the QUANT_RERANK closest rows with exact float distances.
+# Measure the accuracy of a setting with: python -m benchmarks.quantization
+QUANT_PCA_DIM = int(os.getenv('QUANT_PCA_DIM', '64'))
+QUANT_CODE = os.getenv('QUANT_CODE', 'sq8')  # 'float' (PCA only), 'sq8' (1 byte/dimension) or 'pq'
+QUANT_PQ_SUBVECTORS = int(os.getenv('QUANT_PQ_SUBVECTORS', '16'))  # 'pq': bytes per row; must divide the dimensions
+QUANT_RERANK = int(os.getenv('QUANT_RERANK', '100'))  # Shortlist re-ranked exactly per query
+QUANT_MIN_TRAIN_SIZE = int(os.getenv('QUANT_MIN_TRAIN_SIZE', '10000'))  # Smaller galleries are searched exactly
+QUANT_INDEX_PATH = os.getenv('QUANT_INDEX_PATH', '')  # Trained parameters (.npz); empty = train at load
+
+# Face templates (needs migrations/003_face_templates.sql): the gallery matches one
+# centroid per person and compares a candidate's individual templates only when
+# the best centroid distance is within TEMPLATE_EXPAND_MARGIN of the threshold
+TEMPLATE_EXPAND_MARGIN = float(os.getenv('TEMPLATE_EXPAND_MARGIN', '0.1'))  # 0 disables expansion
+# Closest centroids whose templates are compared for such a query, so a runner-up can win
+TEMPLATE_EXPAND_CANDIDATES = int(os.getenv('TEMPLATE_EXPAND_CANDIDATES', '5'))
+TEMPLATE_MAX_PER_PERSON = int(os.getenv('TEMPLATE_MAX_PER_PERSON', '10'))  # Oldest captures are dropped beyond this
+
+# --- Face Detection Configuration ---
+# Uploads are decoded at no more than this many pixels on the longest side
+# (JPEGs use reduced-size decoding, so large phone photos are never fully decoded)
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', '2048'))
+# Uploads are refused before decoding when larger than IMAGE_MAX_BYTES, when their
+# header declares more than IMAGE_MAX_PIXELS pixels, or when PIL does not identify
+# them as one of IMAGE_FORMATS
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(10 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50 * 1000 * 1000)))
+IMAGE_FORMATS = [f.strip().upper() for f in os.getenv('IMAGE_FORMATS', 'JPEG,PNG,WEBP,BMP,GIF,TIFF').split(',') if f.strip()]
+# HOG detection runs on a copy scaled to this longest side; 0 = full resolution
+DETECTION_MAX_SIDE = int(os.getenv('DETECTION_MAX_SIDE', '640'))
+# Encodings are computed on a crop around each face, padded by this fraction
+# of the face size and scaled down to at most ENCODING_CROP_MAX_SIDE pixels
+ENCODING_CROP_PADDING = float(os.getenv('ENCODING_CROP_PADDING', '0.5'))
+ENCODING_CROP_MAX_SIDE = int(os.getenv('ENCODING_CROP_MAX_SIDE', '400'))
+# Detector ('hog' or 'cnn') and how many times the image is upsampled to find small faces
+FACE_DETECTION_MODEL = os.getenv('FACE_DETECTION_MODEL', 'hog')
+FACE_DETECTION_UPSAMPLE = int(os.getenv('FACE_DETECTION_UPSAMPLE', '1'))
+# Landmark model used to align faces ('small' = 5 points, 'large' = 68 points)
+FACE_LANDMARK_MODEL = os.getenv('FACE_LANDMARK_MODEL', 'small')
+# Re-sampled copies averaged per encoding; higher is slightly more accurate but slower
+FACE_ENCODING_JITTERS = int(os.getenv('FACE_ENCODING_JITTERS', '1'))
+
+# --- Scan Quality Gate ---
+# Frames and faces failing these checks are rejected before encoding
+QUALITY_GATE = os.getenv('QUALITY_GATE', 'true').lower() in ('1', 'true', 'yes')
+# Mean frame brightness (0-255) outside this range is too dark / overexposed
+QUALITY_MIN_BRIGHTNESS = float(os.getenv('QUALITY_MIN_BRIGHTNESS', '40'))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv('QUALITY_MAX_BRIGHTNESS', '220'))
+# Laplacian variance of the face, measured on a 64x64 grayscale crop; lower is blurrier
+QUALITY_MIN_SHARPNESS = float(os.getenv('QUALITY_MIN_SHARPNESS', '20'))
+QUALITY_MIN_FACE_SIZE = int(os.getenv('QUALITY_MIN_FACE_SIZE', '40'))  # Uploaded-image pixels, shorter side of the face box
+# Head turn: nose offset from the midpoint of the eyes, relative to the eye distance; 0 disables
+QUALITY_MAX_YAW = float(os.getenv('QUALITY_MAX_YAW', '0.35'))
+
+# --- Web Server (gunicorn -c gunicorn.conf.py wsgi:app) ---
+# Detection and encoding run in the face worker processes, so one web process with
+# enough threads keeps every core busy. Stream sessions and scan jobs live in the
+# web process that created them: with WEB_WORKERS > 1 the load balancer must send
+# each client to the same worker, and the cores are split between the workers.
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+WEB_BIND = os.getenv('WEB_BIND', '0.0.0.0:5000')
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', '60'))  # Seconds a silent worker is given before it is restarted
+WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', '5'))  # Seconds an idle client connection is kept open
+
+# --- Face Worker Processes ---
+# Detection and encoding run in this many preloaded worker processes (per web
+# worker); 0 runs them inline
+FACE_WORKER_PROCESSES = int(os.getenv('FACE_WORKER_PROCESSES', str(max(1, (os.cpu_count() or 1) // WEB_WORKERS))))
+# Jobs allowed to queue or run at once before requests are rejected with 429
+FACE_WORKER_QUEUE_SIZE = int(os.getenv('FACE_WORKER_QUEUE_SIZE', str(2 * max(FACE_WORKER_PROCESSES, 1))))
+# Request threads per web worker: one per face job allowed to queue, plus a few
+# for requests that need no face work (listings, health checks, long polls)
+WEB_THREADS = int(os.getenv('WEB_THREADS', str(FACE_WORKER_QUEUE_SIZE + 4)))
+FACE_WORKER_TIMEOUT = float(os.getenv('FACE_WORKER_TIMEOUT', '15'))  # Seconds per job
+
+# --- Embedding Cache ---
+# Results of face processing are cached by upload content so repeated frames skip dlib
+EMBEDDING_CACHE_ENTRIES = int(os.getenv('EMBEDDING_CACHE_ENTRIES', '512'))  # 0 disables the cache
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', '30'))  # Seconds
+# Perceptual-hash tier: also reuse results for near-identical (not byte-identical) scan frames
+EMBEDDING_CACHE_PHASH = os.getenv('EMBEDDING_CACHE_PHASH', 'false').lower() in ('1', 'true', 'yes')
+EMBEDDING_CACHE_PHASH_DISTANCE = int(os.getenv('EMBEDDING_CACHE_PHASH_DISTANCE', '4'))  # Max differing bits
+
+# --- Streaming Scan / Face Tracking ---
+TRACK_IOU_THRESHOLD = float(os.getenv('TRACK_IOU_THRESHOLD', '0.3'))  # Min overlap to continue a track
+TRACK_MAX_MISSED = int(os.getenv('TRACK_MAX_MISSED', '5'))  # Frames a face may vanish before its track ends
+# A recognized track is re-encoded once its confidence, decayed per frame, drops below the minimum
+TRACK_CONFIDENCE_DECAY = float(os.getenv('TRACK_CONFIDENCE_DECAY', '0.97'))
+TRACK_MIN_CONFIDENCE = float(os.getenv('TRACK_MIN_CONFIDENCE', '0.35'))
+TRACK_UNKNOWN_RETRY_FRAMES = int(os.getenv('TRACK_UNKNOWN_RETRY_FRAMES', '5'))  # Re-encode unknown faces this often
+STREAM_SESSION_TTL = float(os.getenv('STREAM_SESSION_TTL', '60'))  # Idle seconds before a stream session expires
+
+# --- Asynchronous Scan Jobs ---
+# Threads feeding queued scan jobs to the face workers
+SCAN_JOB_THREADS = int(os.getenv('SCAN_JOB_THREADS', str(max(FACE_WORKER_PROCESSES, 1))))
+SCAN_JOB_QUEUE_SIZE = int(os.getenv('SCAN_JOB_QUEUE_SIZE', '100'))  # Unfinished jobs accepted before 429
+SCAN_JOB_RESULT_TTL = float(os.getenv('SCAN_JOB_RESULT_TTL', '300'))  # Seconds a finished job is kept
+SCAN_JOB_MAX_WAIT = float(os.getenv('SCAN_JOB_MAX_WAIT', '30'))  # Longest long-poll a client may request
+
+# --- Scan Event Log / Attendance ---
+# Recognized faces are logged to scan_events (needs migrations/005_scan_events.sql)
+# by a background writer that COPYs a batch when it is full or every interval
+SCAN_EVENTS = os.getenv('SCAN_EVENTS', 'true').lower() in ('1', 'true', 'yes')
+SCAN_EVENT_BATCH_SIZE = int(os.getenv('SCAN_EVENT_BATCH_SIZE', '500'))
+SCAN_EVENT_FLUSH_INTERVAL = float(os.getenv('SCAN_EVENT_FLUSH_INTERVAL', '2'))  # Seconds
+SCAN_EVENT_MAX_BUFFER = int(os.getenv('SCAN_EVENT_MAX_BUFFER', '50000'))  # Oldest events dropped beyond this
+# A person seen again by the same camera within this many seconds is not logged again
+SCAN_EVENT_DEDUP_SECONDS = float(os.getenv('SCAN_EVENT_DEDUP_SECONDS', '60'))
+ATTENDANCE_TIMEZONE = os.getenv('ATTENDANCE_TIMEZONE', 'UTC')  # Attendance days start at midnight here
+ATTENDANCE_MAX_DAYS = int(os.getenv('ATTENDANCE_MAX_DAYS', '92'))  # Longest range one query may span
+
+# --- Bulk Enrollment ---
+ENROLL_BATCH_SIZE = int(os.getenv('ENROLL_BATCH_SIZE', '500'))  # Rows per multi-row INSERT
+ENROLL_MAX_ROWS = int(os.getenv('ENROLL_MAX_ROWS', '10000'))  # Rows accepted per bulk API request
+
 # --- File Upload Configuration ---
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'people_images')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
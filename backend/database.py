@@ -1,18 +1,244 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
-from config import get_database_url
+from config import (
+    get_database_url, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME, DB_POOL_CHECK_AFTER
+)
 import bcrypt
 
 def get_db_connection():
-    """Create a new database connection"""
+    """Create a new database connection (not pooled, for scripts and tools)"""
     params = get_database_url()
     conn = psycopg2.connect(**params)
     return conn
 
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the wait timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to max_size. Idle connections older than
+    max_lifetime are recycled, and connections that sat idle longer than
+    check_after seconds are pinged before being handed out. Borrow with the
+    connection() context manager so the connection always goes back.
+    """
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 check_after=DB_POOL_CHECK_AFTER, connect=get_db_connection):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, returned_at), most recently returned last
+        self._created_at = {}  # id(conn) -> creation time for connections out on loan
+        self._size = 0
+        self._in_use = 0
+        self._stats = {
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "connections_discarded": 0,
+            "acquisitions": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def getconn(self, timeout=None):
+        """Borrow a connection, waiting up to `timeout` seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            stale = None
+            with self._cond:
+                while True:
+                    # Prefer the most recently used idle connection; it is least likely to be stale
+                    while self._idle:
+                        conn, created_at, returned_at = self._idle.pop()
+                        now = time.monotonic()
+                        if conn.closed or now - created_at > self.max_lifetime:
+                            self._close(conn)
+                            self._stats["connections_recycled"] += 1
+                        elif now - returned_at > self.check_after:
+                            # Still counted in _size, so the slot stays reserved while we ping
+                            stale = conn, created_at
+                            break
+                        else:
+                            return self._lend(conn, created_at, started, waited)
+                    if stale:
+                        break
+
+                    if self._size < self.max_size:
+                        # Reserve the slot, then connect without holding the lock
+                        self._size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {timeout:.1f}s "
+                            f"({self.max_size} in use)"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if not stale:
+                break
+            # Idle for a while: make sure the server didn't drop it, without
+            # blocking other borrowers on the round trip
+            conn, created_at = stale
+            alive = self._ping(conn)
+            with self._cond:
+                if alive:
+                    return self._lend(conn, created_at, started, waited)
+                self._close(conn)
+                self._stats["connections_recycled"] += 1
+                self._cond.notify()
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._stats["connections_created"] += 1
+            return self._lend(conn, time.monotonic(), started, waited)
+
+    def putconn(self, conn, discard=False):
+        """Return a borrowed connection. Broken or expired connections are closed."""
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+            self._in_use -= 1
+
+        if not discard and not conn.closed:
+            try:
+                # Never hand the next borrower an open transaction
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        expired = time.monotonic() - created_at > self.max_lifetime
+        with self._cond:
+            if discard or conn.closed or expired:
+                self._close(conn)
+                self._stats["connections_discarded" if discard else "connections_recycled"] += 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+        Uncommitted work is rolled back when the block exits, and connections
+        that failed at the network level are discarded instead of reused.
+        """
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def warm(self):
+        """Open connections up front until the pool holds at least min_size"""
+        conns = []
+        try:
+            while self.stats()["size"] < self.min_size:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def closeall(self):
+        """Close every idle connection (borrowed ones are closed when returned)"""
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+
+    def stats(self):
+        """Snapshot of pool utilisation and wait-time counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "utilisation": self._in_use / self.max_size if self.max_size else 0.0,
+            })
+        return stats
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _lend(self, conn, created_at, started, waited):
+        # Called with the lock held
+        wait = time.monotonic() - started
+        self._in_use += 1
+        self._created_at[id(conn)] = created_at
+        self._stats["acquisitions"] += 1
+        if waited:
+            self._stats["waits"] += 1
+        self._stats["wait_seconds_total"] += wait
+        self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+        return conn
+
+    def _close(self, conn):
+        # Called with the lock held
+        self._size -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+# Shared pool used by all request handlers
+pool = ConnectionPool()
+
+def db_connection(timeout=None):
+    """Borrow a pooled connection: `with db_connection() as conn: ...`"""
+    return pool.connection(timeout)
+
 def hash_password(password):
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
 def check_password(password, hashed_password):
     if isinstance(hashed_password, str):
         hashed_password = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
\ No newline at end of file
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
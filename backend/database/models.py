@@ -1,37 +1,19 @@
 
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-# datetime is not used directly in this simplified version, can be removed if not needed elsewhere
-# from datetime import datetime 
-from dotenv import load_dotenv
+import sys
 
-load_dotenv()  # Load environment variables from .env file
+# This script lives next to database.py's package directory; make the backend
+# modules importable so it shares the same settings and connection pool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# --- Database Connection ---
-
-def get_database_url():
-    """Get database connection parameters from environment variables"""
-    DB_USER = os.getenv('DB_USER', 'postgres')
-    DB_PASSWORD = os.getenv('DB_PASSWORD', 'yourpassword') # Ensure this is set in .env
-    DB_HOST = os.getenv('DB_HOST', 'localhost')
-    DB_PORT = os.getenv('DB_PORT', '5432') # Default PostgreSQL port
-    DB_NAME = os.getenv('DB_NAME', 'frs_db_fyp')
+from config import get_database_url  # noqa: E402  (re-exported for older imports)
+from database import db_connection, pool  # noqa: E402
 
-    return {
-        "user": DB_USER,
-        "password": DB_PASSWORD,
-        "host": DB_HOST,
-        "port": DB_PORT,
-        "dbname": DB_NAME
-    }
+# --- Database Connection ---
 
-def get_db_connection():
-    """Create a new database connection"""
-    params = get_database_url()
-    conn = psycopg2.connect(**params)
-    # conn.autocommit = False # You can manage transactions explicitly in your route handlers
-    return conn
+# A new, unpooled connection that callers close themselves, as before;
+# request handlers borrow from the pool with db_connection() instead
+from database import get_db_connection  # noqa: E402,F401
 
 # --- Schema Creation ---
 # Removed create_database_tables function as tables are already created.
@@ -40,10 +22,10 @@ def get_db_connection():
 if __name__ == "__main__":
     # This block can be used to test the connection if needed
     try:
-        conn = get_db_connection()
-        print("Successfully connected to the database.")
-        conn.close()
+        with db_connection():
+            print("Successfully connected to the database.")
+        print(f"Pool stats: {pool.stats()}")
     except Exception as e:
         print(f"Failed to connect to the database: {e}")
-        db_name_env = os.getenv('DB_NAME', 'frs_db')
+        db_name_env = get_database_url()["dbname"]
         print(f"Please ensure your PostgreSQL server is running, the database '{db_name_env}' exists, and connection details are correct.")
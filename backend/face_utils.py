@@ -1,46 +1,101 @@
-import face_recognition
 import numpy as np
-from io import BytesIO
-from PIL import Image
+from config import (
+    IMAGE_MAX_SIDE, DETECTION_MAX_SIDE, ENCODING_CROP_PADDING, ENCODING_CROP_MAX_SIDE
+)
+from services.face_engine import face_engine
+from services.image_ingest import decode_image
+from services.metrics import stage
+from services.quality import REASONS, check_frame, check_faces
+
+@stage("decode")
+def load_image(image_data, max_side=IMAGE_MAX_SIDE):
+    """
+    Decode raw image bytes to an RGB array no larger than max_side
+
+    See services.image_ingest.decode_image(). The array is reused by the
+    next decode on this thread, so tasks must not keep it past their return.
+
+    Args:
+        image_data (bytes): The raw image data
+        max_side (int): Longest side of the returned image, 0 for no limit
+
+    Returns:
+        tuple: (image, scale) where original coordinates = image coordinates * scale
+    """
+    return decode_image(image_data, max_side)
+
+@stage("detect")
+def detect_faces(image, max_side=DETECTION_MAX_SIDE):
+    """
+    Find face boxes on a downscaled copy of the image
+
+    Args:
+        image (np.ndarray): RGB image
+        max_side (int): Longest side used for detection, 0 for full resolution
+
+    Returns:
+        list: (top, right, bottom, left) boxes in the coordinates of `image`
+    """
+    return face_engine.detect(image, max_side)
+
+@stage("encode")
+def encode_faces(image, face_locations, padding=ENCODING_CROP_PADDING, crop_max_side=ENCODING_CROP_MAX_SIDE,
+                 aligned=None):
+    """
+    Compute a 128-d encoding for each face from a bounded crop around it
+
+    All faces are encoded in one batched call; see FaceEngine.encode_many().
+    Faces already aligned by the quality gate reuse those landmarks.
+
+    Returns:
+        list: One encoding (np.ndarray) per location
+    """
+    return face_engine.encode(image, face_locations, padding, crop_max_side, aligned)
+
+def scale_locations(face_locations, scale):
+    """Scale boxes from the decoded image back to the uploaded image's coordinates"""
+    if scale == 1.0:
+        return list(face_locations)
+    return [tuple(int(round(v * scale)) for v in location) for location in face_locations]
 
 def process_face_image(image_data):
     """
     Process an image to extract a single primary face encoding
     Used for enrollment where we expect one clear face
-    
+
     Args:
         image_data (bytes): The raw image data
-        
+
     Returns:
         tuple: (face_encoding, error_message)
     """
     try:
         # Load image from binary data
-        image = np.array(Image.open(BytesIO(image_data)))
-        
+        image, _ = load_image(image_data)
+
         # Find all face locations in the image
-        face_locations = face_recognition.face_locations(image, model="hog")
-        
+        face_locations = detect_faces(image)
+
         if not face_locations:
             return None, "No face detected in the image"
-        
+
         if len(face_locations) > 1:
             # For enrollment, we expect one clear face
             # You may choose to accept the largest face instead
             return None, "Multiple faces detected. Please provide an image with only one face."
-        
+
         # Get face encoding for the detected face
-        face_encodings = face_recognition.face_encodings(image, face_locations)
-        
+        face_encodings = encode_faces(image, face_locations)
+
         if not face_encodings:
             return None, "Could not extract face features. Please try with a clearer image."
-        
+
         # Check if encoding is already a list or needs conversion
         if isinstance(face_encodings[0], np.ndarray):
             return face_encodings[0].tolist(), None
         else:
             return face_encodings[0], None
-        
+
     except Exception as e:
         return None, f"Error processing image: {str(e)}"
 
@@ -48,30 +103,50 @@ def process_image_with_multiple_faces(image_data):
     """
     Process an image to detect and extract multiple face encodings
     Used for recognition where we may have multiple people
-    
+
+    Frames and faces that fail the quality gate (services.quality) are
+    rejected before the encoder runs.
+
     Args:
         image_data (bytes): The raw image data
-        
+
     Returns:
-        tuple: (face_encodings, face_locations, error_message)
+        tuple: (face_encodings, face_locations, error_message, quality)
+               face_locations are in the uploaded image's coordinates, for the
+               encoded faces only; quality is {"frame": reason or None,
+               "faces": [(location, reason or None) for every detected face]}
     """
+    quality = {"frame": None, "faces": []}
     try:
         # Load image from binary data
-        image = np.array(Image.open(BytesIO(image_data)))
-        
+        image, scale = load_image(image_data)
+
+        # Skip detection entirely for frames that are too dark or overexposed
+        quality["frame"] = check_frame(image)
+        if quality["frame"]:
+            return [], [], REASONS[quality["frame"]], quality
+
         # Find all face locations in the image
-        face_locations = face_recognition.face_locations(image, model="hog")
-        
+        face_locations = detect_faces(image)
+
         if not face_locations:
-            return [], [], "No faces detected in the image"
-        
+            return [], [], "No faces detected in the image", quality
+
+        # Only faces that pass the size, sharpness and pose checks are encoded
+        reasons, aligned = check_faces(image, face_locations, scale)
+        quality["faces"] = list(zip(scale_locations(face_locations, scale), reasons))
+        passed = [i for i, reason in enumerate(reasons) if reason is None]
+        face_locations = [face_locations[i] for i in passed]
+        if not face_locations:
+            return [], [], REASONS[next(filter(None, reasons))], quality
+
         # Get face encodings for the detected faces
-        face_encodings = face_recognition.face_encodings(image, face_locations)
-        
+        face_encodings = encode_faces(image, face_locations, aligned=[aligned[i] for i in passed])
+
         if not face_encodings:
-            return [], [], "Could not extract face features. Please try with a clearer image."
-        
-        return face_encodings, face_locations, None
-        
+            return [], [], "Could not extract face features. Please try with a clearer image.", quality
+
+        return face_encodings, scale_locations(face_locations, scale), None, quality
+
     except Exception as e:
-        return [], [], f"Error processing image: {str(e)}"
\ No newline at end of file
+        return [], [], f"Error processing image: {str(e)}", quality
@@ -0,0 +1,29 @@
+"""
+Gunicorn settings, sized from the WEB_* values in config.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Threaded workers, because a request spends most of its time waiting on a
+face worker process or the database. Every worker imports the app itself
+after the fork (no preload): app.warm_up() opens pooled connections and
+starts threads and face worker processes that must not be shared with the
+master process.
+"""
+from config import WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT, WEB_KEEPALIVE
+
+bind = WEB_BIND
+workers = WEB_WORKERS
+worker_class = "gthread"
+threads = WEB_THREADS
+timeout = WEB_TIMEOUT
+keepalive = WEB_KEEPALIVE
+preload_app = False
+
+
+def worker_exit(server, worker):
+    # Write the buffered scan events and stop the face workers before the process goes
+    from services.scan_events import scan_events
+    from services.workers import face_workers
+
+    scan_events.flush()
+    face_workers.shutdown()
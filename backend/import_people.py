@@ -0,0 +1,137 @@
+"""
+Offline bulk importer for people_records.
+
+Reads a CSV manifest (an `image` column plus person fields such as
+full_name, department, email...) and a directory or zip of images, encodes
+the faces in parallel worker processes and inserts them in batches.
+
+Progress is written to a state file after every committed batch, so an
+interrupted import picks up where it left off when run again. Rows whose
+email is already enrolled, or repeats an earlier row's email, are skipped as
+well. Rows that failed (bad age, no face, unreadable image, worker
+timeout...) are tried again on the next run unless --skip-failed is given.
+
+Usage:
+    python import_people.py <images_dir_or_zip> <manifest.csv>
+        [--workers N] [--batch-size N] [--state FILE] [--report FILE] [--skip-failed]
+
+Running web servers pick up the new people without a restart: at once
+through the gallery NOTIFY listener (migrations/004_gallery_notify.sql), or
+otherwise on their next gallery sync (GALLERY_SYNC_INTERVAL).
+"""
+import argparse
+import json
+import os
+import sys
+
+from config import ENROLL_BATCH_SIZE
+from database import db_connection
+from services.enrollment import (
+    read_manifest, split_repeated_emails, ImageSource, encode_rows, existing_emails, insert_people,
+    worker_encoder, failure
+)
+from services.workers import FaceWorkerPool
+
+
+def load_state(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"done": [], "failed": []}
+
+
+def save_state(path, state):
+    # Write then rename so a crash never leaves a truncated state file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', help='Directory or .zip containing the images')
+    parser.add_argument('manifest', help='CSV with an image column and person fields')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoding processes')
+    parser.add_argument('--batch-size', type=int, default=ENROLL_BATCH_SIZE)
+    parser.add_argument('--state', help='Progress file (default: <manifest>.progress.json)')
+    parser.add_argument('--report', help='Write the per-row failure report to this JSON file')
+    parser.add_argument('--skip-failed', action='store_true', help='Do not retry rows that failed in earlier runs')
+    args = parser.parse_args()
+
+    state_path = args.state or args.manifest + ".progress.json"
+    state = load_state(state_path)
+    done = set(state["done"])
+    if args.skip_failed:
+        done.update(item["row"] for item in state["failed"])
+    else:
+        # Failed rows are tried again; their old failures are replaced by this run's
+        retry = {item["row"] for item in state["failed"]}
+        done -= retry
+        state["done"] = [row for row in state["done"] if row not in retry]
+        state["failed"] = []
+
+    with open(args.manifest, encoding='utf-8-sig') as f:
+        rows, invalid = read_manifest(f.read())
+    total = len(rows) + len(invalid)
+    rows, repeated = split_repeated_emails(rows)
+
+    # Invalid rows fail without being encoded; fixing the manifest makes them retryable
+    invalid = [item for item in invalid if item["row"] not in done]
+    if invalid:
+        state["failed"].extend(invalid)
+        save_state(state_path, state)
+
+    with db_connection() as conn:
+        already = existing_emails(conn, [row["email"] for row in rows])
+
+    pending = [
+        row for row in rows
+        if row["row"] not in done and not (row["email"] and row["email"] in already)
+    ]
+    print(f"{total} rows in manifest, {total - len(pending)} invalid, repeated, already imported or enrolled, "
+          f"{len(pending)} to go")
+
+    images = ImageSource(args.images)
+    workers = FaceWorkerPool(processes=args.workers, max_pending=args.workers).start()
+    encode = worker_encoder(workers)
+    enrolled = 0
+    try:
+        for start in range(0, len(pending), args.batch_size):
+            chunk = pending[start:start + args.batch_size]
+            encoded, failures = encode_rows(chunk, images, encode, args.workers)
+
+            with db_connection() as conn:
+                inserted = insert_people(conn, encoded, batch_size=args.batch_size)
+
+            enrolled += len(inserted)
+            # Only rows that were inserted count as done; failed ones stay retryable
+            failed_rows = {item["row"] for item in failures}
+            state["done"].extend(row["row"] for row in chunk if row["row"] not in failed_rows)
+            state["failed"].extend(failures)
+            save_state(state_path, state)
+            print(f"  {start + len(chunk)}/{len(pending)} processed, "
+                  f"{enrolled} enrolled, {len(state['failed'])} failed")
+    finally:
+        workers.shutdown()
+        images.close()
+
+    if state["failed"]:
+        print(f"\n{len(state['failed'])} rows failed:")
+        for item in state["failed"][:20]:
+            print(f"  row {item['row']} ({item['image']}): {item['error']}")
+        if len(state["failed"]) > 20:
+            print(f"  ... and {len(state['failed']) - 20} more")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({
+                "enrolled": enrolled,
+                "skipped": [failure(row, "Email already enrolled") for row in rows
+                            if row["email"] and row["email"] in already]
+                           + [failure(row, "Email repeats an earlier row of the manifest") for row in repeated],
+                "failed": state["failed"]
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+-- Packed face embedding storage (see EMBEDDING_STORAGE in config.py)
+--
+-- Adds a BYTEA column holding the 128-d encoding as little-endian float32
+-- (512 bytes) or float16 (256 bytes) and relaxes face_embedding so new rows
+-- can be written packed only. Existing rows are converted by:
+--   python -m services.embedding_codec migrate [float32|float16] [--drop-arrays]
+
+ALTER TABLE public.people_records
+  ADD COLUMN IF NOT EXISTS face_embedding_packed BYTEA;
+
+ALTER TABLE public.people_records
+  ALTER COLUMN face_embedding DROP NOT NULL;
+
+ALTER TABLE public.people_records
+  DROP CONSTRAINT IF EXISTS people_records_face_embedding_present;
+
+ALTER TABLE public.people_records
+  ADD CONSTRAINT people_records_face_embedding_present
+  CHECK (face_embedding IS NOT NULL OR face_embedding_packed IS NOT NULL);
@@ -0,0 +1,28 @@
+-- Listing support for GET /api/people
+--
+-- * An index matching the (full_name, id) keyset used for pagination
+-- * A single-row change counter bumped by every write to people_records,
+--   used to build ETags so unchanged lists can be answered with 304
+
+CREATE INDEX IF NOT EXISTS people_records_full_name_id_idx
+  ON public.people_records (full_name, id);
+
+CREATE TABLE IF NOT EXISTS public.people_records_version (
+  id       INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  version  BIGINT  NOT NULL DEFAULT 0
+);
+
+INSERT INTO public.people_records_version (id, version) VALUES (1, 0)
+  ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION public.bump_people_records_version() RETURNS trigger AS $$
+BEGIN
+  UPDATE public.people_records_version SET version = version + 1 WHERE id = 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_records_version_bump ON public.people_records;
+CREATE TRIGGER people_records_version_bump
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.people_records
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_people_records_version();
@@ -0,0 +1,42 @@
+-- Multi-embedding face templates (see services/templates.py)
+--
+-- * face_templates holds every embedding captured for a person over time,
+--   starting with the enrollment photo; the embedding columns mirror
+--   people_records (see EMBEDDING_STORAGE in config.py)
+-- * people_records.face_embedding(_packed) becomes the centroid of the
+--   person's templates, rewritten whenever a template is added
+-- * A trigger seeds the enrollment template for every new person, so the
+--   single-insert, bulk and importer paths need no changes
+-- * Existing people are backfilled with their current embedding
+
+CREATE TABLE IF NOT EXISTS public.face_templates (
+  id             SERIAL PRIMARY KEY,
+  person_id      INTEGER     NOT NULL REFERENCES public.people_records(id) ON DELETE CASCADE,
+  face_embedding DOUBLE PRECISION[],
+  face_embedding_packed BYTEA,
+  source         VARCHAR(32) NOT NULL DEFAULT 'enrollment',
+  created_at     TIMESTAMP   NOT NULL DEFAULT now(),
+  CONSTRAINT face_templates_face_embedding_present
+    CHECK (face_embedding IS NOT NULL OR face_embedding_packed IS NOT NULL)
+);
+
+CREATE INDEX IF NOT EXISTS face_templates_person_id_idx
+  ON public.face_templates (person_id, id);
+
+CREATE OR REPLACE FUNCTION public.seed_face_template() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO public.face_templates (person_id, face_embedding, face_embedding_packed, source)
+    VALUES (NEW.id, NEW.face_embedding, NEW.face_embedding_packed, 'enrollment');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_records_seed_template ON public.people_records;
+CREATE TRIGGER people_records_seed_template
+  AFTER INSERT ON public.people_records
+  FOR EACH ROW EXECUTE FUNCTION public.seed_face_template();
+
+INSERT INTO public.face_templates (person_id, face_embedding, face_embedding_packed, source, created_at)
+  SELECT p.id, p.face_embedding, p.face_embedding_packed, 'enrollment', p.created_at
+  FROM public.people_records p
+  WHERE NOT EXISTS (SELECT 1 FROM public.face_templates t WHERE t.person_id = p.id);
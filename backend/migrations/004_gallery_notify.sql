@@ -0,0 +1,66 @@
+-- Cross-process gallery sync (see services/gallery_listener.py)
+--
+-- Every statement that changes people_records bumps people_records_version
+-- (now the gallery "generation") once and sends a NOTIFY on the
+-- people_records_changed channel with the changed ids:
+--   {"op": "insert", "generation": 42, "ids": [7, 8]}
+-- Listeners refetch those ids and use the generation to spot missed events.
+-- "ids" is null when the list would not fit in a NOTIFY payload (and for
+-- TRUNCATE), which tells listeners to reload everything.
+--
+-- Replaces the per-statement version bump from 002_people_listing.sql, so
+-- the version still changes exactly once per writing statement.
+
+CREATE OR REPLACE FUNCTION public.notify_people_records_changed() RETURNS trigger AS $$
+DECLARE
+  changed_ids INTEGER[];
+  new_generation BIGINT;
+  payload TEXT;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    SELECT array_agg(id ORDER BY id) INTO changed_ids FROM old_rows;
+  ELSIF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT array_agg(id ORDER BY id) INTO changed_ids FROM new_rows;
+  END IF;
+  -- Statements that touched no rows change nothing
+  IF TG_OP <> 'TRUNCATE' AND changed_ids IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  UPDATE public.people_records_version SET version = version + 1 WHERE id = 1
+    RETURNING version INTO new_generation;
+
+  payload := json_build_object('op', lower(TG_OP), 'generation', new_generation, 'ids', changed_ids)::text;
+  -- NOTIFY payloads are limited to 8000 bytes
+  IF octet_length(payload) > 7900 THEN
+    payload := json_build_object('op', lower(TG_OP), 'generation', new_generation, 'ids', NULL)::text;
+  END IF;
+  PERFORM pg_notify('people_records_changed', payload);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_records_version_bump ON public.people_records;
+
+DROP TRIGGER IF EXISTS people_records_notify_insert ON public.people_records;
+CREATE TRIGGER people_records_notify_insert
+  AFTER INSERT ON public.people_records
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+DROP TRIGGER IF EXISTS people_records_notify_update ON public.people_records;
+CREATE TRIGGER people_records_notify_update
+  AFTER UPDATE ON public.people_records
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+DROP TRIGGER IF EXISTS people_records_notify_delete ON public.people_records;
+CREATE TRIGGER people_records_notify_delete
+  AFTER DELETE ON public.people_records
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+DROP TRIGGER IF EXISTS people_records_notify_truncate ON public.people_records;
+CREATE TRIGGER people_records_notify_truncate
+  AFTER TRUNCATE ON public.people_records
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
@@ -0,0 +1,45 @@
+-- Scan event log and attendance rollups (see services/scan_events.py)
+--
+-- * scan_events holds one row per recognized sighting, range-partitioned by
+--   UTC day so old days can be dropped whole. Partitions are created on
+--   demand by ensure_scan_events_partition() before each batch is copied in.
+-- * attendance_daily is maintained by the same writer, in the same
+--   transaction, so attendance queries never scan the event log.
+-- * person_id is not a foreign key: the audit trail outlives deleted people.
+
+CREATE TABLE IF NOT EXISTS public.scan_events (
+  seen_at    TIMESTAMPTZ  NOT NULL,
+  person_id  INTEGER      NOT NULL,
+  camera_id  VARCHAR(64)  NOT NULL DEFAULT '',
+  endpoint   VARCHAR(16)  NOT NULL,
+  distance   REAL
+) PARTITION BY RANGE (seen_at);
+
+CREATE INDEX IF NOT EXISTS scan_events_person_id_seen_at_idx
+  ON public.scan_events (person_id, seen_at);
+
+CREATE OR REPLACE FUNCTION public.ensure_scan_events_partition(day DATE) RETURNS void AS $$
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.scan_events FOR VALUES FROM (%L) TO (%L)',
+    'scan_events_' || to_char(day, 'YYYYMMDD'),
+    day::timestamp AT TIME ZONE 'UTC',
+    (day + 1)::timestamp AT TIME ZONE 'UTC'
+  );
+EXCEPTION WHEN duplicate_table THEN
+  -- Another web worker created it first
+  NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS public.attendance_daily (
+  person_id   INTEGER      NOT NULL,
+  day         DATE         NOT NULL,
+  first_seen  TIMESTAMPTZ  NOT NULL,
+  last_seen   TIMESTAMPTZ  NOT NULL,
+  sightings   INTEGER      NOT NULL,
+  PRIMARY KEY (day, person_id)
+);
+
+CREATE INDEX IF NOT EXISTS attendance_daily_person_id_day_idx
+  ON public.attendance_daily (person_id, day);
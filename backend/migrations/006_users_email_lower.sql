@@ -0,0 +1,19 @@
+-- Case-insensitive user emails (see _email_key in auth.py)
+--
+-- * Signup now stores emails lowercased and login looks them up by plain
+--   equality on the users.email unique index; existing rows are lowercased
+--   to match.
+-- * A unique index on lower(email) keeps two accounts from differing only
+--   in case. If it fails to build, such accounts already exist (they are
+--   left untouched by the UPDATE below) and must be merged by hand first.
+
+UPDATE public.users u
+   SET email = lower(u.email)
+ WHERE u.email <> lower(u.email)
+   AND NOT EXISTS (
+     SELECT 1 FROM public.users o
+      WHERE o.id <> u.id AND lower(o.email) = lower(u.email)
+   );
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_lower_idx
+  ON public.users (lower(email));
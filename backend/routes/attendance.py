@@ -0,0 +1,71 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import Blueprint, request, jsonify, current_app
+from psycopg2.extras import RealDictCursor
+from config import ATTENDANCE_TIMEZONE, ATTENDANCE_MAX_DAYS
+from database import db_connection
+from services.metrics import stage
+
+attendance_bp = Blueprint('attendance', __name__)
+
+@attendance_bp.route('/api/attendance', methods=['GET'])
+def get_attendance():
+    """
+    Who was seen on which days, from the attendance_daily rollups.
+
+    Query parameters (all optional):
+        from, to    Inclusive YYYY-MM-DD range; both default to today
+        person_id   Only this person
+        department  Exact (case-insensitive) department filter
+    """
+    today = datetime.now(ZoneInfo(ATTENDANCE_TIMEZONE)).date()
+    try:
+        start = date.fromisoformat(request.args['from']) if 'from' in request.args else today
+        end = date.fromisoformat(request.args['to']) if 'to' in request.args else start
+        person_id = int(request.args['person_id']) if 'person_id' in request.args else None
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD dates and person_id an integer"}), 400
+    if end < start:
+        return jsonify({"error": "to must not be before from"}), 400
+    if end - start >= timedelta(days=ATTENDANCE_MAX_DAYS):
+        return jsonify({"error": f"A query may span at most {ATTENDANCE_MAX_DAYS} days"}), 400
+
+    conditions, params = ["a.day BETWEEN %s AND %s"], [start, end]
+    if person_id is not None:
+        conditions.append("a.person_id = %s")
+        params.append(person_id)
+    if request.args.get('department'):
+        conditions.append("lower(p.department) = lower(%s)")
+        params.append(request.args['department'])
+
+    try:
+        with stage("db_fetch"), db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # People deleted since keep their attendance, without a name
+            cur.execute(
+                "SELECT a.day, a.person_id, p.full_name, p.department, a.first_seen, a.last_seen, a.sightings "
+                "FROM attendance_daily a LEFT JOIN people_records p ON p.id = a.person_id "
+                f"WHERE {' AND '.join(conditions)} "
+                "ORDER BY a.day, p.full_name, a.person_id",
+                params
+            )
+            rows = cur.fetchall()
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving attendance: {e}")
+        return jsonify({"error": f"Failed to retrieve attendance: {str(e)}"}), 500
+
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "attendance": [
+            {
+                "day": row["day"].isoformat(),
+                "person_id": row["person_id"],
+                "full_name": row["full_name"] or "",
+                "department": row["department"] or "",
+                "first_seen": row["first_seen"].isoformat(),
+                "last_seen": row["last_seen"].isoformat(),
+                "sightings": row["sightings"]
+            }
+            for row in rows
+        ]
+    }), 200
@@ -0,0 +1,64 @@
+from flask import Blueprint, Response, jsonify
+from database import pool
+from services.embedding_cache import embedding_cache
+from services.gallery import gallery
+from services.metrics import registry
+from services.scan_events import scan_events
+from services.workers import face_workers
+
+health_bp = Blueprint('health', __name__)
+
+# Gauges read from the components' own stats at scrape time
+registry.gauge("frs_gallery_size", "Enrolled embeddings in the in-memory gallery", lambda: len(gallery))
+registry.gauge("frs_gallery_generation", "people_records change counter the gallery reflects",
+               lambda: gallery.generation or 0)
+registry.gauge("frs_db_pool_connections", "Pooled database connections by state", lambda: {
+    (("state", "in_use"),): pool.stats()["in_use"],
+    (("state", "idle"),): pool.stats()["idle"],
+})
+registry.gauge("frs_db_pool_max_size", "Maximum pooled database connections",
+               lambda: pool.stats()["max_size"])
+registry.gauge("frs_db_pool_waits_total", "Connection checkouts that had to wait",
+               lambda: pool.stats()["waits"], kind="counter")
+registry.gauge("frs_db_pool_timeouts_total", "Connection checkouts that timed out",
+               lambda: pool.stats()["timeouts"], kind="counter")
+registry.gauge("frs_db_pool_wait_seconds_total", "Time spent waiting for a pooled connection",
+               lambda: pool.stats()["wait_seconds_total"], kind="counter")
+registry.gauge("frs_face_workers_processes", "Face worker processes (0 = inline)",
+               lambda: face_workers.stats()["processes"])
+registry.gauge("frs_face_workers_pending", "Face jobs queued or running",
+               lambda: face_workers.stats()["pending"])
+registry.gauge("frs_face_workers_max_pending", "Face jobs allowed before requests are shed",
+               lambda: face_workers.stats()["max_pending"])
+registry.gauge("frs_embedding_cache_entries", "Cached face processing results",
+               lambda: embedding_cache.stats()["entries"])
+registry.gauge("frs_embedding_cache_bytes", "Approximate memory held by the embedding cache",
+               lambda: embedding_cache.stats()["bytes"])
+registry.gauge("frs_embedding_cache_lookups_total", "Embedding cache lookups by result", lambda: {
+    (("result", result),): embedding_cache.stats()[key]
+    for result, key in (("hit", "hits"), ("phash_hit", "phash_hits"), ("miss", "misses"))
+}, kind="counter")
+registry.gauge("frs_embedding_cache_evictions_total", "Entries evicted from the embedding cache",
+               lambda: embedding_cache.stats()["evictions"], kind="counter")
+registry.gauge("frs_scan_events_total", "Recognized faces offered to the scan log by outcome", lambda: {
+    (("outcome", outcome),): scan_events.stats()[outcome]
+    for outcome in ("recorded", "deduplicated", "dropped", "written")
+}, kind="counter")
+registry.gauge("frs_scan_events_buffered", "Scan events waiting to be written",
+               lambda: scan_events.stats()["buffered"])
+
+@health_bp.route('/api/health', methods=['GET'])
+def health():
+    """Liveness check plus database pool, face worker, cache and scan log utilisation"""
+    return jsonify({
+        "status": "ok",
+        "db_pool": pool.stats(),
+        "face_workers": face_workers.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "scan_events": scan_events.stats()
+    }), 200
+
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """All metrics in the Prometheus text exposition format"""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
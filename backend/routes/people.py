@@ -1,45 +1,167 @@
-from flask import Blueprint, request, jsonify, current_app
-from database import get_db_connection
-from face_utils import process_face_image
+from flask import Blueprint, Response, request, jsonify, current_app
+from config import ENROLL_MAX_ROWS
+from database import db_connection, pool
+from services.embedding_cache import run_cached
+from services.embedding_codec import embedding_column
+from services.enrollment import (
+    read_manifest, split_repeated_emails, ImageSource, encode_rows, existing_emails, insert_people,
+    worker_encoder, failure
+)
+from services.gallery import gallery, read_generation
+from services.image_ingest import read_upload, ImageRejected
+from services.metrics import stage
+from services.workers import face_workers, PoolSaturated, JobTimeout
+import base64
+import hashlib
 import json
-import psycopg2.extras
+import zipfile
 from psycopg2.extras import RealDictCursor
 
 people_bp = Blueprint('people', __name__)
 
-# Add this new GET route to retrieve people data
+# Columns GET /api/people may return, in response order
+LISTING_FIELDS = (
+    "id", "full_name", "department", "email", "phone_number",
+    "age", "home_address", "occupation", "education",
+    "interests", "hobbies", "bio", "created_at"
+)
+# Rows fetched from the server-side cursor per round trip while streaming
+STREAM_FETCH_SIZE = 500
+
+def _encode_cursor(person):
+    """Opaque keyset cursor pointing just after this row"""
+    raw = json.dumps([person["full_name"], person["id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    full_name, person_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    return str(full_name), int(person_id)
+
+def _json_default(value):
+    # Timestamps are the only non-JSON-native values in people_records
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
 @people_bp.route('/api/people', methods=['GET'])
 def get_people():
+    """
+    List enrolled people as a JSON array, streamed row by row.
+
+    Query parameters (all optional):
+        fields      Comma-separated columns to return (id is always included)
+        q           Case-insensitive substring match on full_name
+        department  Exact (case-insensitive) department filter
+        limit       Page size; without it every matching row is returned
+        cursor      Value of X-Next-Cursor from the previous page
+
+    Responses carry an ETag derived from the people_records change counter,
+    so a repeated request with If-None-Match gets 304 until the table changes.
+    """
+    fields = request.args.get('fields')
+    if fields:
+        requested = {field.strip() for field in fields.split(',') if field.strip()}
+        unknown = requested - set(LISTING_FIELDS)
+        if unknown:
+            return jsonify({"error": f"Unknown field(s): {', '.join(sorted(unknown))}"}), 400
+        selected = [field for field in LISTING_FIELDS if field in requested or field == "id"]
+    else:
+        selected = list(LISTING_FIELDS)
+
     try:
-        # Connect to database
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get all people records
-        cursor.execute("""
-            SELECT id, full_name, department, email, phone_number, 
-                   age, home_address, occupation, education, 
-                   interests, hobbies, bio, created_at
-            FROM people_records
-            ORDER BY full_name
-        """)
-        
-        people = cursor.fetchall()
-        
-        # Convert any datetime objects to strings for JSON serialization
-        for person in people:
-            if person.get('created_at'):
-                person['created_at'] = person['created_at'].isoformat()
-        
-        return jsonify(people), 200
-        
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        after = _decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    conditions, params = [], []
+    if request.args.get('q'):
+        conditions.append("full_name ILIKE %s")
+        params.append('%' + request.args['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if request.args.get('department'):
+        conditions.append("lower(department) = lower(%s)")
+        params.append(request.args['department'])
+    if after is not None:
+        # Keyset pagination: continue strictly after the last row of the previous page
+        conditions.append("(full_name, id) > (%s, %s)")
+        params.extend(after)
+
+    # full_name is needed to build the next cursor even when not requested
+    columns = selected if "full_name" in selected else selected + ["full_name"]
+    query = f"SELECT {', '.join(columns)} FROM people_records"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY full_name, id"
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
+    try:
+        version = read_generation()
     except Exception as e:
         current_app.logger.error(f"Error retrieving people records: {e}")
         return jsonify({"error": f"Failed to retrieve people: {str(e)}"}), 500
-    finally:
-        if 'conn' in locals() and conn:
+
+    headers = {"Cache-Control": "no-cache"}
+    if version is not None:
+        digest = hashlib.blake2b(request.query_string, digest_size=8).hexdigest()
+        etag = f'W/"people-{version}-{digest}"'
+        headers["ETag"] = etag
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+
+    try:
+        if limit is not None:
+            # A bounded page: fetch it whole so the next cursor can go in a header
+            with stage("db_fetch"), db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, params)
+                people = cursor.fetchall()
+            if len(people) > limit:
+                people = people[:limit]
+                headers["X-Next-Cursor"] = _encode_cursor(people[-1])
+            body = json.dumps(
+                [{field: person[field] for field in selected} for person in people],
+                default=_json_default
+            )
+            return Response(body, status=200, mimetype='application/json', headers=headers)
+
+        # Everything: stream from a server-side cursor so neither the driver nor
+        # this process ever holds the whole table in memory. The connection stays
+        # borrowed until the response is closed.
+        conn = pool.getconn()
+        try:
+            cursor = conn.cursor(name='people_listing', cursor_factory=RealDictCursor)
+            cursor.itersize = STREAM_FETCH_SIZE
+            cursor.execute(query, params)
+        except Exception:
+            pool.putconn(conn)
+            raise
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving people records: {e}")
+        return jsonify({"error": f"Failed to retrieve people: {str(e)}"}), 500
+
+    def generate():
+        yield '['
+        for i, person in enumerate(cursor):
+            if i:
+                yield ','
+            yield json.dumps({field: person[field] for field in selected}, default=_json_default)
+        yield ']'
+
+    def release():
+        try:
             cursor.close()
-            conn.close()
+        except Exception:
+            pass
+        pool.putconn(conn)
+
+    response = Response(generate(), status=200, mimetype='application/json', headers=headers)
+    response.call_on_close(release)
+    return response
 
 # Your existing POST route for adding people
 @people_bp.route('/api/people', methods=['POST'])
@@ -78,8 +200,8 @@ def add_person():
     
     try:
         # Process the image to extract face encoding
-        image_data = file.read()
-        face_encoding, error = process_face_image(image_data)
+        image_data = read_upload(file)
+        face_encoding, error = run_cached("process_face_image", image_data)
         
         if error:
             return jsonify({"error": error}), 400
@@ -87,55 +209,165 @@ def add_person():
         if not face_encoding:
             return jsonify({"error": "Failed to extract face features"}), 400
         
-        # Connect to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Store the face embedding as a PostgreSQL array or packed bytes,
+        # depending on EMBEDDING_STORAGE
+        embedding_column_name, face_embedding_adapted = embedding_column(face_encoding)
         
-        # Store the face embedding as a proper PostgreSQL array
-        # Use psycopg2's adapt function to format it correctly
-        if hasattr(face_encoding, 'tolist'):
-            face_encoding = face_encoding.tolist()
+        # Borrow a pooled database connection only once the image is processed
+        with stage("db_insert"), db_connection() as conn, conn.cursor() as cursor:
+            # Insert the person record
+            cursor.execute(
+                f"INSERT INTO people_records (full_name, department, email, phone_number, {embedding_column_name}, age, home_address, occupation, education, interests, hobbies, bio) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
+                (full_name, department, email, phone_number, face_embedding_adapted, age, home_address, occupation, education, interests, hobbies, bio)
+            )
             
-        # Use psycopg2's adaptation for arrays
-        face_embedding_adapted = psycopg2.extensions.adapt(face_encoding)
-                # Insert the person record
-        cursor.execute(
-            "INSERT INTO people_records (full_name, department, email, phone_number, face_embedding, age, home_address, occupation, education, interests, hobbies, bio) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
-            (full_name, department, email, phone_number, face_embedding_adapted, age, home_address, occupation, education, interests, hobbies, bio)
-        )
+            new_person_id = cursor.fetchone()[0]
+            conn.commit()
         
-        new_person_id = cursor.fetchone()[0]
-        conn.commit()
+        # Make the new person matchable without reloading the gallery
+        gallery.add({
+            "id": new_person_id,
+            "full_name": full_name,
+            "department": department,
+            "email": email,
+            "phone_number": phone_number
+        }, face_encoding)
         
         return jsonify({
             "id": new_person_id,
             "message": "Person added successfully"
         }), 201
         
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except PoolSaturated as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    except JobTimeout as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         current_app.logger.error(f"Error adding person record: {e}")
         return jsonify({"error": f"Failed to add person: {str(e)}"}), 500
+
+@people_bp.route('/api/people/bulk', methods=['POST'])
+def bulk_add_people():
+    """
+    Enroll many people at once.
+
+    Expects a multipart upload with `manifest` (CSV with an `image` column plus
+    person fields) and `archive` (zip of the images named in the manifest).
+    Rows whose email is already enrolled, or repeats an earlier row's email,
+    are skipped, so a failed upload can simply be sent again.
+    """
+    if 'manifest' not in request.files or 'archive' not in request.files:
+        return jsonify({"error": "Both a manifest CSV and an image archive are required"}), 400
+
+    try:
+        rows, invalid = read_manifest(request.files['manifest'].read().decode('utf-8-sig'))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Invalid manifest: {str(e)}"}), 400
+    if len(rows) + len(invalid) > ENROLL_MAX_ROWS:
+        return jsonify({
+            "error": f"Manifest has {len(rows) + len(invalid)} rows; the limit is {ENROLL_MAX_ROWS}"
+        }), 413
+
+    try:
+        images = ImageSource(request.files['archive'].stream)
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Image archive is not a valid zip file"}), 400
+
+    # Batches commit one by one, so a later failure must still report these
+    enrolled = []
+    try:
+        rows, repeated = split_repeated_emails(rows)
+        with db_connection() as conn:
+            already = existing_emails(conn, [row["email"] for row in rows])
+        skipped = [
+            failure(row, "Email already enrolled") for row in rows
+            if row["email"] and row["email"] in already
+        ]
+        skipped += [failure(row, "Email repeats an earlier row of the manifest") for row in repeated]
+        pending = [row for row in rows if not (row["email"] and row["email"] in already)]
+
+        # Leave half the face workers free for live scans
+        encoded, failures = encode_rows(
+            pending, images, worker_encoder(face_workers), max(1, face_workers.processes // 2)
+        )
+
+        def publish(committed):
+            enrolled.extend(committed)
+            # Each committed batch becomes matchable straight away
+            gallery.add_many(
+                [dict(row, id=new_id) for row, new_id in committed],
+                [row["face_encoding"] for row, _ in committed]
+            )
+
+        with db_connection() as conn:
+            insert_people(conn, encoded, on_batch=publish)
+
+        return jsonify({
+            "enrolled": [{"row": row["row"], "id": new_id} for row, new_id in enrolled],
+            "skipped": skipped,
+            "failed": invalid + failures
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error in bulk enrollment: {e}")
+        return jsonify({
+            "error": f"Bulk enrollment failed: {str(e)}",
+            "enrolled": [{"row": row["row"], "id": new_id} for row, new_id in enrolled]
+        }), 500
     finally:
-        if 'conn' in locals():
-            cursor.close()
-            conn.close()
+        images.close()
+
+@people_bp.route('/api/people/<int:person_id>/templates', methods=['POST'])
+def add_person_template(person_id):
+    """
+    Add another face photo to an enrolled person's templates, e.g. a newer
+    photo or one with glasses, without re-enrolling them.
+    """
+    if 'faceImage' not in request.files:
+        return jsonify({"error": "No face image provided"}), 400
+
+    try:
+        face_encoding, error = run_cached("process_face_image", read_upload(request.files['faceImage']))
+        if error:
+            return jsonify({"error": error}), 400
+        if not face_encoding:
+            return jsonify({"error": "Failed to extract face features"}), 400
+
+        with stage("db_insert"):
+            count = gallery.add_template(person_id, face_encoding, source=request.form.get('source', 'capture'))
+        if count is None:
+            return jsonify({"error": "Person not found."}), 404
+
+        return jsonify({
+            "id": person_id,
+            "templates": count,
+            "message": "Face template added successfully"
+        }), 201
+
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except PoolSaturated as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    except JobTimeout as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        current_app.logger.error(f"Error adding face template: {e}")
+        return jsonify({"error": f"Failed to add face template: {str(e)}"}), 500
 
 @people_bp.route('/api/people/<int:person_id>', methods=['DELETE'])
 def delete_person(person_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM people_records WHERE id = %s RETURNING id", (person_id,))
-        deleted = cur.fetchone()
-        conn.commit()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM people_records WHERE id = %s RETURNING id", (person_id,))
+            deleted = cur.fetchone()
+            conn.commit()
         if deleted:
+            gallery.remove(person_id)
             return jsonify({"message": "Person deleted successfully."}), 200
         else:
             return jsonify({"error": "Person not found."}), 404
     except Exception as e:
         current_app.logger.error(f"Error deleting person: {e}")
-        return jsonify({"error": f"Failed to delete person: {str(e)}"}), 500
-    finally:
-        if 'conn' in locals() and conn:
-            cur.close()
-            conn.close()
\ No newline at end of file
+        return jsonify({"error": f"Failed to delete person: {str(e)}"}), 500
\ No newline at end of file
@@ -1,12 +1,109 @@
 from flask import Blueprint, request, jsonify, current_app
-import numpy as np
-import face_recognition
-from database import get_db_connection
-from face_utils import process_image_with_multiple_faces
-from psycopg2.extras import RealDictCursor
+from config import MATCH_THRESHOLD
+from services.gallery import gallery
+from services.image_ingest import read_upload, ImageRejected
+from services.embedding_cache import run_cached
+from services.metrics import faces_detected, face_matches, face_misses
+from services.quality import record as record_quality, rejection_body
+from services.scan_events import scan_events
+from services.workers import PoolSaturated, JobTimeout
 
 scan_bp = Blueprint('scan', __name__)
 
+# Upper bound on the runner-up candidates a client may ask for per face
+MAX_TOP_K = 10
+
+def face_result(person, distance):
+    """Public fields of a matched person, with default values for NULL"""
+    return {
+        "id": person["id"],
+        "full_name": person["full_name"] or "",
+        "department": person["department"] or "",
+        "email": person["email"] or "",
+        "phone_number": person["phone_number"] or "",
+        "confidence": float(1 - distance)  # Lower distance = higher confidence
+    }
+
+def camera_id_from_request(default=""):
+    """Camera a scan came from: the camera_id form/query value or the X-Camera-Id header"""
+    return request.values.get('camera_id') or request.headers.get('X-Camera-Id') or default
+
+def scan_image(image_data, top_k=1, camera_id="", endpoint="scan"):
+    """
+    Detect, encode and identify every face in an uploaded image.
+
+    Args:
+        image_data (bytes): The raw image data
+        top_k (int): Ranked candidates to include per recognized face
+        camera_id (str): Source camera, logged with each recognized face
+        endpoint (str): Route that took the upload, for metrics and the scan log
+
+    Returns:
+        tuple: (response body, HTTP status code)
+    """
+    # Process the image on a face worker to get multiple face encodings,
+    # unless the same (or a near-identical) frame was processed recently
+    face_encodings, face_locations, error, quality = run_cached(
+        "process_image_with_multiple_faces", image_data, allow_similar=True
+    )
+    
+    # Frames, or every face in them, rejected by the quality gate before encoding
+    record_quality(quality["frame"], [reason for _, reason in quality["faces"]])
+    faces_detected.inc(len(quality["faces"]), endpoint=endpoint)
+    rejected = [(box, reason) for box, reason in quality["faces"] if reason]
+    if quality["frame"] or (rejected and len(rejected) == len(quality["faces"])):
+        return rejection_body(quality["frame"], rejected), 422
+    
+    if error:
+        return {"error": error}, 400
+    
+    if len(face_encodings) == 0:
+        return {"error": "No faces detected in the image"}, 400
+        
+    # Match every detected face against the in-memory gallery in one pass,
+    # never giving the same person to two faces in the frame
+    gallery.ensure_loaded()
+    matches = gallery.match(face_encodings, threshold=MATCH_THRESHOLD, top_k=top_k)
+    recognized = sum(match is not None for match in matches)
+    face_matches.inc(recognized, endpoint=endpoint)
+    face_misses.inc(len(matches) - recognized, endpoint=endpoint)
+    
+    # List to hold all recognized faces
+    recognized_faces = []
+    
+    for match, (top, right, bottom, left) in zip(matches, face_locations):
+        # Skip faces without a good enough match
+        if match is None:
+            continue
+        
+        # Buffered for the attendance log; never waits on the database
+        scan_events.record(match.person["id"], match.distance, camera_id=camera_id, endpoint=endpoint)
+
+        face = face_result(match.person, match.distance)
+        
+        # Add location information for UI positioning
+        face["face_location"] = {
+            "top": int(top),
+            "right": int(right),
+            "bottom": int(bottom),
+            "left": int(left)
+        }
+        
+        # Runners-up, nearest first, when the client asked for them
+        if top_k > 1:
+            face["candidates"] = [
+                dict(face_result(person, distance), distance=distance)
+                for person, distance in match.candidates
+            ]
+        
+        recognized_faces.append(face)
+    
+    # Return the results
+    if recognized_faces:
+        return recognized_faces, 200
+    else:
+        return {"error": "No matching faces found in database"}, 404
+
 @scan_bp.route('/api/scan', methods=['POST'])
 def scan_face():
     # Check if the image is in the request
@@ -17,84 +114,24 @@ def scan_face():
     if file.filename == '':
         return jsonify({"error": "No selected face image file"}), 400
 
+    # Optional number of ranked candidates to return per face
     try:
-        # Process the image to get multiple face encodings
-        image_data = file.read()
-        face_encodings, face_locations, error = process_image_with_multiple_faces(image_data)
-        
-        if error:
-            return jsonify({"error": error}), 400
-        
-        if len(face_encodings) == 0:
-            return jsonify({"error": "No faces detected in the image"}), 400
-            
-        # Query the database for matching faces
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get all people with their face encodings
-        cur.execute("SELECT id, full_name, department, email, phone_number, face_embedding FROM people_records")
-        people_records = cur.fetchall()
-        
-        # Convert DB face encodings to numpy arrays for comparison
-        stored_encodings = []
-        stored_people = []
-        
-        for person in people_records:
-            stored_encodings.append(np.array(person["face_embedding"]))
-            stored_people.append(person)
-        
-        # List to hold all recognized faces
-        recognized_faces = []
-        
-        # Define a confidence threshold (lower distance = higher confidence)
-        threshold = 0.6  # Adjust based on your needs
-        
-        # For each detected face
-        for i, face_encoding in enumerate(face_encodings):
-            # Calculate all distances
-            if stored_encodings:  # Check if there are any stored encodings
-                face_distances = face_recognition.face_distance(stored_encodings, face_encoding)
-                
-                # Find the best match (minimum distance)
-                best_match_index = np.argmin(face_distances)
-                best_match_distance = face_distances[best_match_index]
-                
-                # If the match is good enough
-                if best_match_distance < threshold:
-                    # Calculate confidence score
-                    confidence = 1 - best_match_distance
-                    best_match = stored_people[best_match_index]
-                    
-                    # Add location information for UI positioning
-                    top, right, bottom, left = face_locations[i]
-                    
-                    # Add this person to the results with default values for NULL
-                    recognized_faces.append({
-                        "id": best_match["id"],
-                        "full_name": best_match["full_name"] or "",
-                        "department": best_match["department"] or "",
-                        "email": best_match["email"] or "",
-                        "phone_number": best_match["phone_number"] or "",
-                        "confidence": float(confidence),  # Ensure it's a float
-                        "face_location": {
-                            "top": int(top),
-                            "right": int(right),
-                            "bottom": int(bottom),
-                            "left": int(left)
-                        }
-                    })
-        
-        # Return the results
-        if recognized_faces:
-            return jsonify(recognized_faces), 200
-        else:
-            return jsonify({"error": "No matching faces found in database"}), 404
+        top_k = int(request.values.get('top_k', 1))
+    except ValueError:
+        return jsonify({"error": "top_k must be an integer"}), 400
+    top_k = max(1, min(top_k, MAX_TOP_K))
+
+    try:
+        body, status = scan_image(read_upload(file), top_k=top_k, camera_id=camera_id_from_request())
+        return jsonify(body), status
             
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except PoolSaturated as e:
+        # Shed load rather than queueing without bound; the webcam loop will retry
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    except JobTimeout as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         current_app.logger.error(f"Error scanning faces: {e}")
         return jsonify({"error": f"An error occurred during face scanning: {str(e)}"}), 500
-    finally:
-        if 'conn' in locals() and conn:
-            cur.close()
-            conn.close()
\ No newline at end of file
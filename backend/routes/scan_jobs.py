@@ -0,0 +1,67 @@
+from functools import partial
+from flask import Blueprint, request, jsonify
+from config import SCAN_JOB_MAX_WAIT
+from routes.scan import scan_image, camera_id_from_request, MAX_TOP_K
+from services.image_ingest import read_upload, ImageRejected
+from services.metrics import registry
+from services.scan_jobs import ScanJobQueue, QueueFull, FINISHED
+
+scan_jobs_bp = Blueprint('scan_jobs', __name__)
+
+# Asynchronous scans: the upload is queued and answered with a job id at once;
+# the client long-polls the job for the same result /api/scan would return.
+# Jobs live in this web process, so polls must reach the process that took the upload.
+scan_jobs = ScanJobQueue(partial(scan_image, endpoint="job"))
+
+registry.gauge("frs_scan_jobs", "Scan jobs by status", lambda: {
+    (("status", status),): count for status, count in scan_jobs.stats().items()
+})
+
+@scan_jobs_bp.route('/api/scan/jobs', methods=['POST'])
+def create_scan_job():
+    # Same upload format as /api/scan
+    if 'faceImage' not in request.files:
+        return jsonify({"error": "No face image part in the request"}), 400
+
+    file = request.files['faceImage']
+    if file.filename == '':
+        return jsonify({"error": "No selected face image file"}), 400
+
+    try:
+        top_k = int(request.values.get('top_k', 1))
+    except ValueError:
+        return jsonify({"error": "top_k must be an integer"}), 400
+    top_k = max(1, min(top_k, MAX_TOP_K))
+
+    try:
+        # The job outlives the request, so it gets its own copy of the upload
+        job, created = scan_jobs.submit(bytes(read_upload(file)), top_k=top_k, camera_id=camera_id_from_request())
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+
+    # 202 for a new job; 200 when an identical upload's job is reused
+    return jsonify(job.to_dict()), 202 if created else 200, {"Location": f"/api/scan/jobs/{job.id}"}
+
+@scan_jobs_bp.route('/api/scan/jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    # ?wait=N holds the request up to N seconds until the job finishes
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    wait = max(0.0, min(wait, SCAN_JOB_MAX_WAIT))
+
+    job = scan_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    # 202 while the job is still queued or running
+    return jsonify(job.to_dict()), 200 if job.status in FINISHED else 202
+
+@scan_jobs_bp.route('/api/scan/jobs/<job_id>', methods=['DELETE'])
+def cancel_scan_job(job_id):
+    job = scan_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    return jsonify(job.to_dict()), 200
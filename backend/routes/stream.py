@@ -0,0 +1,107 @@
+from flask import Blueprint, request, jsonify, current_app
+from config import MATCH_THRESHOLD, STREAM_SESSION_TTL
+from routes.scan import face_result, camera_id_from_request
+from services.gallery import gallery
+from services.image_ingest import read_upload, ImageRejected
+from services.metrics import faces_detected, face_matches, face_misses
+from services.quality import record as record_quality, rejection_body
+from services.scan_events import scan_events
+from services.tracking import stream_sessions
+from services.workers import face_workers, PoolSaturated, JobTimeout
+
+stream_bp = Blueprint('stream', __name__)
+
+# Streaming scan: a client opens a session and posts frames to it. Faces are
+# tracked across frames, so detection runs on every frame but a face is only
+# encoded and matched when its track is new or its identity has gone stale.
+
+@stream_bp.route('/api/scan/sessions', methods=['POST'])
+def open_session():
+    session_id = stream_sessions.create()
+    return jsonify({"session_id": session_id, "ttl_seconds": STREAM_SESSION_TTL}), 201
+
+@stream_bp.route('/api/scan/sessions/<session_id>', methods=['DELETE'])
+def close_session(session_id):
+    if stream_sessions.close(session_id):
+        return jsonify({"message": "Session closed."}), 200
+    return jsonify({"error": "Session not found."}), 404
+
+@stream_bp.route('/api/scan/sessions/<session_id>/frames', methods=['POST'])
+def scan_frame(session_id):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found or expired."}), 404
+    tracker, lock = session
+
+    # Accept a multipart upload like /api/scan, or the raw image as the request body
+    try:
+        image_data = read_upload(request.files['faceImage'] if 'faceImage' in request.files else request.stream)
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), e.status
+
+    try:
+        # Frames of one session are processed strictly in order
+        with lock:
+            track_boxes, refresh = tracker.pending()
+            face_locations, track_indexes, encodings, error, quality = face_workers.run(
+                "process_tracked_frame", image_data, track_boxes, refresh
+            )
+            record_quality(quality["frame"], list(quality["faces"].values()))
+            if quality["frame"]:
+                # Unusable frame: leave the tracks as they are
+                return jsonify(rejection_body(quality["frame"], [])), 422
+            if error:
+                return jsonify({"error": error}), 400
+            faces_detected.inc(len(face_locations), endpoint="stream")
+
+            # Match only the faces that were encoded this frame
+            identities = {}
+            if encodings:
+                gallery.ensure_loaded()
+                encoded = sorted(encodings)
+                matches = gallery.match([encodings[i] for i in encoded], threshold=MATCH_THRESHOLD)
+                # Each stream session counts as its own camera unless the client names one
+                camera_id = camera_id_from_request(default=f"session:{session_id}")
+                for i, match in zip(encoded, matches):
+                    identities[i] = (match.person, match.distance) if match else (None, None)
+                    if match:
+                        scan_events.record(match.person["id"], match.distance,
+                                           camera_id=camera_id, endpoint="stream")
+                recognized = sum(match is not None for match in matches)
+                face_matches.inc(recognized, endpoint="stream")
+                face_misses.inc(len(matches) - recognized, endpoint="stream")
+
+            results = tracker.update(face_locations, track_indexes, identities)
+            frame = tracker.frame
+
+        faces = []
+        for index, ((track, encoded), (top, right, bottom, left)) in enumerate(zip(results, face_locations)):
+            face = {
+                "track_id": track.id,
+                "recognized": track.person is not None,
+                # False when the identity was carried over from an earlier frame
+                "encoded": encoded,
+                "face_location": {
+                    "top": int(top),
+                    "right": int(right),
+                    "bottom": int(bottom),
+                    "left": int(left)
+                }
+            }
+            if track.person is not None:
+                face.update(face_result(track.person, 0.0))
+                face["confidence"] = float(track.current_confidence(frame))
+            # Due for encoding but skipped by the quality gate
+            if quality["faces"].get(index):
+                face["rejected_reason"] = quality["faces"][index]
+            faces.append(face)
+
+        return jsonify({"session_id": session_id, "frame": frame, "faces": faces}), 200
+
+    except PoolSaturated as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    except JobTimeout as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        current_app.logger.error(f"Error scanning stream frame: {e}")
+        return jsonify({"error": f"An error occurred during face scanning: {str(e)}"}), 500
@@ -7,6 +7,10 @@ CREATE TABLE IF NOT EXISTS public.users (
   created_at     TIMESTAMP            NOT NULL DEFAULT now()
 );
 
+-- Emails are stored lowercased; no two accounts may differ only in case
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_lower_idx
+  ON public.users (lower(email));
+
 -- People records table
 CREATE TABLE IF NOT EXISTS public.people_records (
   id             SERIAL PRIMARY KEY,
@@ -21,7 +25,147 @@ CREATE TABLE IF NOT EXISTS public.people_records (
   interests      TEXT,
   hobbies        TEXT,
   bio            TEXT,
-  face_embedding DOUBLE PRECISION[]   NOT NULL,
+  -- Centroid of the person's face_templates (the enrollment embedding until more are added)
+  face_embedding DOUBLE PRECISION[],
+  -- Packed float32/float16 bytes, used when EMBEDDING_STORAGE is not 'array'
+  face_embedding_packed BYTEA,
   created_by     INTEGER              REFERENCES public.users(id) ON DELETE SET NULL,
-  created_at     TIMESTAMP            NOT NULL DEFAULT now()
-);
\ No newline at end of file
+  created_at     TIMESTAMP            NOT NULL DEFAULT now(),
+  CONSTRAINT people_records_face_embedding_present
+    CHECK (face_embedding IS NOT NULL OR face_embedding_packed IS NOT NULL)
+);
+
+-- Keyset pagination for GET /api/people
+CREATE INDEX IF NOT EXISTS people_records_full_name_id_idx
+  ON public.people_records (full_name, id);
+
+-- Change counter for people_records: ETags on GET /api/people and the gallery generation
+CREATE TABLE IF NOT EXISTS public.people_records_version (
+  id       INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  version  BIGINT  NOT NULL DEFAULT 0
+);
+
+INSERT INTO public.people_records_version (id, version) VALUES (1, 0)
+  ON CONFLICT (id) DO NOTHING;
+
+-- Every writing statement bumps the version once and NOTIFYs the changed ids
+-- on people_records_changed, so each web worker can update its gallery
+CREATE OR REPLACE FUNCTION public.notify_people_records_changed() RETURNS trigger AS $$
+DECLARE
+  changed_ids INTEGER[];
+  new_generation BIGINT;
+  payload TEXT;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    SELECT array_agg(id ORDER BY id) INTO changed_ids FROM old_rows;
+  ELSIF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT array_agg(id ORDER BY id) INTO changed_ids FROM new_rows;
+  END IF;
+  -- Statements that touched no rows change nothing
+  IF TG_OP <> 'TRUNCATE' AND changed_ids IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  UPDATE public.people_records_version SET version = version + 1 WHERE id = 1
+    RETURNING version INTO new_generation;
+
+  payload := json_build_object('op', lower(TG_OP), 'generation', new_generation, 'ids', changed_ids)::text;
+  -- NOTIFY payloads are limited to 8000 bytes
+  IF octet_length(payload) > 7900 THEN
+    payload := json_build_object('op', lower(TG_OP), 'generation', new_generation, 'ids', NULL)::text;
+  END IF;
+  PERFORM pg_notify('people_records_changed', payload);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_records_notify_insert ON public.people_records;
+CREATE TRIGGER people_records_notify_insert
+  AFTER INSERT ON public.people_records
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+DROP TRIGGER IF EXISTS people_records_notify_update ON public.people_records;
+CREATE TRIGGER people_records_notify_update
+  AFTER UPDATE ON public.people_records
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+DROP TRIGGER IF EXISTS people_records_notify_delete ON public.people_records;
+CREATE TRIGGER people_records_notify_delete
+  AFTER DELETE ON public.people_records
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+DROP TRIGGER IF EXISTS people_records_notify_truncate ON public.people_records;
+CREATE TRIGGER people_records_notify_truncate
+  AFTER TRUNCATE ON public.people_records
+  FOR EACH STATEMENT EXECUTE FUNCTION public.notify_people_records_changed();
+
+-- Every embedding captured for a person; people_records holds their centroid
+CREATE TABLE IF NOT EXISTS public.face_templates (
+  id             SERIAL PRIMARY KEY,
+  person_id      INTEGER     NOT NULL REFERENCES public.people_records(id) ON DELETE CASCADE,
+  face_embedding DOUBLE PRECISION[],
+  face_embedding_packed BYTEA,
+  source         VARCHAR(32) NOT NULL DEFAULT 'enrollment',
+  created_at     TIMESTAMP   NOT NULL DEFAULT now(),
+  CONSTRAINT face_templates_face_embedding_present
+    CHECK (face_embedding IS NOT NULL OR face_embedding_packed IS NOT NULL)
+);
+
+CREATE INDEX IF NOT EXISTS face_templates_person_id_idx
+  ON public.face_templates (person_id, id);
+
+-- The enrollment embedding becomes a person's first template
+CREATE OR REPLACE FUNCTION public.seed_face_template() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO public.face_templates (person_id, face_embedding, face_embedding_packed, source)
+    VALUES (NEW.id, NEW.face_embedding, NEW.face_embedding_packed, 'enrollment');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_records_seed_template ON public.people_records;
+CREATE TRIGGER people_records_seed_template
+  AFTER INSERT ON public.people_records
+  FOR EACH ROW EXECUTE FUNCTION public.seed_face_template();
+
+-- Recognized sightings, partitioned by UTC day (partitions are created on demand)
+CREATE TABLE IF NOT EXISTS public.scan_events (
+  seen_at    TIMESTAMPTZ  NOT NULL,
+  person_id  INTEGER      NOT NULL,
+  camera_id  VARCHAR(64)  NOT NULL DEFAULT '',
+  endpoint   VARCHAR(16)  NOT NULL,
+  distance   REAL
+) PARTITION BY RANGE (seen_at);
+
+CREATE INDEX IF NOT EXISTS scan_events_person_id_seen_at_idx
+  ON public.scan_events (person_id, seen_at);
+
+CREATE OR REPLACE FUNCTION public.ensure_scan_events_partition(day DATE) RETURNS void AS $$
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.scan_events FOR VALUES FROM (%L) TO (%L)',
+    'scan_events_' || to_char(day, 'YYYYMMDD'),
+    day::timestamp AT TIME ZONE 'UTC',
+    (day + 1)::timestamp AT TIME ZONE 'UTC'
+  );
+EXCEPTION WHEN duplicate_table THEN
+  -- Another web worker created it first
+  NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per-person, per-day attendance, updated with every batch of scan_events
+CREATE TABLE IF NOT EXISTS public.attendance_daily (
+  person_id   INTEGER      NOT NULL,
+  day         DATE         NOT NULL,
+  first_seen  TIMESTAMPTZ  NOT NULL,
+  last_seen   TIMESTAMPTZ  NOT NULL,
+  sightings   INTEGER      NOT NULL,
+  PRIMARY KEY (day, person_id)
+);
+
+CREATE INDEX IF NOT EXISTS attendance_daily_person_id_day_idx
+  ON public.attendance_daily (person_id, day);
@@ -0,0 +1,185 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from config import (
+    EMBEDDING_CACHE_ENTRIES, EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_TTL,
+    EMBEDDING_CACHE_PHASH, EMBEDDING_CACHE_PHASH_DISTANCE
+)
+from services.image_ingest import open_image
+from services.metrics import stage
+from services.workers import face_workers
+
+# Rough per-entry bookkeeping overhead (dict/tuple objects, key, hashes)
+_ENTRY_OVERHEAD = 512
+
+
+def content_hash(image_data):
+    """Fast 128-bit digest of the raw upload bytes"""
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+def perceptual_hash(image_data):
+    """
+    64-bit difference hash (dHash) of an image.
+
+    Near-identical frames (re-encoded JPEGs, sensor noise) get hashes a few
+    bits apart. JPEGs are decoded at 1/8 scale, so this is far cheaper than
+    running face detection.
+    """
+    img = open_image(image_data)
+    img.draft('L', (64, 64))
+    pixels = list(img.convert('L').resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def _result_size(result):
+    """Approximate memory held by a cached face_utils result"""
+    size = _ENTRY_OVERHEAD
+    for item in result if isinstance(result, tuple) else (result,):
+        if isinstance(item, list):
+            # Encodings are ndarrays (or lists of floats); locations are small tuples
+            size += sum(getattr(value, 'nbytes', None) or sys.getsizeof(value) for value in item)
+    return size
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache with TTL for face_utils results, keyed by upload content.
+
+    The exact tier matches byte-identical uploads (retries, frozen cameras).
+    The optional perceptual tier also matches frames whose dHash is within
+    phash_distance bits of a cached one.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_ENTRIES, max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+                 ttl=EMBEDDING_CACHE_TTL, phash=EMBEDDING_CACHE_PHASH,
+                 phash_distance=EMBEDDING_CACHE_PHASH_DISTANCE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.phash = phash
+        self.phash_distance = phash_distance
+        self._entries = OrderedDict()  # key -> (result, expires_at, size, phash)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "phash_hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, namespace, image_data, allow_similar=False):
+        """
+        Look up a cached result.
+
+        Returns:
+            tuple: (result or None, lookup) - pass lookup back to put() on a miss
+                   so the hashes are not computed twice
+        """
+        key = (namespace, content_hash(image_data))
+        phash = None
+        with self._lock:
+            result = self._lookup(key)
+            if result is not None:
+                self._stats["hits"] += 1
+                return result, (key, phash)
+
+        if allow_similar and self.phash:
+            try:
+                phash = perceptual_hash(image_data)
+            except Exception:
+                phash = None
+            if phash is not None:
+                with self._lock:
+                    result = self._lookup_similar(namespace, phash)
+                    if result is not None:
+                        self._stats["phash_hits"] += 1
+                        return result, (key, phash)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, (key, phash)
+
+    def put(self, lookup, result):
+        key, phash = lookup
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (result, time.monotonic() + self.ttl, size, phash)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            })
+        return stats
+
+    def _lookup(self, key):
+        # Called with the lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            self._bytes -= self._entries.pop(key)[2]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _lookup_similar(self, namespace, phash):
+        # Called with the lock held; the cache is small enough for a linear scan
+        now = time.monotonic()
+        for key, (result, expires_at, _, cached_phash) in reversed(self._entries.items()):
+            if key[0] != namespace or cached_phash is None or expires_at < now:
+                continue
+            if bin(phash ^ cached_phash).count('1') <= self.phash_distance:
+                self._entries.move_to_end(key)
+                return result
+        return None
+
+
+# Shared cache used by the route handlers
+embedding_cache = EmbeddingCache()
+
+
+def run_cached(task_name, image_data, allow_similar=False):
+    """
+    face_workers.run() with the embedding cache in front: a repeated upload
+    returns the earlier result without touching dlib.
+
+    Args:
+        allow_similar (bool): Also accept a perceptually near-identical frame
+    """
+    if not embedding_cache.enabled:
+        return face_workers.run(task_name, image_data)
+
+    with stage("cache_lookup"):
+        result, lookup = embedding_cache.get(task_name, image_data, allow_similar)
+    if result is None:
+        result = face_workers.run(task_name, image_data)
+        embedding_cache.put(lookup, result)
+    return result
@@ -0,0 +1,179 @@
+import os
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+from config import EMBEDDING_DIM, EMBEDDING_STORAGE
+
+# Packed embeddings are little-endian so np.frombuffer can use them in place
+PACKED_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+STORAGE_MODES = ("array",) + tuple(PACKED_DTYPES)
+
+# The dtype of a packed embedding is recovered from its length
+_DTYPE_BY_SIZE = {EMBEDDING_DIM * dtype.itemsize: dtype for dtype in PACKED_DTYPES.values()}
+
+MIGRATION_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "migrations", "001_packed_face_embeddings.sql"
+)
+
+
+def is_packed(storage=EMBEDDING_STORAGE):
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown EMBEDDING_STORAGE '{storage}'. Choose from: {', '.join(STORAGE_MODES)}")
+    return storage != "array"
+
+
+def pack_embedding(encoding, storage=EMBEDDING_STORAGE):
+    """Serialize a 128-d encoding to float32/float16 bytes"""
+    return np.asarray(encoding, dtype=PACKED_DTYPES[storage]).tobytes()
+
+
+def unpack_embedding(data):
+    """Decode one packed embedding without copying it (float16 is widened)"""
+    dtype = _DTYPE_BY_SIZE.get(len(data))
+    if dtype is None:
+        raise ValueError(f"Packed embedding has unexpected size {len(data)} bytes")
+    vector = np.frombuffer(data, dtype=dtype)
+    return vector if dtype == PACKED_DTYPES["float32"] else vector.astype(np.float32)
+
+
+def unpack_embeddings(buffers):
+    """
+    Decode many packed embeddings into one float32 (N x 128) matrix.
+
+    The buffers are joined once and viewed with np.frombuffer, so there is no
+    per-element Python work regardless of the gallery size.
+    """
+    if not buffers:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    sizes = {len(data) for data in buffers}
+    if len(sizes) > 1:
+        # Mixed float32/float16 rows, e.g. halfway through a storage change
+        return np.stack([unpack_embedding(data) for data in buffers])
+    dtype = _DTYPE_BY_SIZE.get(sizes.pop())
+    if dtype is None:
+        raise ValueError("Packed embeddings have an unexpected size")
+    matrix = np.frombuffer(b"".join(buffers), dtype=dtype).reshape(-1, EMBEDDING_DIM)
+    return matrix if dtype == PACKED_DTYPES["float32"] else matrix.astype(np.float32)
+
+
+def embedding_column(encoding, storage=EMBEDDING_STORAGE):
+    """
+    Column name and SQL-adapted value used to store an encoding.
+
+    Returns:
+        tuple: (column_name, value) for an INSERT into people_records
+    """
+    if hasattr(encoding, 'tolist'):
+        encoding = encoding.tolist()
+    if is_packed(storage):
+        return "face_embedding_packed", psycopg2.Binary(pack_embedding(encoding, storage))
+    # Use psycopg2's adaptation for arrays
+    return "face_embedding", psycopg2.extensions.adapt(encoding)
+
+
+def embedding_select(storage=EMBEDDING_STORAGE):
+    """SELECT expressions for reading embeddings back (packed and/or array)"""
+    if is_packed(storage):
+        # Only ship the array for rows that have not been migrated yet
+        return ("face_embedding_packed, "
+                "CASE WHEN face_embedding_packed IS NULL THEN face_embedding END AS face_embedding")
+    return "face_embedding"
+
+
+def decode_rows(rows, dim=EMBEDDING_DIM):
+    """
+    Pop the embedding columns off fetched rows and return them as a float32 matrix.
+
+    Args:
+        rows (list): Dict rows selected with embedding_select()
+
+    Returns:
+        np.ndarray: (len(rows) x dim) float32, in row order
+    """
+    matrix = np.empty((len(rows), dim), dtype=np.float32)
+    packed_index, packed, arrays_index, arrays = [], [], [], []
+    for i, row in enumerate(rows):
+        data = row.pop("face_embedding_packed", None)
+        array = row.pop("face_embedding", None)
+        if data is not None:
+            packed_index.append(i)
+            packed.append(data)
+        else:
+            arrays_index.append(i)
+            arrays.append(array)
+    if packed:
+        matrix[packed_index] = unpack_embeddings(packed)
+    if arrays:
+        matrix[arrays_index] = np.asarray(arrays, dtype=np.float32)
+    return matrix
+
+
+def migrate(storage="float32", drop_arrays=False, batch_size=1000):
+    """
+    Convert existing DOUBLE PRECISION[] embeddings to packed bytes.
+
+    Safe to re-run: only rows without a packed embedding are touched, one
+    committed batch at a time.
+    """
+    from psycopg2.extras import execute_values
+    from database import db_connection
+
+    if not is_packed(storage):
+        raise ValueError("Migration target must be a packed storage mode")
+
+    with db_connection() as conn:
+        with conn.cursor() as cur, open(MIGRATION_PATH) as f:
+            cur.execute(f.read())
+        conn.commit()
+
+        converted = 0
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, face_embedding FROM people_records "
+                    "WHERE face_embedding_packed IS NULL ORDER BY id LIMIT %s",
+                    (batch_size,)
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                execute_values(
+                    cur,
+                    "UPDATE people_records AS p SET face_embedding_packed = v.packed "
+                    + (", face_embedding = NULL " if drop_arrays else "")
+                    + "FROM (VALUES %s) AS v(id, packed) WHERE p.id = v.id",
+                    [(person_id, psycopg2.Binary(pack_embedding(embedding, storage)))
+                     for person_id, embedding in rows]
+                )
+            conn.commit()
+            converted += len(rows)
+            print(f"Packed {converted} embeddings...")
+
+        if drop_arrays:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE people_records SET face_embedding = NULL "
+                    "WHERE face_embedding_packed IS NOT NULL AND face_embedding IS NOT NULL"
+                )
+            conn.commit()
+    return converted
+
+
+if __name__ == '__main__':
+    # python -m services.embedding_codec migrate [float32|float16] [--drop-arrays]
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not args or args[0] != "migrate":
+        print("Usage: python -m services.embedding_codec migrate [float32|float16] [--drop-arrays]")
+        sys.exit(1)
+    target = args[1] if len(args) > 1 else "float32"
+    total = migrate(target, drop_arrays="--drop-arrays" in sys.argv)
+    print(f"Done. {total} embeddings packed as {target}. "
+          f"Set EMBEDDING_STORAGE={target} to write new enrollments packed.")
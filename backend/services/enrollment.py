@@ -0,0 +1,215 @@
+import csv
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from config import ENROLL_BATCH_SIZE, IMAGE_MAX_BYTES
+from services.embedding_codec import embedding_column
+from services.image_ingest import ImageRejected
+
+# Person fields accepted in a bulk enrollment manifest (besides the image path)
+PERSON_COLUMNS = (
+    "full_name", "department", "email", "phone_number", "age", "home_address",
+    "occupation", "education", "interests", "hobbies", "bio",
+)
+IMAGE_COLUMN = "image"
+
+
+def read_manifest(csv_text):
+    """
+    Parse a bulk enrollment CSV.
+
+    The CSV needs an `image` column (file name inside the directory or zip)
+    and a `full_name` column; any other PERSON_COLUMNS are optional.
+
+    Returns:
+        tuple: (rows, failures); one dict per valid data row, with "row"
+        holding its 1-based line number, and a failure for each invalid row
+    """
+    reader = csv.DictReader(io.StringIO(csv_text))
+    missing = {IMAGE_COLUMN, "full_name"} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Manifest is missing column(s): {', '.join(sorted(missing))}")
+
+    rows, failures = [], []
+    for line, record in enumerate(reader, start=2):
+        row = {column: (record.get(column) or "").strip() for column in PERSON_COLUMNS}
+        row[IMAGE_COLUMN] = (record.get(IMAGE_COLUMN) or "").strip()
+        row["row"] = line
+        try:
+            row["age"] = _parse_age(row["age"])
+        except ValueError as e:
+            failures.append(failure(row, str(e)))
+            continue
+        rows.append(row)
+    return rows, failures
+
+
+def _parse_age(value):
+    # people_records.age is an INTEGER column; a bad value would fail the whole batch insert
+    if not value:
+        return None
+    try:
+        age = int(value)
+    except ValueError:
+        raise ValueError(f"Age must be a whole number, got {value!r}")
+    if age < 0:
+        raise ValueError(f"Age cannot be negative, got {age}")
+    return age
+
+
+def split_repeated_emails(rows):
+    """
+    Keep the first row for each email and set aside later rows repeating it.
+
+    Returns:
+        tuple: (rows to enroll, rows whose email appeared earlier in the manifest)
+    """
+    seen = set()
+    unique, repeated = [], []
+    for row in rows:
+        if row["email"] and row["email"] in seen:
+            repeated.append(row)
+            continue
+        if row["email"]:
+            seen.add(row["email"])
+        unique.append(row)
+    return unique, repeated
+
+
+class ImageSource:
+    """Reads enrollment images from a directory or a zip archive"""
+
+    def __init__(self, path_or_file):
+        self._zip = None
+        self._root = None
+        if isinstance(path_or_file, str) and os.path.isdir(path_or_file):
+            self._root = os.path.abspath(path_or_file)
+        else:
+            self._zip = zipfile.ZipFile(path_or_file)
+
+    def read(self, name):
+        # Oversized images are refused before they are read (ImageRejected is a ValueError)
+        if self._zip is not None:
+            if self._zip.getinfo(name).file_size > IMAGE_MAX_BYTES:
+                raise ImageRejected(f"Image is larger than {IMAGE_MAX_BYTES} bytes", 413)
+            return self._zip.read(name)
+        path = os.path.abspath(os.path.join(self._root, name))
+        # Manifest paths must stay inside the image directory
+        if os.path.commonpath([path, self._root]) != self._root:
+            raise ValueError("Image path points outside the image directory")
+        if os.path.getsize(path) > IMAGE_MAX_BYTES:
+            raise ImageRejected(f"Image is larger than {IMAGE_MAX_BYTES} bytes", 413)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+def encode_rows(rows, images, encode, concurrency):
+    """
+    Compute face encodings for manifest rows in parallel.
+
+    Args:
+        rows (list): Rows from read_manifest()
+        images (ImageSource): Where the image files are read from
+        encode (callable): image bytes -> (face_encoding, error_message)
+        concurrency (int): Rows encoded at the same time
+
+    Returns:
+        tuple: (encoded rows with "face_encoding" set, failures)
+    """
+    def encode_row(row):
+        if not row[IMAGE_COLUMN]:
+            return row, None, "No image given"
+        try:
+            image_data = images.read(row[IMAGE_COLUMN])
+        except (KeyError, OSError, ValueError) as e:
+            return row, None, f"Could not read image: {e}"
+        try:
+            encoding, error = encode(image_data)
+        except Exception as e:
+            # A worker timeout or a crashed worker pool fails this row, not the whole run
+            return row, None, f"Face encoding failed: {e}"
+        return row, encoding, error
+
+    encoded, failures = [], []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for row, encoding, error in executor.map(encode_row, rows):
+            if error or not encoding:
+                failures.append(failure(row, error or "Failed to extract face features"))
+            else:
+                encoded.append(dict(row, face_encoding=encoding))
+    return encoded, failures
+
+
+def failure(row, error):
+    return {"row": row["row"], "image": row[IMAGE_COLUMN], "error": error}
+
+
+def existing_emails(conn, emails):
+    """Emails from the list that are already enrolled, so re-runs can skip them"""
+    emails = [email for email in emails if email]
+    if not emails:
+        return set()
+    with conn.cursor() as cur:
+        cur.execute("SELECT email FROM people_records WHERE email = ANY(%s)", (emails,))
+        return {row[0] for row in cur.fetchall()}
+
+
+def insert_people(conn, rows, batch_size=ENROLL_BATCH_SIZE, on_batch=None):
+    """
+    Insert encoded rows with one multi-row INSERT per batch, committing each batch.
+
+    Args:
+        conn: A database connection
+        rows (list): Rows from encode_rows()
+        on_batch (callable): Called with the list of (row, new_id) of each committed batch
+
+    Returns:
+        list: (row, new_id) for every inserted row
+    """
+    inserted = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        values = []
+        for row in batch:
+            embedding_column_name, face_embedding_adapted = embedding_column(row["face_encoding"])
+            values.append(tuple(row[column] for column in PERSON_COLUMNS) + (face_embedding_adapted,))
+
+        with conn.cursor() as cur:
+            ids = execute_values(
+                cur,
+                f"INSERT INTO people_records ({', '.join(PERSON_COLUMNS)}, {embedding_column_name}) "
+                "VALUES %s RETURNING id",
+                values,
+                page_size=len(values),
+                fetch=True,
+            )
+        conn.commit()
+
+        # PostgreSQL returns the RETURNING rows of a multi-row VALUES insert in order
+        committed = [(row, new_id) for row, (new_id,) in zip(batch, ids)]
+        inserted.extend(committed)
+        if on_batch:
+            on_batch(committed)
+    return inserted
+
+
+def worker_encoder(face_workers, retry_delay=0.2):
+    """Encode through the shared face worker pool, waiting out brief saturation"""
+    from services.workers import PoolSaturated
+
+    def encode(image_data):
+        while True:
+            try:
+                return face_workers.run("process_face_image", image_data)
+            except PoolSaturated:
+                time.sleep(retry_delay)
+    return encode
@@ -0,0 +1,235 @@
+"""
+The face detection and encoding engine.
+
+FaceEngine owns the dlib detector, shape predictor and encoder directly
+instead of going through the face_recognition module functions, which look
+up their global models and rebuild dlib objects on every call. Models are
+loaded once, by warm_up() at startup or on first use, and all faces of one
+call are encoded in a single batched dlib call.
+"""
+import threading
+from collections import namedtuple
+
+import dlib
+import face_recognition_models
+import numpy as np
+from PIL import Image
+
+from config import (
+    DETECTION_MAX_SIDE, ENCODING_CROP_PADDING, ENCODING_CROP_MAX_SIDE,
+    FACE_DETECTION_MODEL, FACE_DETECTION_UPSAMPLE, FACE_LANDMARK_MODEL, FACE_ENCODING_JITTERS
+)
+
+DETECTION_MODELS = ("hog", "cnn")
+LANDMARK_MODELS = ("small", "large")
+
+# The encoder expects aligned 150x150 face chips, padded like face_recognition does
+CHIP_SIZE = 150
+CHIP_PADDING = 0.25
+
+# A face's landmark shape, found on `crop` (a bounded crop around its box).
+# Computed once per face and shared by the pose check and the encoder.
+AlignedFace = namedtuple("AlignedFace", ["crop", "shape"])
+
+
+def _resize(image, factor):
+    height, width = image.shape[:2]
+    return np.asarray(
+        Image.fromarray(image).resize(
+            (max(1, round(width * factor)), max(1, round(height * factor))), Image.BILINEAR
+        )
+    )
+
+
+class FaceEngine:
+    """
+    Face detection and 128-d encoding with preloaded dlib models.
+
+    Args:
+        model (str): Detection model, 'hog' or 'cnn'
+        upsample (int): Times the image is upsampled when looking for faces
+        landmarks (str): Shape predictor, 'small' (5 points) or 'large' (68 points)
+        num_jitters (int): Re-sampled copies averaged per encoding
+    """
+
+    def __init__(self, model=FACE_DETECTION_MODEL, upsample=FACE_DETECTION_UPSAMPLE,
+                 landmarks=FACE_LANDMARK_MODEL, num_jitters=FACE_ENCODING_JITTERS):
+        if model not in DETECTION_MODELS:
+            raise ValueError(f"Unknown detection model '{model}'. Choose from: {', '.join(DETECTION_MODELS)}")
+        if landmarks not in LANDMARK_MODELS:
+            raise ValueError(f"Unknown landmark model '{landmarks}'. Choose from: {', '.join(LANDMARK_MODELS)}")
+        self.model = model
+        self.upsample = upsample
+        self.landmark_model = landmarks
+        self.num_jitters = num_jitters
+        self._detector = None
+        self._predictor = None
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._encoder is not None
+
+    def load(self):
+        """Load the dlib models (once)"""
+        with self._lock:
+            if self._encoder is not None:
+                return
+            if self.model == "cnn":
+                self._detector = dlib.cnn_face_detection_model_v1(
+                    face_recognition_models.cnn_face_detector_model_location()
+                )
+            else:
+                self._detector = dlib.get_frontal_face_detector()
+            self._predictor = dlib.shape_predictor(
+                face_recognition_models.pose_predictor_five_point_model_location()
+                if self.landmark_model == "small"
+                else face_recognition_models.pose_predictor_model_location()
+            )
+            self._encoder = dlib.face_recognition_model_v1(
+                face_recognition_models.face_recognition_model_location()
+            )
+
+    def warm_up(self):
+        """Load the models and run them once, so the first real scan pays no cold start"""
+        self.load()
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        self.detect(blank)
+        self.encode(blank, [(8, 56, 56, 8)])
+
+    def detect(self, image, max_side=DETECTION_MAX_SIDE):
+        """
+        Find face boxes, detecting on a copy scaled down to max_side
+
+        Args:
+            image (np.ndarray): RGB image
+            max_side (int): Longest side used for detection, 0 for full resolution
+
+        Returns:
+            list: (top, right, bottom, left) boxes in the coordinates of `image`
+        """
+        if not self.loaded:
+            self.load()
+        height, width = image.shape[:2]
+        factor = 1.0
+        detection_image = image
+        if max_side and max(height, width) > max_side:
+            factor = max_side / max(height, width)
+            detection_image = _resize(image, factor)
+
+        rects = self._detector(np.ascontiguousarray(detection_image), self.upsample)
+        if self.model == "cnn":
+            rects = [detection.rect for detection in rects]
+
+        # Map boxes back to the full-size image, trimmed to its bounds
+        return [
+            (
+                max(0, int(round(rect.top() / factor))),
+                min(width, int(round(rect.right() / factor))),
+                min(height, int(round(rect.bottom() / factor))),
+                max(0, int(round(rect.left() / factor)))
+            )
+            for rect in rects
+        ]
+
+    def encode(self, image, face_locations, padding=ENCODING_CROP_PADDING, crop_max_side=ENCODING_CROP_MAX_SIDE,
+               aligned=None):
+        """
+        Compute a 128-d encoding for each face box in one image
+
+        Returns:
+            list: One encoding (np.ndarray) per location
+        """
+        return self.encode_many(
+            [image], [face_locations], padding, crop_max_side, None if aligned is None else [aligned]
+        )[0][1]
+
+    def encode_many(self, images, face_locations=None, padding=ENCODING_CROP_PADDING,
+                    crop_max_side=ENCODING_CROP_MAX_SIDE, aligned=None):
+        """
+        Detect and encode the faces of several images with a single encoder call
+
+        Args:
+            images (list): RGB images
+            face_locations (list): Known boxes per image; detected when None
+            aligned (list): Per image, an AlignedFace (or None) per box from
+                            align(), so those faces skip the landmark pass
+
+        Returns:
+            list: (face_locations, encodings) per image
+        """
+        if not self.loaded:
+            self.load()
+        if face_locations is None:
+            face_locations = [self.detect(image) for image in images]
+        if aligned is None:
+            aligned = [[None] * len(boxes) for boxes in face_locations]
+
+        chips, owners = [], []
+        for index, (image, boxes) in enumerate(zip(images, face_locations)):
+            for box, face in zip(boxes, aligned[index]):
+                if face is None:
+                    face = self._align(image, box, padding, crop_max_side)
+                chips.append(dlib.get_face_chip(face.crop, face.shape, size=CHIP_SIZE, padding=CHIP_PADDING))
+                owners.append(index)
+
+        encodings = [[] for _ in images]
+        if chips:
+            descriptors = self._encoder.compute_face_descriptor(chips, self.num_jitters)
+            for index, descriptor in zip(owners, descriptors):
+                encodings[index].append(np.array(descriptor))
+        return list(zip(face_locations, encodings))
+
+    def align(self, image, face_locations, padding=ENCODING_CROP_PADDING, crop_max_side=ENCODING_CROP_MAX_SIDE):
+        """
+        Find the landmarks of each face box, ready to be passed on to encode()
+
+        Returns:
+            list: One AlignedFace per box
+        """
+        if not self.loaded:
+            self.load()
+        return [self._align(image, box, padding, crop_max_side) for box in face_locations]
+
+    @staticmethod
+    def points(face):
+        """
+        Landmarks of an AlignedFace as a (points x 2) array of (x, y) crop
+        coordinates, 5 or 68 points depending on the landmark model
+        """
+        return np.array([(p.x, p.y) for p in face.shape.parts()], dtype=np.float32)
+
+    def _align(self, image, box, padding, crop_max_side):
+        """
+        Landmark shape of one face, for its aligned 150x150 chip.
+
+        Landmarks are found on a padded crop around the box, scaled down so its
+        longest side is at most crop_max_side; the encoder only ever sees the
+        150x150 chip, so nothing it needs is lost.
+        """
+        top, right, bottom, left = box
+        height, width = image.shape[:2]
+        pad_y = int((bottom - top) * padding)
+        pad_x = int((right - left) * padding)
+        crop_top, crop_left = max(0, top - pad_y), max(0, left - pad_x)
+        crop_bottom, crop_right = min(height, bottom + pad_y), min(width, right + pad_x)
+        crop = image[crop_top:crop_bottom, crop_left:crop_right]
+
+        factor = 1.0
+        if crop_max_side and max(crop.shape[:2]) > crop_max_side:
+            factor = crop_max_side / max(crop.shape[:2])
+            crop = _resize(crop, factor)
+        crop = np.ascontiguousarray(crop)
+
+        rect = dlib.rectangle(
+            int((left - crop_left) * factor),
+            int((top - crop_top) * factor),
+            int((right - crop_left) * factor),
+            int((bottom - crop_top) * factor)
+        )
+        return AlignedFace(crop, self._predictor(crop, rect))
+
+
+# Shared engine used by face_utils, the worker processes and services.face_recognition
+face_engine = FaceEngine()
@@ -1,19 +1,25 @@
-import face_recognition
-import numpy as np
-import io
+import logging
 
+from services.face_engine import face_engine
+from services.image_ingest import decode_image, read_upload
+from services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+@stage("decode")
 def load_image_from_stream(file_stream):
     """
     Loads an image from a file stream (e.g., Flask's request.files).
     Returns a NumPy array representation of the image.
     """
     try:
-        image = face_recognition.load_image_file(file_stream)
+        image, _ = decode_image(read_upload(file_stream), max_side=0, reuse=False)
         return image
     except Exception as e:
-        print(f"Error loading image from stream: {e}")
+        logger.error(f"Error loading image from stream: {e}")
         return None
 
+@stage("encode")
 def get_face_encodings_from_image(image_array):
     """
     Detects faces in an image and returns their encodings.
@@ -26,14 +32,13 @@ def get_face_encodings_from_image(image_array):
     if image_array is None:
         return []
     try:
-        # The face_encodings function returns a list of 128-dimensional face encodings
-        # for each face in the image.
-        face_encodings = face_recognition.face_encodings(image_array)
-        return face_encodings
+        # Full-resolution detection, then one batched encoder call for every face
+        return face_engine.encode(image_array, face_engine.detect(image_array, max_side=0))
     except Exception as e:
-        print(f"Error getting face encodings: {e}")
+        logger.error(f"Error getting face encodings: {e}")
         return []
 
+@stage("detect")
 def get_face_locations(image_array):
     """
     Detects face locations in an image.
@@ -46,10 +51,9 @@ def get_face_locations(image_array):
     if image_array is None:
         return []
     try:
-        face_locations = face_recognition.face_locations(image_array)
-        return face_locations
+        return face_engine.detect(image_array, max_side=0)
     except Exception as e:
-        print(f"Error getting face locations: {e}")
+        logger.error(f"Error getting face locations: {e}")
         return []
 
 if __name__ == '__main__':
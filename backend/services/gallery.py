@@ -0,0 +1,425 @@
+import copy
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+
+from config import EMBEDDING_DIM, MATCH_THRESHOLD, GALLERY_SYNC_INTERVAL, TEMPLATE_EXPAND_CANDIDATES
+from database import db_connection
+from services.embedding_codec import decode_rows, embedding_select
+from services.matchers import create_matcher
+from services.metrics import stage
+from services.templates import TemplateStore
+
+# Columns kept alongside each embedding so a match can be answered without
+# going back to the database
+PERSON_FIELDS = ("id", "full_name", "department", "email", "phone_number")
+
+# An immutable view of the gallery. Writers build a new snapshot and swap it in,
+# so readers never see a half-applied update and never need to take the lock.
+# `codes` are the per-row codes of `matcher` and `index` its search structure;
+# a retrained matcher only takes effect with the snapshot built from it.
+_Snapshot = namedtuple("_Snapshot", ["embeddings", "sq_norms", "ids", "people", "codes", "index", "matcher"])
+
+# Result of matching one face: the accepted person, their distance, and the
+# top-k ranked (person, distance) candidates for that face
+Match = namedtuple("Match", ["person", "distance", "candidates"])
+
+
+def _as_matrix(encodings, dim):
+    """Stack one or more encodings into a contiguous float32 (N x dim) matrix"""
+    matrix = np.ascontiguousarray(encodings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if matrix.shape[1] != dim:
+        raise ValueError(f"Expected {dim}-d face encodings, got {matrix.shape[1]}-d")
+    return matrix
+
+
+def _assign_one_to_one(indices, distances, threshold):
+    """
+    Greedily pair faces with people, closest pair first, so that no person is
+    given to more than one face in the same frame.
+
+    Args:
+        indices, distances: (faces x k) ranked candidates from a matcher
+
+    Returns:
+        list: For each face, the candidate rank it was assigned, or None
+    """
+    faces, ranks = np.nonzero((indices >= 0) & (distances < threshold))
+    order = np.argsort(distances[faces, ranks], kind="stable")
+
+    chosen = [None] * len(indices)
+    taken = set()
+    for face, rank in zip(faces[order], ranks[order]):
+        row = indices[face, rank]
+        if chosen[face] is None and row not in taken:
+            chosen[face] = int(rank)
+            taken.add(row)
+    return chosen
+
+
+def read_generation():
+    """
+    Current people_records change counter, or None when the counter table
+    has not been created (migrations/002_people_listing.sql)
+    """
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('public.people_records_version') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT version FROM people_records_version WHERE id = 1")
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+class Gallery:
+    """
+    Process-resident copy of every enrolled face embedding.
+
+    Embeddings are held in one contiguous float32 (N x 128) matrix with the
+    person ids and display fields in side arrays of the same order. The
+    gallery is loaded from people_records once and then kept current by
+    add() / remove() as enrollments are committed. Changes made by other
+    processes arrive through `listener` (see services/gallery_listener.py),
+    which calls refresh() with the changed ids; without a live listener a
+    periodic sync() probe is used instead.
+
+    With `shared` set (services/shared_gallery.py) only one process on the
+    host loads and updates the gallery; the others map its published
+    snapshots read-only and leave every change to it.
+
+    Each row is a person's centroid; people with several face templates
+    also have them in `templates`, consulted by match() near the threshold.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, matcher=None):
+        self.dim = dim
+        self.matcher = matcher if matcher is not None else create_matcher()
+        self.templates = TemplateStore(dim)
+        self.listener = None
+        self.shared = None
+        # people_records_version the contents reflect (None when the counter table is missing)
+        self.generation = None
+        self._write_lock = threading.Lock()
+        self._loaded = False
+        self._synced_at = 0.0
+        self._publish(
+            np.empty((0, dim), dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+            (),
+            self.matcher.encode(np.empty((0, dim), dtype=np.float32)),
+        )
+
+    def __len__(self):
+        return len(self._snapshot.ids)
+
+    @property
+    def embeddings(self):
+        """The current (N x dim) float32 embedding matrix (read-only view)"""
+        return self._snapshot.embeddings
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    @property
+    def read_only(self):
+        """True in processes that map another process's shared snapshots"""
+        return self.shared is not None and not self.shared.writer
+
+    def load(self):
+        """Replace the gallery contents with the rows in people_records"""
+        # Read before the rows, so a change committed in between is re-applied rather than missed
+        generation = read_generation()
+        rows = self._fetch()
+
+        # Packed rows decode straight from their bytes via np.frombuffer
+        embeddings = decode_rows(rows, self.dim)
+
+        with self._write_lock:
+            matcher = self.matcher
+            if not getattr(matcher, "trained", True):
+                matcher = copy.copy(matcher)
+                matcher.train(embeddings)
+            self._publish(
+                embeddings,
+                np.array([row["id"] for row in rows], dtype=np.int64),
+                tuple(dict(row) for row in rows),
+                matcher.encode(embeddings),
+                matcher=matcher,
+            )
+            self._loaded = True
+            self._synced_at = time.monotonic()
+            self.generation = generation
+        self.templates.load()
+        return len(rows)
+
+    def sync(self):
+        """
+        Pick up rows written by other processes, such as the bulk importer.
+
+        A cheap count/max(id) probe decides whether anything changed; new
+        rows are fetched incrementally and a full reload is only done when
+        rows were also deleted elsewhere.
+
+        Returns:
+            int: Number of rows added or reloaded
+        """
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT count(*), coalesce(max(id), 0) FROM people_records")
+            count, max_id = cur.fetchone()
+        self._synced_at = time.monotonic()
+
+        ids = self._snapshot.ids
+        known_max = int(ids.max()) if len(ids) else 0
+        if count == len(ids) and max_id == known_max:
+            return 0
+
+        added = 0
+        if max_id > known_max:
+            rows = self._fetch("WHERE id > %s", (known_max,))
+            self.add_many(rows, decode_rows(rows, self.dim))
+            added = len(rows)
+        if count != len(self):
+            return self.load()
+        return added
+
+    def ensure_loaded(self):
+        """
+        Load the gallery if it has not been loaded yet (e.g. DB was down at
+        startup), and sync with the database every GALLERY_SYNC_INTERVAL seconds
+        unless a listener is applying changes as they are committed.
+        """
+        if self.shared is not None and self.shared.follow():
+            # Mapped from the writer, which does the syncing
+            return
+        if not self._loaded:
+            self.load()
+        elif self.read_only:
+            # Loaded locally until the writer publishes its first snapshot
+            return
+        elif self.listener is not None and self.listener.live:
+            return
+        else:
+            if self.listener is not None:
+                # Not listening in this process yet (e.g. a freshly forked web
+                # worker) or reconnecting; poll until it has caught up
+                self.listener.start()
+            if GALLERY_SYNC_INTERVAL and time.monotonic() - self._synced_at > GALLERY_SYNC_INTERVAL:
+                self.sync()
+
+    def refresh(self, person_ids):
+        """
+        Re-read some people from people_records: those still present are added
+        or replaced, the rest are dropped. Safe to apply more than once.
+
+        Args:
+            person_ids (list): Ids from a change notification
+
+        Returns:
+            int: Number of people still present
+        """
+        if self.read_only:
+            return 0
+        person_ids = [int(person_id) for person_id in person_ids]
+        rows = self._fetch("WHERE id = ANY(%s)", (person_ids,))
+        new_embeddings = decode_rows(rows, self.dim)
+        new_people = tuple({field: row.get(field) for field in PERSON_FIELDS} for row in rows)
+        new_ids = np.array([row["id"] for row in rows], dtype=np.int64)
+
+        with self._write_lock:
+            current = self._snapshot
+            keep = ~np.isin(current.ids, person_ids)
+            self._publish(
+                np.concatenate([current.embeddings[keep], new_embeddings]),
+                np.concatenate([current.ids[keep], new_ids]),
+                tuple(p for p, k in zip(current.people, keep) if k) + new_people,
+                np.concatenate([current.codes[keep], self.matcher.encode(new_embeddings)]),
+            )
+        self.templates.load(person_ids)
+        return len(rows)
+
+    @stage("db_fetch")
+    def _fetch(self, where="", params=()):
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"SELECT id, full_name, department, email, phone_number, {embedding_select()} "
+                f"FROM people_records {where} ORDER BY id",
+                params
+            )
+            return cur.fetchall()
+
+    def rebuild_index(self):
+        """Retrain the matcher on the current rows (e.g. after heavy enrollment)"""
+        if self.read_only:
+            return
+        with self._write_lock:
+            current = self._snapshot
+            # Train a copy: matches in flight keep searching with the matcher of their snapshot
+            matcher = copy.copy(self.matcher)
+            matcher.train(current.embeddings)
+            self._publish(current.embeddings, current.ids, current.people,
+                          matcher.encode(current.embeddings), current.sq_norms, matcher)
+
+    def add(self, person, encoding):
+        """
+        Add (or replace) a single enrolled person.
+
+        Args:
+            person (dict): Row fields, must include "id"
+            encoding: The 128-d face encoding for this person
+        """
+        self.add_many([person], [encoding])
+
+    def add_many(self, people, encodings):
+        """Add (or replace) a batch of people with one copy of the gallery matrix"""
+        if not people or self.read_only:
+            return
+        new_embeddings = _as_matrix(encodings, self.dim)
+        new_people = tuple({field: person.get(field) for field in PERSON_FIELDS} for person in people)
+        new_ids = np.array([person["id"] for person in new_people], dtype=np.int64)
+
+        with self._write_lock:
+            current = self._snapshot
+            keep = ~np.isin(current.ids, new_ids)
+            self._publish(
+                np.concatenate([current.embeddings[keep], new_embeddings]),
+                np.concatenate([current.ids[keep], new_ids]),
+                tuple(p for p, k in zip(current.people, keep) if k) + new_people,
+                np.concatenate([current.codes[keep], self.matcher.encode(new_embeddings)]),
+            )
+
+    def add_template(self, person_id, encoding, source="capture"):
+        """
+        Store another face template for an enrolled person and match them on
+        their updated centroid from now on.
+
+        Returns:
+            int: Templates now held for the person, or None if they do not exist
+        """
+        added = self.templates.add(person_id, encoding, source)
+        if added is None:
+            return None
+        person, centroid, count = added
+        self.add(person, centroid)
+        return count
+
+    def remove(self, person_id):
+        """Drop a person from the gallery. Returns True if they were present."""
+        if self.read_only:
+            return False
+        self.templates.discard(person_id)
+        with self._write_lock:
+            current = self._snapshot
+            keep = current.ids != person_id
+            if keep.all():
+                return False
+            self._publish(
+                current.embeddings[keep],
+                current.ids[keep],
+                tuple(p for p, k in zip(current.people, keep) if k),
+                current.codes[keep],
+            )
+            return True
+
+    @stage("match")
+    def match(self, encodings, threshold=MATCH_THRESHOLD, top_k=1, one_to_one=True):
+        """
+        Find the closest enrolled person for each query encoding.
+
+        All queries are searched together: the exact brute-force matcher does
+        one (queries x gallery) distance computation for the whole frame.
+
+        Args:
+            encodings: One or more 128-d face encodings
+            threshold (float): Maximum distance accepted as a match
+            top_k (int): Number of ranked candidates to return per query
+            one_to_one (bool): Never resolve two queries to the same person
+
+        Returns:
+            list: One Match per query, or None where no candidate is below the
+                  threshold (or every such candidate went to another face)
+        """
+        snapshot = self._snapshot
+        queries = _as_matrix(encodings, self.dim)
+        if len(snapshot.ids) == 0:
+            return [None] * len(queries)
+
+        # With one-to-one assignment a face may need to fall back to a
+        # runner-up, so fetch at least one candidate per face in the frame
+        k = max(top_k, len(queries) if one_to_one else 1)
+        indices, distances = snapshot.matcher.search(
+            snapshot.index, snapshot.embeddings, snapshot.sq_norms, queries, k=k
+        )
+        # Borderline faces get a second look: a shortlist of the closest centroids
+        # is re-scored against each candidate's raw templates, then cut back to k
+        near = self.templates.near_threshold(indices, distances, threshold)
+        if len(near):
+            near_indices, near_distances = indices[near], distances[near]
+            if TEMPLATE_EXPAND_CANDIDATES > k:
+                near_indices, near_distances = snapshot.matcher.search(
+                    snapshot.index, snapshot.embeddings, snapshot.sq_norms, queries[near],
+                    k=TEMPLATE_EXPAND_CANDIDATES
+                )
+            near_indices, near_distances = self.templates.refine(
+                snapshot.ids, near_indices, near_distances, queries[near], threshold
+            )
+            indices, distances = indices.copy(), distances.copy()
+            indices[near], distances[near] = near_indices[:, :k], near_distances[:, :k]
+
+        if one_to_one and len(queries) > 1:
+            chosen = _assign_one_to_one(indices, distances, threshold)
+        else:
+            chosen = [0 if indices[q, 0] >= 0 and distances[q, 0] < threshold else None
+                      for q in range(len(queries))]
+
+        results = []
+        for q, rank in enumerate(chosen):
+            if rank is None:
+                results.append(None)
+                continue
+            candidates = [
+                (snapshot.people[index], float(distance))
+                for index, distance in zip(indices[q, :top_k], distances[q, :top_k])
+                if index >= 0
+            ]
+            results.append(Match(
+                person=snapshot.people[indices[q, rank]],
+                distance=float(distances[q, rank]),
+                candidates=candidates,
+            ))
+        return results
+
+    def attach(self, embeddings, ids, people, codes, sq_norms, template_samples, generation, matcher=None):
+        """Serve a snapshot published by another process; the arrays may be read-only memory maps"""
+        with self._write_lock:
+            self._publish(embeddings, ids, people, codes, sq_norms, matcher)
+            self.templates.attach(template_samples)
+            self.generation = generation
+            self._loaded = True
+            self._synced_at = time.monotonic()
+
+    def _publish(self, embeddings, ids, people, codes, sq_norms=None, matcher=None):
+        # Called with _write_lock held
+        if matcher is not None:
+            self.matcher = matcher
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self._snapshot = _Snapshot(
+            embeddings=embeddings,
+            sq_norms=sq_norms if sq_norms is not None else np.einsum("ij,ij->i", embeddings, embeddings),
+            ids=ids,
+            people=people,
+            codes=codes,
+            index=self.matcher.prepare(codes),
+            matcher=self.matcher,
+        )
+        if self.shared is not None:
+            self.shared.changed()
+
+
+# Shared instance used by the route handlers
+gallery = Gallery()
@@ -0,0 +1,181 @@
+"""
+Keeps this process's gallery current with changes committed by any process.
+
+migrations/004_gallery_notify.sql makes every statement that writes
+people_records bump the change counter (the gallery "generation") and
+NOTIFY the changed ids. A GalleryListener thread holds its own connection
+LISTENing on that channel and hands the ids to Gallery.refresh().
+
+Generations arrive one apart, in commit order. A gap, or a payload without
+ids, means changes were missed and the gallery is reloaded. The generation
+is also compared with the database after every (re)connect and whenever
+the channel has been quiet for GALLERY_LISTEN_CHECK_INTERVAL seconds.
+"""
+import json
+import logging
+import os
+import select
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+from config import get_database_url, GALLERY_LISTEN_CHECK_INTERVAL
+from services.gallery import gallery, read_generation
+from services.metrics import registry
+
+CHANNEL = "people_records_changed"
+RECONNECT_DELAY = 5  # Seconds before reconnecting after the listening connection failed
+SETTLE_TIMEOUT = 1.0  # Seconds to wait for in-flight notifications before declaring a gap
+
+logger = logging.getLogger(__name__)
+
+events = registry.counter("frs_gallery_events_total", "Gallery change notifications by outcome")
+
+
+class GalleryListener:
+    """
+    Background thread applying people_records change notifications to a gallery.
+
+    Args:
+        gallery (Gallery): The gallery to keep current
+        channel (str): NOTIFY channel written by the people_records triggers
+        check_interval (float): Quiet seconds after which the generation is re-checked
+    """
+
+    def __init__(self, gallery, channel=CHANNEL, check_interval=GALLERY_LISTEN_CHECK_INTERVAL):
+        self.gallery = gallery
+        self.channel = channel
+        self.check_interval = check_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._caught_up = False
+        self._unsupported = False
+
+    @property
+    def live(self):
+        """True while this process is listening and its gallery is caught up"""
+        return (
+            self._caught_up
+            and self._pid == os.getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def start(self):
+        """Start listening in this process; safe to call again, e.g. after a fork"""
+        if self._unsupported:
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._caught_up = False
+        self._pid = os.getpid()
+        # Set before the thread runs, which unsets it if NOTIFY is not available
+        self.gallery.listener = self
+        self._thread = threading.Thread(target=self._run, name="gallery-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**get_database_url())
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute("SELECT to_regproc('public.notify_people_records_changed') IS NOT NULL")
+                    if not cur.fetchone()[0]:
+                        logger.warning(
+                            "migrations/004_gallery_notify.sql is not applied; "
+                            "the gallery falls back to periodic sync"
+                        )
+                        self._unsupported = True
+                        if self.gallery.listener is self:
+                            self.gallery.listener = None
+                        return
+                    cur.execute(f"LISTEN {self.channel}")
+
+                # Catch up on anything committed while we were not listening
+                self._check_generation(conn)
+                self._caught_up = True
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.check_interval) == ([], [], []):
+                        self._check_generation(conn)
+                    else:
+                        self._apply(self._drain(conn))
+            except Exception as e:
+                logger.error(f"Gallery listener error, reconnecting in {RECONNECT_DELAY}s: {e}")
+            finally:
+                self._caught_up = False
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(RECONNECT_DELAY)
+
+    def _drain(self, conn):
+        """Read every pending notification as a parsed payload"""
+        conn.poll()
+        payloads = []
+        while conn.notifies:
+            payloads.append(json.loads(conn.notifies.pop(0).payload))
+        return payloads
+
+    def _apply(self, payloads):
+        """
+        Refresh the ids of consecutive generations in one pass; reload the
+        whole gallery when a generation was skipped or came without ids.
+        """
+        if self.gallery.read_only:
+            # The process publishing the shared gallery applies changes
+            return
+        if not self.gallery.loaded or self.gallery.generation is None:
+            # Nothing to apply deltas to yet: take a full, generation-stamped load
+            self._reload("unloaded")
+            return
+
+        generation = self.gallery.generation
+        changed = set()
+        for payload in sorted(payloads, key=lambda p: p["generation"]):
+            if payload["generation"] <= generation:
+                # Already part of the last load
+                events.inc(outcome="skipped")
+                continue
+            if payload["generation"] != generation + 1 or payload.get("ids") is None:
+                self._reload("gap" if payload.get("ids") is not None else "truncated")
+                return
+            changed.update(payload["ids"])
+            generation = payload["generation"]
+            events.inc(outcome="applied")
+
+        if changed:
+            self.gallery.refresh(sorted(changed))
+        self.gallery.generation = generation
+
+    def _check_generation(self, conn):
+        """Reload if the database is ahead of the gallery and no notification explains it"""
+        if self.gallery.read_only:
+            return
+        current = read_generation()
+        if current is None or current == self.gallery.generation:
+            return
+        if self.gallery.generation is not None and self.gallery.generation > current:
+            # The counter went backwards (e.g. the database was restored)
+            self._reload("reset")
+            return
+        # The notification may still be on its way from the committing transaction
+        if select.select([conn], [], [], SETTLE_TIMEOUT) != ([], [], []):
+            self._apply(self._drain(conn))
+        if self.gallery.generation is None or self.gallery.generation < current:
+            self._reload("behind")
+
+    def _reload(self, reason):
+        events.inc(outcome="reload", reason=reason)
+        self.gallery.load()
+        logger.info(f"Gallery reloaded ({reason}) at generation {self.gallery.generation}")
+
+
+# Listener for the shared gallery, started by app.warm_up
+gallery_listener = GalleryListener(gallery)
@@ -0,0 +1,238 @@
+"""
+One path from an uploaded image to the RGB array the face pipeline works on.
+
+read_upload() copies the request stream into a per-thread buffer that is
+reused by every request on that thread, refusing uploads over
+IMAGE_MAX_BYTES while reading and, from the header alone, images of an
+unexpected format or more than IMAGE_MAX_PIXELS pixels. decode_image()
+decodes without copying the compressed bytes again, converts only images
+that are not RGB already, and writes the pixels into a per-thread array
+rather than a new one for every image.
+"""
+import functools
+import io
+import threading
+
+import numpy as np
+from PIL import Image, ImageFile, UnidentifiedImageError
+
+from config import IMAGE_MAX_SIDE, IMAGE_MAX_BYTES, IMAGE_MAX_PIXELS, IMAGE_FORMATS
+
+# Scratch buffers grow in steps of this many bytes, so similar sizes reuse one allocation
+_GROWTH_STEP = 1 << 20
+
+_local = threading.local()
+
+
+class ImageRejected(ValueError):
+    """An upload refused before decoding; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable file over a bytes-like object, so PIL can read it without a copy"""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = (0, self._position, len(self._view))[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, b):
+        count = max(0, min(len(b), len(self._view) - self._position))
+        b[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+
+def _scratch(name, size, factory):
+    """This thread's reusable buffer `name`, grown to at least size bytes"""
+    buffer = getattr(_local, name, None)
+    if buffer is None or len(buffer) < size:
+        buffer = factory(-(-size // _GROWTH_STEP) * _GROWTH_STEP)
+        setattr(_local, name, buffer)
+    return buffer
+
+
+@functools.lru_cache(maxsize=None)
+def _openers(formats):
+    """The formats PIL can open, so a name it lacks (e.g. WEBP without libwebp) is skipped"""
+    Image.init()
+    return [name for name in formats if name in Image.OPEN]
+
+
+def open_image(image_data, max_pixels=IMAGE_MAX_PIXELS, formats=IMAGE_FORMATS):
+    """
+    Open an image lazily and check it; only the header is read.
+
+    Args:
+        image_data (bytes-like): The raw image data
+        max_pixels (int): Largest width * height accepted, 0 for no limit
+        formats (list): PIL format names to accept
+
+    Returns:
+        PIL.Image.Image: The opened, not yet decoded, image
+
+    Raises:
+        ImageRejected: Unknown format (415) or too many pixels (413)
+    """
+    stream = io.BytesIO(image_data) if isinstance(image_data, bytes) else _BufferReader(image_data)
+    try:
+        img = Image.open(stream, formats=_openers(tuple(formats)))
+    except UnidentifiedImageError:
+        raise ImageRejected(f"Unsupported image format; expected one of {', '.join(formats)}", 415)
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(str(e), 413)
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageRejected(f"Image is {width}x{height}; at most {max_pixels} pixels are accepted", 413)
+    return img
+
+
+def _readinto(stream, view):
+    """stream.readinto(view), for streams without it (SpooledTemporaryFile before Python 3.11)"""
+    if hasattr(stream, 'readinto'):
+        return stream.readinto(view)
+    data = stream.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+
+def read_upload(source, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Read an uploaded image into this thread's reusable upload buffer.
+
+    Args:
+        source: A werkzeug FileStorage or a binary stream such as request.stream
+        max_bytes (int): Largest upload accepted
+
+    Returns:
+        memoryview: The upload, valid until the next read_upload() on this
+                    thread; copy it (bytes(...)) to keep it past the request
+
+    Raises:
+        ImageRejected: Empty (400) or too large (413) upload, or see open_image()
+    """
+    stream = getattr(source, 'stream', source)
+    too_large = ImageRejected(f"Image is larger than {max_bytes} bytes", 413)
+
+    size = None
+    if getattr(stream, 'seekable', lambda: False)():
+        position = stream.tell()
+        size = stream.seek(0, io.SEEK_END) - position
+        stream.seek(position)
+        if size > max_bytes:
+            raise too_large
+
+    # One spare byte tells an upload of exactly max_bytes from a larger one
+    view = memoryview(_scratch("upload", min(size or _GROWTH_STEP, max_bytes) + 1, bytearray))
+    view = view[:max_bytes + 1]
+    count = 0
+    while True:
+        if count == len(view):
+            if count > max_bytes:
+                raise too_large
+            grown = memoryview(_scratch("upload", min(2 * count, max_bytes + 1), bytearray))
+            grown[:count] = view[:count]
+            view = grown[:max_bytes + 1]
+        read = _readinto(stream, view[count:])
+        if not read:
+            break
+        count += read
+
+    if not count:
+        raise ImageRejected("Empty image upload", 400)
+    data = view[:count]
+    open_image(data)
+    return data
+
+
+def _pixels(img, reuse):
+    """
+    Copy a decoded RGB image's pixels into an (height, width, 3) array.
+
+    np.asarray(img) would go through img.tobytes(), which holds the pixels
+    twice (the chunks and their join); the raw encoder's chunks are copied
+    straight into the destination instead. That encoder is not public Pillow
+    API, so if it is missing or behaves differently img.tobytes() is used.
+    """
+    width, height = img.size
+    size = width * height * 3
+    if reuse:
+        flat = _scratch("pixels", size, lambda n: np.empty(n, dtype=np.uint8))[:size]
+    else:
+        flat = np.empty(size, dtype=np.uint8)
+    if size:
+        img.load()
+        try:
+            _copy_raw(img, flat)
+        except (AttributeError, TypeError, ValueError, RuntimeError, OSError):
+            flat[:] = np.frombuffer(img.tobytes(), dtype=np.uint8)
+    pixels = flat.reshape(height, width, 3)
+    pixels.flags.writeable = False
+    return pixels
+
+
+def _copy_raw(img, flat):
+    """Stream the raw RGB encoding of img into flat, one chunk at a time"""
+    width = img.size[0]
+    encoder = Image._getencoder('RGB', 'raw', 'RGB')
+    encoder.setimage(img.im, (0, 0) + img.size)
+    chunk_size = max(ImageFile.MAXBLOCK, width * 4)
+    offset = 0
+    while True:
+        _, status, chunk = encoder.encode(chunk_size)
+        flat[offset:offset + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+        offset += len(chunk)
+        if status:
+            break
+    if status < 0 or offset != len(flat):
+        raise RuntimeError(f"Raw encoder stopped after {offset} of {len(flat)} bytes (status {status})")
+
+
+def decode_image(image_data, max_side=IMAGE_MAX_SIDE, reuse=True):
+    """
+    Decode raw image bytes to an RGB array no larger than max_side.
+
+    JPEGs are decoded at a reduced size with PIL's draft() mode when the
+    original is much larger, which skips most of the decoding work.
+
+    Args:
+        image_data (bytes-like): The raw image data
+        max_side (int): Longest side of the returned image, 0 for no limit
+        reuse (bool): Decode into this thread's reusable array; the result is
+                      then only valid until the next decode on this thread
+
+    Returns:
+        tuple: (image, scale) where original coordinates = image coordinates * scale
+    """
+    img = open_image(image_data)
+    original_width = img.size[0]
+
+    if max_side and max(img.size) > max_side:
+        # draft() picks the smallest JPEG scale (1/2, 1/4, 1/8) still >= the request
+        ratio = max_side / max(img.size)
+        img.draft('RGB', (int(img.size[0] * ratio), int(img.size[1] * ratio)))
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    return _pixels(img, reuse), original_width / img.size[0]
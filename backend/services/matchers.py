@@ -0,0 +1,548 @@
+"""
+Nearest-neighbour search engines for the face gallery.
+
+The gallery owns the float32 embedding matrix; a matcher decides how to search
+it. Every matcher can attach a per-row code array (e.g. the IVF list of each
+row, or a row's quantized vector) which the gallery keeps aligned with its
+rows through adds and removes.
+"""
+import os
+
+import numpy as np
+
+from config import (
+    EMBEDDING_DIM, MATCHER_BACKEND, IVF_LISTS, IVF_PROBE, IVF_MIN_TRAIN_SIZE, IVF_INDEX_PATH,
+    QUANT_PCA_DIM, QUANT_CODE, QUANT_PQ_SUBVECTORS, QUANT_RERANK, QUANT_MIN_TRAIN_SIZE, QUANT_INDEX_PATH
+)
+
+# Rows per block when computing large distance matrices, to bound temporary memory
+_CHUNK_ROWS = 65536
+# Rows per block of a quantized scan; small enough for the decoded block to stay in cache
+_SCAN_ROWS = 8192
+
+
+def pairwise_distances(queries, embeddings, sq_norms=None):
+    """
+    Euclidean distances between every query and every gallery row.
+
+    Same metric as face_recognition.face_distance, computed as
+    ||q||^2 + ||g||^2 - 2 q.g so the whole (queries x gallery) block is a
+    single matrix product.
+    """
+    if sq_norms is None:
+        sq_norms = np.einsum("ij,ij->i", embeddings, embeddings)
+    sq = np.einsum("ij,ij->i", queries, queries)[:, None] + sq_norms[None, :]
+    sq -= 2.0 * (queries @ embeddings.T)
+    np.maximum(sq, 0.0, out=sq)
+    return np.sqrt(sq, out=sq)
+
+
+def top_k(distances, k):
+    """
+    Return (indices, distances) of the k smallest entries per row, nearest first.
+    Rows with fewer than k columns are padded with index -1 and distance inf.
+    """
+    n_queries, n_rows = distances.shape
+    take = min(k, n_rows)
+    indices = np.full((n_queries, k), -1, dtype=np.int64)
+    best = np.full((n_queries, k), np.inf, dtype=np.float32)
+    if take == 0:
+        return indices, best
+
+    if take < n_rows:
+        part = np.argpartition(distances, take - 1, axis=1)[:, :take]
+    else:
+        part = np.broadcast_to(np.arange(n_rows), (n_queries, n_rows))
+    part_distances = np.take_along_axis(distances, part, axis=1)
+    order = np.argsort(part_distances, axis=1, kind="stable")
+    indices[:, :take] = np.take_along_axis(part, order, axis=1)
+    best[:, :take] = np.take_along_axis(part_distances, order, axis=1)
+    return indices, best
+
+
+def nearest_centroid(embeddings, centroids):
+    """Index of the closest centroid for every row, computed in bounded blocks"""
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    for start in range(0, len(embeddings), _CHUNK_ROWS):
+        block = embeddings[start:start + _CHUNK_ROWS]
+        # ||x||^2 is the same for every centroid and sqrt keeps the order, so both are skipped
+        assignments[start:start + len(block)] = np.argmin(sq_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+    return assignments
+
+
+def kmeans(sample, n_clusters, iterations, rng):
+    """
+    Lloyd's k-means, seeded from random sample rows.
+
+    Returns:
+        np.ndarray: (n_clusters x dim) float32 centroids
+    """
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroid(sample, centroids)
+        # Per-cluster sums, one bincount per dimension (much faster than np.add.at)
+        sums = np.stack([
+            np.bincount(assignments, weights=sample[:, d], minlength=n_clusters) for d in range(sample.shape[1])
+        ], axis=1)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters on random sample points so no cluster stays dead
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+class Matcher:
+    """
+    Interface for gallery search backends.
+
+    Subclasses override encode() to produce per-row codes, prepare() to turn
+    those codes into a search structure, and search() to answer queries.
+    """
+
+    name = None
+
+    def train(self, embeddings):
+        """Fit any learned parameters from the full gallery. Default: nothing to learn."""
+
+    def encode(self, embeddings):
+        """Per-row codes stored alongside the gallery rows"""
+        return np.zeros(len(embeddings), dtype=np.int32)
+
+    def prepare(self, codes):
+        """Build the search structure for a gallery snapshot from its row codes"""
+        return None
+
+    def search(self, index, embeddings, sq_norms, queries, k=1):
+        """
+        Find the k nearest gallery rows for each query.
+
+        Returns:
+            tuple: (indices, distances), both (queries x k), nearest first
+        """
+        raise NotImplementedError
+
+    def params(self):
+        """Learned parameters as named arrays, e.g. to publish with a shared gallery snapshot"""
+        return {}
+
+    def set_params(self, params):
+        """Adopt the params() of a matcher of the same kind. Default: nothing learned."""
+
+
+class BruteForceMatcher(Matcher):
+    """Exact search: every query against every row. The reference implementation."""
+
+    name = "brute"
+
+    def search(self, index, embeddings, sq_norms, queries, k=1):
+        return top_k(pairwise_distances(queries, embeddings, sq_norms), k)
+
+
+class _InvertedLists:
+    """Rows grouped by IVF list: order[offsets[i]:offsets[i + 1]] are the rows of list i"""
+
+    def __init__(self, codes, n_lists):
+        self.order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=n_lists)
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        # Unassigned rows (code -1) sort to the front; skip past them
+        self.offsets[0] = np.count_nonzero(codes < 0)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.offsets[1:] += self.offsets[0]
+        self.unassigned = self.order[:self.offsets[0]]
+
+
+class IVFMatcher(Matcher):
+    """
+    Inverted-file approximate search.
+
+    Rows are clustered around n_lists k-means centroids. A query only looks
+    at the rows in its n_probe closest lists, and those candidates are then
+    re-ranked with exact float distances, so any match it returns has the
+    same distance the brute-force matcher would report.
+
+    Knobs:
+        n_lists: more lists = smaller lists = faster scans, lower recall
+        n_probe: more probed lists = higher recall, slower scans
+        min_train_size: below this many rows the gallery is searched exactly
+    """
+
+    name = "ivf"
+
+    def __init__(self, n_lists=IVF_LISTS, n_probe=IVF_PROBE, min_train_size=IVF_MIN_TRAIN_SIZE,
+                 iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, embeddings):
+        """Run k-means over (a sample of) the gallery to place the list centroids"""
+        if len(embeddings) < max(self.min_train_size, self.n_lists):
+            self.centroids = None
+            return
+
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(embeddings), self.n_lists * 256)
+        sample = embeddings[rng.choice(len(embeddings), sample_size, replace=False)]
+        self.centroids = kmeans(sample, self.n_lists, self.iterations, rng)
+
+    def encode(self, embeddings):
+        if not self.trained:
+            return np.full(len(embeddings), -1, dtype=np.int32)
+        return nearest_centroid(embeddings, self.centroids)
+
+    def prepare(self, codes):
+        if not self.trained:
+            return None
+        return _InvertedLists(codes, self.n_lists)
+
+    def search(self, index, embeddings, sq_norms, queries, k=1):
+        if index is None:
+            return top_k(pairwise_distances(queries, embeddings, sq_norms), k)
+
+        n_probe = min(self.n_probe, self.n_lists)
+        probe_distances = pairwise_distances(queries, self.centroids)
+        probes = np.argpartition(probe_distances, n_probe - 1, axis=1)[:, :n_probe]
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            candidates = np.concatenate(
+                [index.order[index.offsets[i]:index.offsets[i + 1]] for i in lists]
+                + [index.unassigned]
+            )
+            if len(candidates) < k:
+                # Too few rows in the probed lists: answer this query exactly
+                candidates = np.arange(len(embeddings))
+            # Exact re-rank of the shortlist
+            exact = pairwise_distances(queries[q:q + 1], embeddings[candidates], sq_norms[candidates])
+            local, best = top_k(exact, k)
+            found = local[0] >= 0
+            indices[q, found] = candidates[local[0, found]]
+            distances[q] = best[0]
+        return indices, distances
+
+    def params(self):
+        return {"centroids": self.centroids} if self.trained else {}
+
+    def set_params(self, params):
+        centroids = params.get("centroids")
+        self.centroids = None if centroids is None else np.ascontiguousarray(centroids, dtype=np.float32)
+        if self.centroids is not None:
+            self.n_lists = len(self.centroids)
+
+    def save(self, path):
+        """Persist the trained centroids and knobs so workers can skip training"""
+        if not self.trained:
+            raise ValueError("IVF matcher has not been trained")
+        np.savez(path, centroids=self.centroids, n_probe=self.n_probe,
+                 min_train_size=self.min_train_size)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            centroids = data["centroids"].astype(np.float32)
+            matcher = cls(n_lists=len(centroids), n_probe=int(data["n_probe"]),
+                          min_train_size=int(data["min_train_size"]))
+        matcher.centroids = np.ascontiguousarray(centroids)
+        return matcher
+
+
+class _QuantizedIndex:
+    """Row codes, plus each row's squared reconstructed norm for the 'float' and 'sq8' scans"""
+
+    def __init__(self, codes, row_sq_norms=None):
+        self.codes = codes
+        self.row_sq_norms = row_sq_norms
+
+
+class QuantizedMatcher(Matcher):
+    """
+    Two-stage approximate search over compressed rows.
+
+    Rows are projected onto their top pca_dim principal components and stored
+    as codes: 'float' keeps the projection as float32, 'sq8' stores every
+    component as one byte, and 'pq' splits the projection into pq_subvectors
+    pieces and stores each as the index (one byte) of its nearest of 256
+    k-means centroids. A query scans the codes for its `rerank` closest rows,
+    and that shortlist is re-ranked with exact float distances, so any match
+    it returns has the same distance the brute-force matcher would report.
+    The compression only costs accuracy when a true match misses the shortlist.
+
+    Knobs:
+        pca_dim: fewer dimensions = smaller codes, faster scans, lower recall
+        code: 'float', 'sq8' or 'pq', from largest and most accurate to smallest
+        rerank: longer shortlist = higher recall, more exact distances per query
+        min_train_size: below this many rows the gallery is searched exactly
+    """
+
+    name = "quantized"
+    CODES = ("float", "sq8", "pq")
+    # Centroids per product-quantizer subvector, so a subvector code fits in one byte
+    PQ_CENTROIDS = 256
+
+    def __init__(self, pca_dim=QUANT_PCA_DIM, code=QUANT_CODE, pq_subvectors=QUANT_PQ_SUBVECTORS,
+                 rerank=QUANT_RERANK, min_train_size=QUANT_MIN_TRAIN_SIZE, dim=EMBEDDING_DIM,
+                 iterations=10, sample_size=100000, seed=0):
+        if code not in self.CODES:
+            raise ValueError(f"Unknown quantizer code '{code}'. Choose from: {', '.join(self.CODES)}")
+        reduced_dim = pca_dim if 0 < pca_dim < dim else dim
+        if code == "pq" and reduced_dim % pq_subvectors:
+            raise ValueError(f"{pq_subvectors} PQ subvectors do not divide {reduced_dim} dimensions")
+        self.dim = dim
+        self.pca_dim = pca_dim
+        self.code = code
+        self.pq_subvectors = pq_subvectors
+        self.rerank = rerank
+        self.min_train_size = min_train_size
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.mean = None        # (dim,) mean of the training rows
+        self.components = None  # (dim x pca_dim) principal axes; None = no reduction
+        self.low = None         # 'sq8': value of code 0 per component
+        self.step = None        # 'sq8': value of one code step per component
+        self.codebooks = None   # 'pq': (pq_subvectors x 256 x subvector dim) centroids
+
+    @property
+    def trained(self):
+        return self.mean is not None
+
+    def train(self, embeddings):
+        """Fit the projection and quantizer to (a sample of) the gallery"""
+        self.mean = self.components = self.low = self.step = self.codebooks = None
+        if len(embeddings) < max(self.min_train_size, self.PQ_CENTROIDS if self.code == "pq" else 1):
+            return
+
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(embeddings), self.sample_size)
+        sample = np.asarray(embeddings[rng.choice(len(embeddings), sample_size, replace=False)],
+                            dtype=np.float32)
+        mean = sample.mean(axis=0)
+        centered = sample - mean
+        components = None
+        if 0 < self.pca_dim < sample.shape[1]:
+            # Eigenvectors of the covariance, largest variance first
+            _, vectors = np.linalg.eigh(np.cov(centered, rowvar=False))
+            components = np.ascontiguousarray(vectors[:, ::-1][:, :self.pca_dim], dtype=np.float32)
+            centered = centered @ components
+
+        if self.code == "sq8":
+            low, high = centered.min(axis=0), centered.max(axis=0)
+            self.low = low.astype(np.float32)
+            self.step = np.maximum((high - low) / 255, np.finfo(np.float32).tiny).astype(np.float32)
+        elif self.code == "pq":
+            # The sample is already shuffled; 64 rows per centroid are plenty for the codebooks
+            training = centered[:self.PQ_CENTROIDS * 64]
+            self.codebooks = np.stack([
+                kmeans(np.ascontiguousarray(block), self.PQ_CENTROIDS, self.iterations, rng)
+                for block in np.split(training, self.pq_subvectors, axis=1)
+            ])
+        self.mean, self.components = mean.astype(np.float32), components
+
+    def encode(self, embeddings):
+        width = self.pq_subvectors if self.code == "pq" else self._reduced_dim
+        codes = np.zeros((len(embeddings), width), dtype=np.float32 if self.code == "float" else np.uint8)
+        if not self.trained:
+            # Placeholders shaped like trained codes; training is always followed by re-encoding every row
+            return codes
+        for start in range(0, len(embeddings), _CHUNK_ROWS):
+            reduced = self._reduce(embeddings[start:start + _CHUNK_ROWS])
+            if self.code == "sq8":
+                reduced = np.clip(np.rint((reduced - self.low) / self.step), 0, 255)
+            elif self.code == "pq":
+                reduced = np.stack([
+                    nearest_centroid(np.ascontiguousarray(block), codebook)
+                    for block, codebook in zip(np.split(reduced, self.pq_subvectors, axis=1), self.codebooks)
+                ], axis=1)
+            codes[start:start + len(reduced)] = reduced
+        return codes
+
+    def prepare(self, codes):
+        if not self.trained:
+            return None
+        if self.code == "pq":
+            return _QuantizedIndex(codes)
+        row_sq_norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _CHUNK_ROWS):
+            block = self._reconstruct(codes[start:start + _CHUNK_ROWS])
+            row_sq_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        return _QuantizedIndex(codes, row_sq_norms)
+
+    def search(self, index, embeddings, sq_norms, queries, k=1):
+        if index is None:
+            return top_k(pairwise_distances(queries, embeddings, sq_norms), k)
+
+        coarse = self.coarse_distances(index, queries)
+        shortlist = min(len(embeddings), max(self.rerank, k))
+        if shortlist < len(embeddings):
+            candidates = np.argpartition(coarse, shortlist - 1, axis=1)[:, :shortlist]
+        else:
+            candidates = np.broadcast_to(np.arange(len(embeddings)), coarse.shape)
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for q, rows in enumerate(candidates):
+            # Exact re-rank of the shortlist
+            exact = pairwise_distances(queries[q:q + 1], embeddings[rows], sq_norms[rows])
+            local, best = top_k(exact, k)
+            found = local[0] >= 0
+            indices[q, found] = rows[local[0, found]]
+            distances[q] = best[0]
+        return indices, distances
+
+    def coarse_distances(self, index, queries):
+        """
+        Approximate distances from each query to every row, from the codes alone.
+
+        Only their order is meaningful: terms that are the same for every row
+        of a query are left out.
+
+        Returns:
+            np.ndarray: (queries x rows) float32
+        """
+        reduced = self._reduce(queries)
+        codes = index.codes
+        coarse = np.empty((len(queries), len(codes)), dtype=np.float32)
+        if self.code == "pq":
+            # Asymmetric distance: a table of squared distances from each query
+            # subvector to its codebook, summed over a row's codes
+            tables = np.stack([
+                np.square(block[:, None, :] - codebook[None, :, :]).sum(axis=2)
+                for block, codebook in zip(np.split(reduced, self.pq_subvectors, axis=1), self.codebooks)
+            ], axis=1)
+            coarse[:] = 0.0
+            for q, table in enumerate(tables):
+                for j in range(self.pq_subvectors):
+                    coarse[q] += table[j].take(codes[:, j])
+            return coarse
+
+        # ||x||^2 - 2 x.q with x = low + step * code; the low.q term is per query
+        weights = reduced if self.code == "float" else reduced * self.step
+        # 'float' codes are used in place; 'sq8' blocks are decoded to float32 one at a time
+        rows = _CHUNK_ROWS if self.code == "float" else _SCAN_ROWS
+        for start in range(0, len(codes), rows):
+            block = codes[start:start + rows].astype(np.float32, copy=False)
+            end = start + len(block)
+            coarse[:, start:end] = index.row_sq_norms[start:end] - 2.0 * (weights @ block.T)
+        return coarse
+
+    def params(self):
+        if not self.trained:
+            return {}
+        params = {"mean": self.mean}
+        for name in ("components", "low", "step", "codebooks"):
+            if getattr(self, name) is not None:
+                params[name] = getattr(self, name)
+        return params
+
+    def set_params(self, params):
+        self.mean = params.get("mean")
+        self.components = params.get("components")
+        self.low = params.get("low")
+        self.step = params.get("step")
+        self.codebooks = params.get("codebooks")
+        if self.codebooks is not None:
+            self.code, self.pq_subvectors = "pq", len(self.codebooks)
+        elif self.low is not None:
+            self.code = "sq8"
+        elif self.mean is not None:
+            self.code = "float"
+        if self.mean is not None:
+            self.dim = len(self.mean)
+            self.pca_dim = 0 if self.components is None else self.components.shape[1]
+
+    def save(self, path):
+        """Persist the trained projection, quantizer and knobs so workers can skip training"""
+        if not self.trained:
+            raise ValueError("Quantized matcher has not been trained")
+        np.savez(path, rerank=self.rerank, min_train_size=self.min_train_size, **self.params())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            params = {name: data[name] for name in data.files if name not in ("rerank", "min_train_size")}
+            matcher = cls(rerank=int(data["rerank"]), min_train_size=int(data["min_train_size"]),
+                          dim=len(params["mean"]), code="float", pca_dim=0)
+        matcher.set_params(params)
+        return matcher
+
+    @property
+    def _reduced_dim(self):
+        return self.pca_dim if 0 < self.pca_dim < self.dim else self.dim
+
+    def _reduce(self, vectors):
+        centered = np.asarray(vectors, dtype=np.float32) - self.mean
+        return centered if self.components is None else centered @ self.components
+
+    def _reconstruct(self, codes):
+        """The reduced vectors 'float' and 'sq8' codes stand for"""
+        if self.code == "float":
+            return codes
+        return self.low + codes.astype(np.float32) * self.step
+
+
+MATCHERS = {
+    BruteForceMatcher.name: BruteForceMatcher,
+    IVFMatcher.name: IVFMatcher,
+    QuantizedMatcher.name: QuantizedMatcher,
+}
+
+
+# Where a trained matcher of each learned backend is persisted
+INDEX_PATHS = {
+    IVFMatcher.name: IVF_INDEX_PATH,
+    QuantizedMatcher.name: QUANT_INDEX_PATH,
+}
+
+
+def create_matcher(name=MATCHER_BACKEND):
+    """Build the configured matcher, reusing a persisted index when one exists"""
+    if name not in MATCHERS:
+        raise ValueError(f"Unknown matcher '{name}'. Choose from: {', '.join(MATCHERS)}")
+    path = INDEX_PATHS.get(name)
+    if path and os.path.exists(path):
+        return MATCHERS[name].load(path)
+    return MATCHERS[name]()
+
+
+if __name__ == '__main__':
+    # Train the index of a learned backend (ivf, or quantized) from the current
+    # people_records and save it to disk:
+    #   python -m services.matchers [output_path] [backend]
+    import sys
+    from services.gallery import Gallery
+
+    backend = sys.argv[2] if len(sys.argv) > 2 else (
+        MATCHER_BACKEND if MATCHER_BACKEND in INDEX_PATHS else IVFMatcher.name
+    )
+    if backend not in INDEX_PATHS:
+        print(f"Backend must be one of: {', '.join(INDEX_PATHS)}")
+        sys.exit(1)
+    output_path = sys.argv[1] if len(sys.argv) > 1 else INDEX_PATHS[backend]
+    if not output_path:
+        print("Usage: python -m services.matchers <output_path> [backend] "
+              "(or set IVF_INDEX_PATH / QUANT_INDEX_PATH)")
+        sys.exit(1)
+
+    source = Gallery(matcher=BruteForceMatcher())
+    source.load()
+    matcher = MATCHERS[backend]()
+    matcher.train(source.embeddings)
+    if not matcher.trained:
+        print(f"Not enough embeddings to train the {backend} index: found {len(source)}, "
+              f"need at least {max(matcher.min_train_size, getattr(matcher, 'n_lists', 0))}.")
+        sys.exit(1)
+    matcher.save(output_path)
+    print(f"Saved {backend} index to {output_path}")
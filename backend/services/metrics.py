@@ -0,0 +1,245 @@
+"""
+In-process metrics for the recognition pipeline, served in the Prometheus
+text exposition format from /metrics.
+
+Pipeline code wraps its hot stages in `with stage("detect"):`. Each stage
+duration goes into the frs_stage_seconds histogram and, when the client sent
+an `X-Trace: 1` header, into a per-request trace that is returned in the
+standard Server-Timing response header.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond matching to multi-second HOG runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TRACE_HEADER = "X-Trace"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Gauge:
+    """
+    A metric whose value(s) are read from a callback at scrape time.
+
+    Used for state other components already keep (pool sizes, cache stats).
+    kind="counter" exposes monotonic totals read the same way.
+    """
+
+    def __init__(self, name, help_text, read, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        # read() returns a number, or a dict of {((label, value), ...): number}
+        self._read = read
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        try:
+            value = self._read()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for labels, item in value.items():
+                yield f"{self.name}{_format_labels(labels)} {_format_value(item)}"
+        else:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(key)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, read, kind="gauge"):
+        return self.register(Gauge(name, help_text, read, kind))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "frs_stage_seconds", "Time spent in each recognition pipeline stage"
+)
+request_seconds = registry.histogram(
+    "frs_request_seconds", "HTTP request latency by endpoint, method and status"
+)
+faces_detected = registry.counter("frs_faces_detected_total", "Faces detected in scanned images")
+face_matches = registry.counter("frs_face_matches_total", "Detected faces matched to an enrolled person")
+face_misses = registry.counter("frs_face_misses_total", "Detected faces with no match under the threshold")
+
+
+# --- Per-request stage traces ---
+
+_local = threading.local()
+
+
+def start_trace():
+    _local.trace = []
+
+
+def end_trace():
+    trace, _local.trace = getattr(_local, "trace", None), None
+    return trace
+
+
+def record_stage(name, seconds):
+    """Record a stage duration measured here or reported back by a worker process"""
+    stage_seconds.observe(seconds, stage=name)
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """Time a block (or, used as a decorator, a function) as a named pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+@contextmanager
+def collect_stages():
+    """
+    Capture the stages recorded by this thread into a list, e.g. inside a
+    worker process so the timings can be shipped back with the result.
+    """
+    previous = getattr(_local, "trace", None)
+    stages = []
+    _local.trace = stages
+    try:
+        yield stages
+    finally:
+        _local.trace = previous
+
+
+def server_timing(trace):
+    """Format a trace for the Server-Timing response header"""
+    totals = {}
+    for name, seconds in trace:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+def init_app(app):
+    """Time every request and attach Server-Timing when the client asks for a trace"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+        if request.headers.get(TRACE_HEADER, "").lower() in ("1", "true", "yes"):
+            start_trace()
+        else:
+            end_trace()
+
+    @app.after_request
+    def _finish_request_timer(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            request_seconds.observe(
+                time.perf_counter() - started,
+                endpoint=request.endpoint or "unknown",
+                method=request.method,
+                status=str(response.status_code),
+            )
+        trace = end_trace()
+        if trace:
+            response.headers["Server-Timing"] = server_timing(trace)
+        return response
@@ -0,0 +1,142 @@
+"""
+Cheap quality checks that reject useless frames and faces before encoding.
+
+The exposure check runs on a subsampled frame before face detection; the
+size, sharpness and pose checks run on each detected face before it is
+handed to the encoder. Rejections carry a reason code that is returned to
+the client and counted in frs_quality_rejections_total.
+"""
+import numpy as np
+from PIL import Image
+
+from config import (
+    QUALITY_GATE, QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS, QUALITY_MIN_SHARPNESS,
+    QUALITY_MIN_FACE_SIZE, QUALITY_MAX_YAW
+)
+from services.metrics import registry, stage
+
+# Reason codes and the message shown for each
+REASONS = {
+    "too_dark": "Image is too dark",
+    "overexposed": "Image is overexposed",
+    "face_too_small": "Face is too small",
+    "blurry": "Face is too blurry",
+    "pose": "Face is turned too far from the camera",
+}
+
+# Luma weights for RGB -> grayscale
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+# Side of the grayscale face crop sharpness is measured on, so scores do not depend on face size
+_SHARPNESS_SIDE = 64
+# Pixels sampled along the longer side for the brightness check
+_EXPOSURE_SAMPLES = 128
+
+checks = registry.counter("frs_quality_checks_total", "Frames and faces run through the quality gate")
+rejections = registry.counter("frs_quality_rejections_total", "Frames and faces rejected by the quality gate")
+
+
+def brightness(image):
+    """Mean luma (0-255) of a subsampled RGB image"""
+    step = max(1, max(image.shape[:2]) // _EXPOSURE_SAMPLES)
+    return float((image[::step, ::step].astype(np.float32) @ _LUMA).mean())
+
+
+def sharpness(image, box):
+    """Variance of the Laplacian over a face, on a fixed-size grayscale crop"""
+    top, right, bottom, left = box
+    crop = Image.fromarray(np.ascontiguousarray(image[top:bottom, left:right]))
+    gray = np.asarray(crop.convert('L').resize((_SHARPNESS_SIDE, _SHARPNESS_SIDE), Image.BILINEAR),
+                      dtype=np.float32)
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def yaw(points):
+    """
+    How far the head is turned: horizontal offset of the nose from the
+    midpoint between the eyes, divided by the distance between the eyes.
+    About 0 for a frontal face; grows towards 1 in profile. A ratio, so the
+    points may come from a shifted or rescaled crop of the image.
+    """
+    if len(points) == 5:
+        eye_a, eye_b, nose = points[0:2].mean(axis=0), points[2:4].mean(axis=0), points[4]
+    else:
+        eye_a, eye_b, nose = points[36:42].mean(axis=0), points[42:48].mean(axis=0), points[30]
+    eye_distance = float(np.linalg.norm(eye_b - eye_a))
+    if eye_distance == 0:
+        return float("inf")
+    return abs(float(nose[0] - (eye_a[0] + eye_b[0]) / 2)) / eye_distance
+
+
+@stage("quality")
+def check_frame(image):
+    """Returns a reason code when the whole frame is unusable, else None"""
+    if not QUALITY_GATE:
+        return None
+    level = brightness(image)
+    if level < QUALITY_MIN_BRIGHTNESS:
+        return "too_dark"
+    if level > QUALITY_MAX_BRIGHTNESS:
+        return "overexposed"
+    return None
+
+
+@stage("quality")
+def check_faces(image, face_locations, scale=1.0):
+    """
+    Check every detected face, cheapest test first.
+
+    Args:
+        image (np.ndarray): The decoded (possibly downscaled) RGB image
+        face_locations (list): Boxes in the coordinates of `image`
+        scale (float): From load_image(); face sizes are judged in the uploaded image's pixels
+
+    Returns:
+        tuple: (reasons, aligned); a reason code per face, or None where the
+               face is good enough to encode, and the AlignedFace found for
+               the pose check (or None) per face, to hand on to the encoder
+    """
+    aligned = [None] * len(face_locations)
+    if not QUALITY_GATE:
+        return [None] * len(face_locations), aligned
+
+    from services.face_engine import face_engine
+
+    reasons = []
+    for i, box in enumerate(face_locations):
+        top, right, bottom, left = box
+        if min(bottom - top, right - left) * scale < QUALITY_MIN_FACE_SIZE:
+            reasons.append("face_too_small")
+        elif QUALITY_MIN_SHARPNESS and sharpness(image, box) < QUALITY_MIN_SHARPNESS:
+            reasons.append("blurry")
+        elif QUALITY_MAX_YAW:
+            aligned[i] = face_engine.align(image, [box])[0]
+            reasons.append("pose" if yaw(face_engine.points(aligned[i])) > QUALITY_MAX_YAW else None)
+        else:
+            reasons.append(None)
+    return reasons, aligned
+
+
+def record(frame_reason=None, face_reasons=()):
+    """Count one gated frame (and its faces) in the web process, which serves /metrics"""
+    checks.inc(level="frame")
+    if frame_reason:
+        rejections.inc(level="frame", reason=frame_reason)
+        return
+    for reason in face_reasons:
+        checks.inc(level="face")
+        if reason:
+            rejections.inc(level="face", reason=reason)
+
+
+def rejection_body(frame_reason, rejected_faces):
+    """Response body for a frame with no usable face"""
+    reason = frame_reason or rejected_faces[0][1]
+    body = {"error": REASONS[reason], "reason": reason}
+    if rejected_faces:
+        body["rejected_faces"] = [
+            {"reason": code, "face_location": dict(zip(("top", "right", "bottom", "left"), map(int, box)))}
+            for box, code in rejected_faces
+        ]
+    return body
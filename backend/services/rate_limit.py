@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class SlidingWindowLimiter:
+    """
+    Allows at most `limit` hits per key within any `window` seconds.
+
+    Each key keeps the timestamps of its recent hits (a sliding-window log),
+    so a burst cannot straddle two fixed windows to get twice the limit.
+    Counts live in this process only. At most max_keys keys are tracked;
+    the least recently used are forgotten first.
+
+    Args:
+        limit (int): Hits allowed per window; 0 disables the limiter
+        window (float): Window length in seconds
+        max_keys (int): Bound on tracked keys, so spraying keys cannot exhaust memory
+    """
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """
+        Record an attempt for `key` unless it is over the limit.
+
+        Returns:
+            float: 0 when allowed, else seconds until the next attempt would be allowed
+        """
+        if not self.limit:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque()
+                if len(self._hits) > self.max_keys:
+                    self._hits.popitem(last=False)
+            else:
+                self._hits.move_to_end(key)
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                return hits[0] + self.window - now
+            hits.append(now)
+            return 0.0
+
+    def reset(self, key):
+        """Forget a key's hits, e.g. after a successful login"""
+        with self._lock:
+            self._hits.pop(key, None)
@@ -0,0 +1,251 @@
+"""
+Buffered log of recognized faces, for attendance and audit.
+
+Scan handlers call scan_events.record() for every accepted match. It only
+de-duplicates and appends to an in-memory buffer, so a scan never waits on
+the database. A background thread COPYs the buffer into scan_events once
+SCAN_EVENT_BATCH_SIZE events are waiting, or every SCAN_EVENT_FLUSH_INTERVAL
+seconds, and folds the same batch into attendance_daily in one transaction.
+"""
+import atexit
+import csv
+import io
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from psycopg2.extras import execute_values
+
+from config import (
+    SCAN_EVENTS, SCAN_EVENT_BATCH_SIZE, SCAN_EVENT_FLUSH_INTERVAL, SCAN_EVENT_MAX_BUFFER,
+    SCAN_EVENT_DEDUP_SECONDS, ATTENDANCE_TIMEZONE
+)
+from database import db_connection
+
+CAMERA_ID_MAX_LENGTH = 64
+_PARTITION_NAME = re.compile(r"^scan_events_(\d{8})$")
+
+logger = logging.getLogger(__name__)
+
+
+def clean_camera_id(camera_id):
+    """Printable, length-limited camera id as stored in scan_events"""
+    return "".join(ch for ch in str(camera_id or "") if ch.isprintable())[:CAMERA_ID_MAX_LENGTH]
+
+
+class ScanEventLog:
+    """
+    In-process buffer of sightings with a background COPY writer.
+
+    A sighting of a person by a camera that already logged them within
+    dedup_seconds is dropped, so someone standing in front of a camera is
+    logged about once per window instead of once per frame. De-duplication
+    is per web process.
+
+    Args:
+        batch_size (int): Buffered events that trigger an immediate flush
+        flush_interval (float): Longest time (seconds) an event waits in the buffer
+        max_buffer (int): Events kept while the database is unreachable; the oldest are dropped
+        dedup_seconds (float): Window for dropping repeat sightings, 0 logs every one
+        tz (str): Time zone whose midnight starts an attendance day
+    """
+
+    def __init__(self, batch_size=SCAN_EVENT_BATCH_SIZE, flush_interval=SCAN_EVENT_FLUSH_INTERVAL,
+                 max_buffer=SCAN_EVENT_MAX_BUFFER, dedup_seconds=SCAN_EVENT_DEDUP_SECONDS,
+                 tz=ATTENDANCE_TIMEZONE, enabled=SCAN_EVENTS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dedup_seconds = dedup_seconds
+        self.tz = ZoneInfo(tz)
+        self.enabled = enabled
+        self._buffer = []  # (seen_at epoch seconds, person_id, camera_id, endpoint, distance)
+        self._last_logged = {}  # (camera_id, person_id) -> epoch seconds of the last logged sighting
+        self._partitions = set()  # UTC days whose partition is known to exist
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            "recorded": 0,
+            "deduplicated": 0,
+            "dropped": 0,
+            "written": 0,
+            "flushes": 0,
+            "failures": 0,
+        }
+
+    def record(self, person_id, distance=None, camera_id="", endpoint="scan"):
+        """
+        Queue one sighting of an enrolled person.
+
+        Returns:
+            bool: True if queued, False if it repeated a recent sighting (or logging is off)
+        """
+        if not self.enabled:
+            return False
+        now = time.time()
+        camera_id = clean_camera_id(camera_id)
+        key = (camera_id, int(person_id))
+        with self._lock:
+            last = self._last_logged.get(key)
+            if last is not None and now - last < self.dedup_seconds:
+                self._stats["deduplicated"] += 1
+                return False
+            self._last_logged[key] = now
+            self._buffer.append((now, int(person_id), camera_id, endpoint,
+                                 None if distance is None else float(distance)))
+            self._stats["recorded"] += 1
+            self._trim()
+            full = len(self._buffer) >= self.batch_size
+        self._ensure_started()
+        if full:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        """
+        Write everything buffered so far.
+
+        Returns:
+            int: Events written; on failure they go back to the buffer for the next flush
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                cutoff = time.time() - self.dedup_seconds
+                self._last_logged = {key: seen for key, seen in self._last_logged.items() if seen > cutoff}
+            if not batch or not self.enabled:
+                return 0
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} scan events, will retry: {e}")
+                with self._lock:
+                    self._buffer[:0] = batch
+                    self._trim()
+                    self._stats["failures"] += 1
+                return 0
+            with self._lock:
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["buffered"] = len(self._buffer)
+        return stats
+
+    def _trim(self):
+        # Called with the lock held
+        excess = len(self._buffer) - self.max_buffer
+        if excess > 0:
+            del self._buffer[:excess]
+            self._stats["dropped"] += excess
+
+    def _ensure_started(self):
+        # One writer thread per process, started again after a fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="scan-event-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _write(self, batch):
+        days = {datetime.fromtimestamp(seen_at, timezone.utc).date() for seen_at, *_ in batch}
+
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        rollups = {}
+        for seen_at, person_id, camera_id, endpoint, distance in batch:
+            stamp = datetime.fromtimestamp(seen_at, timezone.utc)
+            writer.writerow((stamp.isoformat(), person_id, camera_id, endpoint,
+                             "" if distance is None else repr(distance)))
+            key = (person_id, stamp.astimezone(self.tz).date())
+            first, last, count = rollups.get(key, (stamp, stamp, 0))
+            rollups[key] = (min(first, stamp), max(last, stamp), count + 1)
+        rows.seek(0)
+
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.scan_events') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                logger.warning("migrations/005_scan_events.sql is not applied; scan events are not logged")
+                self.enabled = False
+                return
+            for day in sorted(days - self._partitions):
+                cur.execute("SELECT ensure_scan_events_partition(%s)", (day,))
+            cur.copy_expert(
+                "COPY scan_events (seen_at, person_id, camera_id, endpoint, distance) "
+                "FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (camera_id))",
+                rows
+            )
+            execute_values(
+                cur,
+                "INSERT INTO attendance_daily (person_id, day, first_seen, last_seen, sightings) VALUES %s "
+                "ON CONFLICT (day, person_id) DO UPDATE SET "
+                "first_seen = LEAST(attendance_daily.first_seen, EXCLUDED.first_seen), "
+                "last_seen = GREATEST(attendance_daily.last_seen, EXCLUDED.last_seen), "
+                "sightings = attendance_daily.sightings + EXCLUDED.sightings",
+                [(person_id, day, first, last, count) for (person_id, day), (first, last, count) in rollups.items()]
+            )
+            conn.commit()
+        self._partitions.update(days)
+
+
+def drop_partitions_before(day):
+    """
+    Drop the scan_events partitions of every UTC day before `day`.
+    attendance_daily is kept.
+
+    Returns:
+        list: Names of the dropped partitions
+    """
+    cutoff = day.strftime("%Y%m%d")
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'public.scan_events'::regclass"
+        )
+        dropped = []
+        for (name,) in cur.fetchall():
+            match = _PARTITION_NAME.match(name)
+            if match and match.group(1) < cutoff:
+                cur.execute(f'DROP TABLE public."{name}"')
+                dropped.append(name)
+        conn.commit()
+    return sorted(dropped)
+
+
+# Shared log used by the scan routes
+scan_events = ScanEventLog()
+
+
+if __name__ == '__main__':
+    # Drop scan_events partitions older than N days (default 90):
+    #   python -m services.scan_events prune [days]
+    import sys
+    from datetime import timedelta
+
+    if len(sys.argv) < 2 or sys.argv[1] != "prune":
+        print("Usage: python -m services.scan_events prune [days]")
+        sys.exit(1)
+    keep_days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    before = datetime.now(timezone.utc).date() - timedelta(days=keep_days)
+    for name in drop_partitions_before(before):
+        print(f"Dropped {name}")
@@ -0,0 +1,176 @@
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SCAN_JOB_THREADS, SCAN_JOB_QUEUE_SIZE, SCAN_JOB_RESULT_TTL
+from services.embedding_cache import content_hash
+from services.workers import PoolSaturated, JobTimeout
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    """Raised when SCAN_JOB_QUEUE_SIZE jobs are already waiting or running"""
+
+
+class ScanJob:
+    def __init__(self, key):
+        self.id = secrets.token_urlsafe(16)
+        self.key = key
+        self.status = QUEUED
+        self.result = None
+        self.result_status = None
+        self.future = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        job = {"job_id": self.id, "status": self.status, "created_at": self.created_at}
+        if self.finished_at is not None:
+            job["finished_at"] = self.finished_at
+        if self.status in (DONE, FAILED):
+            # The body and HTTP status /api/scan would have answered with
+            job["result"] = self.result
+            job["result_status"] = self.result_status
+        return job
+
+
+class ScanJobQueue:
+    """
+    In-process queue of scan jobs drained by a few dispatcher threads.
+
+    Each job runs the same scan function as /api/scan. While the face workers
+    are saturated a job waits in the queue instead of failing, so a burst of
+    uploads is absorbed here and the web threads return immediately.
+    Identical uploads with the same options are folded into one job, and
+    finished jobs are forgotten after result_ttl seconds.
+    """
+
+    def __init__(self, scan, threads=SCAN_JOB_THREADS, max_pending=SCAN_JOB_QUEUE_SIZE,
+                 result_ttl=SCAN_JOB_RESULT_TTL, retry_delay=0.1):
+        # scan(image_data, top_k=..., camera_id=...) -> (response body, HTTP status)
+        self._scan = scan
+        self.threads = threads
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.retry_delay = retry_delay
+        self._jobs = {}
+        self._by_key = {}
+        self._cond = threading.Condition()
+        self._executor = None
+
+    def submit(self, image_data, top_k=1, camera_id=""):
+        """
+        Queue a scan, or return the unfinished or fresh job for the same upload.
+
+        Returns:
+            tuple: (job, created)
+
+        Raises:
+            QueueFull: Too many unfinished jobs
+        """
+        key = (content_hash(image_data), top_k, camera_id)
+        with self._cond:
+            self._expire()
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status in (QUEUED, RUNNING, DONE):
+                return existing, False
+            if self._unfinished() >= self.max_pending:
+                raise QueueFull(f"Scan job queue is full ({self.max_pending} jobs pending)")
+            job = ScanJob(key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="scan-job")
+            job.future = self._executor.submit(self._run, job, image_data, top_k, camera_id)
+        return job, True
+
+    def get(self, job_id, wait=0):
+        """Return the job, waiting up to `wait` seconds for it to finish; None if unknown"""
+        with self._cond:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is not None and wait > 0:
+                self._cond.wait_for(lambda: job.status in FINISHED, timeout=wait)
+            return job
+
+    def cancel(self, job_id):
+        """
+        Cancel an unfinished job, or forget a finished one.
+
+        A job already running on a face worker completes there, but its
+        result is discarded.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status in FINISHED:
+                self._forget(job)
+            else:
+                job.future.cancel()
+                self._finish(job, CANCELLED)
+            return job
+
+    def stats(self):
+        with self._cond:
+            counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def _run(self, job, image_data, top_k, camera_id):
+        with self._cond:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+
+        while True:
+            try:
+                result, status = self._scan(image_data, top_k=top_k, camera_id=camera_id)
+                break
+            except PoolSaturated:
+                # Jobs wait for a free worker rather than failing like a synchronous scan
+                if job.status == CANCELLED:
+                    return
+                time.sleep(self.retry_delay)
+            except JobTimeout as e:
+                result, status = {"error": str(e)}, 504
+                break
+            except Exception as e:
+                logger.error(f"Error running scan job {job.id}: {e}")
+                result, status = {"error": f"An error occurred during face scanning: {str(e)}"}, 500
+                break
+
+        with self._cond:
+            if job.status == RUNNING:
+                job.result, job.result_status = result, status
+                self._finish(job, FAILED if status >= 500 else DONE)
+
+    def _finish(self, job, status):
+        # Called with the lock held
+        job.status = status
+        job.finished_at = time.time()
+        if status != DONE and self._by_key.get(job.key) == job.id:
+            # Only successful results are reused for identical uploads
+            del self._by_key[job.key]
+        self._cond.notify_all()
+
+    def _forget(self, job):
+        # Called with the lock held
+        self._jobs.pop(job.id, None)
+        if self._by_key.get(job.key) == job.id:
+            del self._by_key[job.key]
+
+    def _unfinished(self):
+        return sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        for job in [j for j in self._jobs.values() if j.finished_at is not None and j.finished_at < cutoff]:
+            self._forget(job)
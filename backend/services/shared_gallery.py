@@ -0,0 +1,320 @@
+"""
+One gallery for all web workers on a host, shared through memory-mapped files.
+
+One process - whichever holds the writer lock in GALLERY_SHARED_DIR - loads
+the gallery from the database, keeps it current (NOTIFY listener, or a
+background GALLERY_SYNC_INTERVAL sync while the listener is not live) and
+publishes every change as a new, immutable generation directory:
+
+    <dir>/g<ns>/embeddings.npy, sq_norms.npy, ids.npy, codes.npy,
+                  people_<field>.npy, templates.npy, template_owners.npy,
+                  matcher_<param>.npy, ...
+    <dir>/CURRENT  -> {"name": "g<ns>", "generation": ...}
+
+Every other process maps the directory CURRENT points at read-only, so the
+(N x 128) matrix sits in the page cache once however many workers there
+are, and a new worker starts with an mmap instead of a database load.
+Readers re-check CURRENT at most every GALLERY_SHARED_CHECK_INTERVAL
+seconds and take over as writer if the writer has gone away. Put the
+directory on tmpfs (e.g. /dev/shm/frs-gallery) to keep it off disk.
+"""
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from config import GALLERY_SHARED_DIR, GALLERY_SHARED_PUBLISH_DELAY, GALLERY_SHARED_CHECK_INTERVAL
+from services.gallery import gallery
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+POINTER = "CURRENT"
+LOCK_FILE = "writer.lock"
+# Generations kept on disk: the current one plus the one readers may still be switching from
+KEEP_GENERATIONS = 2
+# Person fields stored as columns; "id" comes from ids.npy
+TEXT_FIELDS = ("full_name", "department", "email", "phone_number")
+
+logger = logging.getLogger(__name__)
+
+
+class PeopleColumns:
+    """
+    Read-only sequence of person dicts over column arrays.
+
+    Stands in for the gallery's tuple of dicts: a dict is only built for the
+    rows a match actually returns.
+    """
+
+    def __init__(self, ids, columns, nulls):
+        self._ids = ids
+        self._columns = columns
+        self._nulls = nulls
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        person = {"id": int(self._ids[index])}
+        for field in TEXT_FIELDS:
+            person[field] = None if self._nulls[field][index] else self._columns[field][index].decode("utf-8")
+        return person
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class SharedGallery:
+    """
+    Publishes (writer) or maps (readers) a gallery's snapshots in `directory`.
+
+    Args:
+        gallery (Gallery): The process-local gallery to publish from or attach to
+        directory (str): Shared generation directory
+        publish_delay (float): Seconds changes are coalesced before a new generation is written
+        check_interval (float): Seconds between a reader's checks of CURRENT and the writer lock
+    """
+
+    def __init__(self, gallery, directory=GALLERY_SHARED_DIR, publish_delay=GALLERY_SHARED_PUBLISH_DELAY,
+                 check_interval=GALLERY_SHARED_CHECK_INTERVAL):
+        self.gallery = gallery
+        self.directory = directory
+        self.publish_delay = publish_delay
+        self.check_interval = check_interval
+        self.on_writer = None  # Called once this process becomes the writer
+        self._lock_file = None
+        self._lock_pid = None
+        self._attached = None  # Name of the mapped generation
+        self._pointer_stamp = None
+        self._checked_at = 0.0
+        self._dirty = threading.Event()
+        # Held by the one thread checking CURRENT and the writer lock
+        self._check_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def writer(self):
+        # A lock inherited through fork belongs to the parent, not to us
+        return self._lock_file is not None and self._lock_pid == os.getpid()
+
+    def start(self):
+        """
+        Become the writer if nobody is, otherwise map the current generation.
+
+        Returns:
+            bool: True when this process is the writer
+        """
+        with self._check_lock:
+            if self._try_lock():
+                self._become_writer()
+                return True
+            self._attach_current()
+            return False
+
+    def follow(self):
+        """
+        Reader side of Gallery.ensure_loaded: pick up a newer generation, or
+        take over when the writer has exited.
+
+        Returns:
+            bool: True while a shared generation is mapped
+        """
+        if self.writer:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval and self._check_lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                if self._try_lock():
+                    self._become_writer()
+                    return False
+                self._attach_current()
+            finally:
+                self._check_lock.release()
+        return self._attached is not None
+
+    def changed(self):
+        """Called on every gallery snapshot swap; the writer schedules a publish"""
+        if self.writer:
+            self._dirty.set()
+
+    def publish(self):
+        """Write the gallery's current snapshot as a new generation and point CURRENT at it"""
+        snapshot = self.gallery._snapshot
+        # Time-ordered names sort correctly across writers after a takeover
+        name = f"g{time.time_ns():020d}"
+        staging = os.path.join(self.directory, f".{name}")
+        os.makedirs(staging)
+
+        def save(filename, array):
+            np.save(os.path.join(staging, filename), np.ascontiguousarray(array))
+
+        save("embeddings.npy", snapshot.embeddings)
+        save("sq_norms.npy", snapshot.sq_norms)
+        save("ids.npy", snapshot.ids)
+        save("codes.npy", snapshot.codes)
+        for field in TEXT_FIELDS:
+            values = [person.get(field) for person in snapshot.people]
+            save(f"people_{field}.npy", np.array(
+                [b"" if value is None else str(value).encode("utf-8") for value in values], dtype=np.bytes_
+            ))
+            save(f"people_{field}_null.npy", np.array([value is None for value in values], dtype=bool))
+
+        samples = self.gallery.templates._samples
+        owners = sorted(samples)
+        save("template_owners.npy", np.repeat(
+            np.array(owners, dtype=np.int64), [len(samples[owner]) for owner in owners]
+        ))
+        save("templates.npy", np.concatenate([samples[owner] for owner in owners])
+             if owners else np.empty((0, self.gallery.dim), dtype=np.float32))
+
+        # Learned matcher parameters (IVF centroids, quantizer), so readers search the same codes
+        matcher_params = snapshot.matcher.params()
+        for key, value in matcher_params.items():
+            save(f"matcher_{key}.npy", value)
+
+        os.rename(staging, os.path.join(self.directory, name))
+        self._write_pointer({"name": name, "generation": self.gallery.generation, "rows": len(snapshot.ids),
+                             "matcher": sorted(matcher_params)})
+        self._prune(keep=name)
+        return name
+
+    def _become_writer(self):
+        logger.info(f"This process (pid {os.getpid()}) now publishes the shared gallery")
+        self._attached = None
+        if self.on_writer is not None:
+            try:
+                self.on_writer()
+            except Exception as e:
+                # The gallery is loaded on first use instead, and published then
+                logger.warning(f"Could not load the gallery to publish: {e}")
+        threading.Thread(target=self._publish_loop, name="gallery-publisher", daemon=True).start()
+        threading.Thread(target=self._sync_loop, name="gallery-sync", daemon=True).start()
+        self._dirty.set()
+
+    def _sync_loop(self):
+        # The readers rely on the writer to notice changes, so it keeps the
+        # gallery current (and retries a failed load) even when it gets no requests
+        while self.writer:
+            time.sleep(self.check_interval)
+            try:
+                self.gallery.ensure_loaded()
+            except Exception as e:
+                logger.error(f"Failed to sync the shared gallery: {e}")
+
+    def _publish_loop(self):
+        while True:
+            self._dirty.wait()
+            # Let a burst of changes settle into one generation
+            time.sleep(self.publish_delay)
+            self._dirty.clear()
+            if not self.gallery.loaded:
+                # Never publish an empty gallery; loading it sets _dirty again
+                continue
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Failed to publish the shared gallery: {e}")
+
+    def _attach_current(self):
+        """Map the generation CURRENT points at, if it is not mapped already"""
+        path = os.path.join(self.directory, POINTER)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._pointer_stamp:
+            return
+
+        with open(path) as f:
+            pointer = json.load(f)
+        if pointer["name"] != self._attached:
+            try:
+                self._attach(pointer)
+            except FileNotFoundError:
+                # Pruned while we read the pointer; the next check sees the newer one
+                return
+        self._pointer_stamp = stamp
+
+    def _attach(self, pointer):
+        base = os.path.join(self.directory, pointer["name"])
+
+        def load(filename):
+            return np.load(os.path.join(base, filename), mmap_mode="r")
+
+        ids = load("ids.npy")
+        people = PeopleColumns(
+            ids,
+            {field: load(f"people_{field}.npy") for field in TEXT_FIELDS},
+            {field: load(f"people_{field}_null.npy") for field in TEXT_FIELDS},
+        )
+        params = {key: np.array(load(f"matcher_{key}.npy")) for key in pointer.get("matcher", ())}
+        # A new matcher, swapped in with the snapshot whose codes it made
+        matcher = copy.copy(self.gallery.matcher)
+        matcher.set_params(params)
+
+        owners = load("template_owners.npy")
+        templates = load("templates.npy")
+        samples = {}
+        if len(owners):
+            unique, starts = np.unique(owners, return_index=True)
+            for person_id, block in zip(unique, np.split(templates, starts[1:])):
+                samples[int(person_id)] = block
+
+        self.gallery.attach(
+            load("embeddings.npy"), ids, people, load("codes.npy"), load("sq_norms.npy"),
+            samples, pointer.get("generation"), matcher
+        )
+        self._attached = pointer["name"]
+
+    def _write_pointer(self, pointer):
+        path = os.path.join(self.directory, POINTER)
+        staging = f"{path}.{os.getpid()}"
+        with open(staging, "w") as f:
+            json.dump(pointer, f)
+        os.replace(staging, path)
+
+    def _prune(self, keep):
+        generations = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith("g") and os.path.isdir(os.path.join(self.directory, name))
+        )
+        stale = [name for name in generations if name != keep][:-(KEEP_GENERATIONS - 1) or None]
+        for name in stale:
+            # Readers still mapping an old generation keep its pages until they switch
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _try_lock(self):
+        """Take the writer lock without waiting; our own file handle, never one inherited"""
+        if self.writer:
+            return True
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._lock_pid = os.getpid()
+        return True
+
+
+# Shared snapshots of the gallery, when GALLERY_SHARED_DIR is set; started by app.warm_up
+shared_gallery = None
+if GALLERY_SHARED_DIR:
+    shared_gallery = SharedGallery(gallery)
+    gallery.shared = shared_gallery
@@ -0,0 +1,220 @@
+"""
+Per-person face templates.
+
+Every embedding captured for a person is kept in face_templates, and
+people_records holds their centroid. The gallery matches one centroid per
+person, so its size does not grow with the number of templates; only when
+a query's best centroid distance lands near the threshold are the raw
+templates of the leading candidates compared, which recovers people whose
+photos vary more than their centroid suggests.
+"""
+import threading
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+
+from config import EMBEDDING_DIM, TEMPLATE_EXPAND_MARGIN, TEMPLATE_MAX_PER_PERSON
+from database import db_connection
+from services.embedding_codec import decode_rows, embedding_column, embedding_select
+from services.metrics import registry, stage
+
+expansions = registry.counter(
+    "frs_template_expansions_total", "Queries re-scored against raw templates near the threshold"
+)
+
+
+class TemplateStore:
+    """
+    Raw template embeddings of every person with more than one template,
+    as one float32 (templates x dim) matrix per person id.
+
+    People with a single template need no entry: their centroid is that
+    template, which the gallery already compares exactly.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self._write_lock = threading.Lock()
+        # Replaced, never mutated, so readers can use it without the lock
+        self._samples = {}
+
+    def __len__(self):
+        return len(self._samples)
+
+    def get(self, person_id):
+        return self._samples.get(person_id)
+
+    @stage("db_fetch")
+    def load(self, person_ids=None):
+        """
+        Replace the store with the templates in face_templates.
+
+        Args:
+            person_ids (list): Only reload these people, keeping everyone else
+
+        Returns:
+            int: Number of people with more than one template
+        """
+        where, params = "", ()
+        if person_ids is not None:
+            where, params = "WHERE person_id = ANY(%s) ", (list(person_ids),)
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT to_regclass('public.face_templates') IS NOT NULL AS present")
+            if not cur.fetchone()["present"]:
+                # migrations/003_face_templates.sql not applied: centroid-only matching
+                rows = []
+            else:
+                cur.execute(
+                    f"SELECT person_id, {embedding_select()} FROM face_templates "
+                    "WHERE person_id IN (SELECT person_id FROM face_templates "
+                    f"{where}GROUP BY person_id HAVING count(*) > 1) "
+                    "ORDER BY person_id, id",
+                    params
+                )
+                rows = cur.fetchall()
+
+        owners = np.array([row["person_id"] for row in rows], dtype=np.int64)
+        matrix = decode_rows(rows, self.dim)
+        with self._write_lock:
+            if person_ids is None:
+                samples = {}
+            else:
+                reloaded = set(person_ids)
+                samples = {k: v for k, v in self._samples.items() if k not in reloaded}
+            if len(owners):
+                unique, starts = np.unique(owners, return_index=True)
+                for person_id, block in zip(unique, np.split(matrix, starts[1:])):
+                    samples[int(person_id)] = block
+            self._samples = samples
+        return len(samples)
+
+    def add(self, person_id, encoding, source="capture"):
+        """
+        Store another template for a person and recompute their centroid.
+
+        The oldest captures beyond TEMPLATE_MAX_PER_PERSON are dropped; the
+        first (enrollment) template is always kept.
+
+        Args:
+            person_id (int): The enrolled person
+            encoding: The new 128-d face encoding
+            source (str): Where the template came from, kept for auditing
+
+        Returns:
+            tuple: (person, centroid, template_count), or None when the person does not exist
+        """
+        template_column, template_value = embedding_column(encoding)
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Locking the person serializes concurrent template adds for them
+            cur.execute(
+                "SELECT id, full_name, department, email, phone_number "
+                "FROM people_records WHERE id = %s FOR UPDATE",
+                (person_id,)
+            )
+            person = cur.fetchone()
+            if person is None:
+                return None
+
+            cur.execute(
+                f"INSERT INTO face_templates (person_id, {template_column}, source) VALUES (%s, %s, %s)",
+                (person_id, template_value, source)
+            )
+            cur.execute(
+                "DELETE FROM face_templates WHERE id IN ("
+                "SELECT id FROM face_templates WHERE person_id = %s "
+                "AND id <> (SELECT min(id) FROM face_templates WHERE person_id = %s) "
+                "ORDER BY id DESC OFFSET %s)",
+                (person_id, person_id, max(TEMPLATE_MAX_PER_PERSON - 1, 0))
+            )
+            cur.execute(
+                f"SELECT {embedding_select()} FROM face_templates WHERE person_id = %s ORDER BY id",
+                (person_id,)
+            )
+            samples = decode_rows(cur.fetchall(), self.dim)
+
+            centroid = samples.mean(axis=0)
+            centroid_column, centroid_value = embedding_column(centroid)
+            cur.execute(
+                f"UPDATE people_records SET {centroid_column} = %s WHERE id = %s",
+                (centroid_value, person_id)
+            )
+            conn.commit()
+
+        self._set(person_id, samples if len(samples) > 1 else None)
+        return dict(person), centroid, len(samples)
+
+    def attach(self, samples):
+        """Use templates published by another process (see services/shared_gallery.py)"""
+        with self._write_lock:
+            self._samples = samples
+
+    def discard(self, person_id):
+        """Forget a person's templates (the rows go with people_records ON DELETE CASCADE)"""
+        if person_id in self._samples:
+            self._set(person_id, None)
+
+    def near_threshold(self, indices, distances, threshold, margin=TEMPLATE_EXPAND_MARGIN):
+        """
+        Queries whose best centroid distance lies within `margin` of the
+        threshold, i.e. those refine() would re-score.
+
+        Returns:
+            ndarray: Query positions; empty when there are no templates to compare
+        """
+        if not margin or not self._samples:
+            return np.empty(0, dtype=np.int64)
+        best = distances[:, 0]
+        return np.nonzero((indices[:, 0] >= 0) & (best >= threshold - margin) & (best < threshold + margin))[0]
+
+    def refine(self, ids, indices, distances, queries, threshold, margin=TEMPLATE_EXPAND_MARGIN):
+        """
+        Re-score candidates against their raw templates for queries whose best
+        centroid distance lies within `margin` of the threshold.
+
+        A candidate's distance becomes the smaller of its centroid distance
+        and its closest template's; candidates are then re-ranked. Queries
+        clearly inside or outside the threshold are left untouched.
+
+        Args:
+            ids: Person id of every gallery row
+            indices, distances: (queries x k) ranked candidates from a matcher
+            queries: (queries x dim) float32 encodings
+
+        Returns:
+            tuple: (indices, distances), copies when anything was re-scored
+        """
+        samples = self._samples
+        near = self.near_threshold(indices, distances, threshold, margin)
+        if not len(near):
+            return indices, distances
+
+        expansions.inc(len(near))
+        indices, distances = indices.copy(), distances.copy()
+        for q in near:
+            changed = False
+            for rank in range(indices.shape[1]):
+                row = indices[q, rank]
+                if row < 0 or distances[q, rank] >= threshold + margin:
+                    break
+                person_samples = samples.get(int(ids[row]))
+                if person_samples is None:
+                    continue
+                diff = person_samples - queries[q]
+                closest = np.sqrt(np.einsum("ij,ij->i", diff, diff).min())
+                if closest < distances[q, rank]:
+                    distances[q, rank] = closest
+                    changed = True
+            if changed:
+                order = np.argsort(distances[q], kind="stable")
+                indices[q] = indices[q, order]
+                distances[q] = distances[q, order]
+        return indices, distances
+
+    def _set(self, person_id, samples):
+        with self._write_lock:
+            updated = dict(self._samples)
+            if samples is None:
+                updated.pop(person_id, None)
+            else:
+                updated[person_id] = np.ascontiguousarray(samples, dtype=np.float32)
+            self._samples = updated
@@ -0,0 +1,74 @@
+"""
+Signed, expiring login tokens.
+
+A token carries the user's id and email, timestamped and signed with
+HMAC-SHA256 under AUTH_SECRET_KEY (via itsdangerous, which Flask already
+depends on). Verifying one is a signature check and an age comparison;
+nothing is stored and Postgres is never consulted.
+"""
+import hashlib
+import logging
+import secrets
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from config import AUTH_SECRET_KEY, AUTH_TOKEN_TTL, AUTH_REQUIRED
+
+logger = logging.getLogger(__name__)
+
+if not AUTH_SECRET_KEY:
+    if AUTH_REQUIRED:
+        # A per-process key would make each web worker reject the others' tokens
+        # and log everyone out on every restart
+        raise RuntimeError("AUTH_REQUIRED is set but AUTH_SECRET_KEY is not; set a key shared by all web workers")
+    logger.warning("AUTH_SECRET_KEY is not set; login tokens are signed with a per-process random key")
+
+_serializer = URLSafeTimedSerializer(
+    AUTH_SECRET_KEY or secrets.token_hex(32),
+    salt="frs-login",
+    signer_kwargs={"digest_method": hashlib.sha256},
+)
+
+
+def issue_token(user):
+    """
+    Sign a token for a logged-in user.
+
+    Args:
+        user (dict): Row with at least "id" and "email"
+
+    Returns:
+        str: URL-safe token valid for AUTH_TOKEN_TTL seconds
+    """
+    return _serializer.dumps({"uid": user["id"], "email": user["email"]})
+
+
+def verify_token(token, max_age=AUTH_TOKEN_TTL):
+    """
+    Check a token's signature and age.
+
+    Returns:
+        dict: The token's claims ("uid", "email"), or None if invalid or expired
+    """
+    try:
+        return _serializer.loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None
+
+
+def require_token():
+    """
+    before_request hook for blueprints that need a logged-in user.
+
+    Reads `Authorization: Bearer <token>` and stores the claims in g.user.
+    Does nothing unless AUTH_REQUIRED is set, so existing clients keep working.
+    """
+    if not AUTH_REQUIRED or request.method == 'OPTIONS':
+        return None
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    claims = verify_token(token.strip()) if scheme.lower() == 'bearer' else None
+    if claims is None:
+        return jsonify({"error": "Missing, invalid or expired token"}), 401, {"WWW-Authenticate": "Bearer"}
+    g.user = claims
+    return None
@@ -0,0 +1,238 @@
+import itertools
+import secrets
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    TRACK_IOU_THRESHOLD, TRACK_MAX_MISSED, TRACK_CONFIDENCE_DECAY, TRACK_MIN_CONFIDENCE,
+    TRACK_UNKNOWN_RETRY_FRAMES, STREAM_SESSION_TTL
+)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of two lists of (top, right, bottom, left) boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def associate(boxes, track_boxes, iou_threshold=TRACK_IOU_THRESHOLD):
+    """
+    Pair detections with existing tracks.
+
+    Pairs are taken greedily by IoU. Detections left over are then paired by
+    centroid distance when the centre moved less than half a face width,
+    which catches fast motion between low-frame-rate captures.
+
+    Returns:
+        list: For each detection, the index into track_boxes, or None for a new face
+    """
+    assigned = [None] * len(boxes)
+    if not boxes or not track_boxes:
+        return assigned
+
+    overlaps = iou_matrix(boxes, track_boxes)
+    taken = set()
+    for flat in np.argsort(-overlaps, axis=None, kind="stable"):
+        d, t = divmod(int(flat), len(track_boxes))
+        if overlaps[d, t] < iou_threshold:
+            break
+        if assigned[d] is None and t not in taken:
+            assigned[d] = t
+            taken.add(t)
+
+    def centre(box):
+        top, right, bottom, left = box
+        return np.array([(top + bottom) / 2, (left + right) / 2]), (right - left)
+
+    for d, box in enumerate(boxes):
+        if assigned[d] is not None:
+            continue
+        c, width = centre(box)
+        best, best_distance = None, width / 2
+        for t, track_box in enumerate(track_boxes):
+            if t in taken:
+                continue
+            distance = np.linalg.norm(c - centre(track_box)[0])
+            if distance < best_distance:
+                best, best_distance = t, distance
+        if best is not None:
+            assigned[d] = best
+            taken.add(best)
+    return assigned
+
+
+def process_tracked_frame(image_data, track_boxes, refresh):
+    """
+    Worker task: detect faces in a frame, tie them to known tracks, and encode
+    only the faces that need it (new tracks and tracks flagged for refresh)
+    and that pass the quality gate.
+
+    Args:
+        image_data (bytes): The raw frame
+        track_boxes (list): Last known box of each active track
+        refresh (list): Per track, True when its identity should be re-checked
+
+    Returns:
+        tuple: (face_locations, track_indexes, encodings, error_message, quality)
+               encodings maps detection index -> 128-d encoding; quality is
+               {"frame": reason or None, "faces": {detection index: reason or None}}
+               for the faces that were due for encoding
+    """
+    import face_utils
+    from services.quality import REASONS, check_frame, check_faces
+
+    quality = {"frame": None, "faces": {}}
+    try:
+        image, scale = face_utils.load_image(image_data)
+        quality["frame"] = check_frame(image)
+        if quality["frame"]:
+            return [], [], {}, REASONS[quality["frame"]], quality
+
+        decoded_locations = face_utils.detect_faces(image)
+        face_locations = face_utils.scale_locations(decoded_locations, scale)
+        track_indexes = associate(face_locations, track_boxes)
+
+        due = [i for i, t in enumerate(track_indexes) if t is None or refresh[t]]
+        reasons, aligned = check_faces(image, [decoded_locations[i] for i in due], scale)
+        quality["faces"] = dict(zip(due, reasons))
+        aligned = dict(zip(due, aligned))
+        to_encode = [i for i in due if quality["faces"][i] is None]
+        encodings = dict(zip(
+            to_encode,
+            face_utils.encode_faces(image, [decoded_locations[i] for i in to_encode],
+                                    aligned=[aligned[i] for i in to_encode])
+        ))
+        return face_locations, track_indexes, encodings, None, quality
+    except Exception as e:
+        return [], [], {}, f"Error processing frame: {str(e)}", quality
+
+
+class Track:
+    """A face followed across frames, with the identity from its last encoding"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, box, frame):
+        self.id = next(Track._ids)
+        self.box = box
+        self.person = None
+        self.confidence = 0.0
+        self.encoded_frame = frame
+        self.missed = 0
+
+    def frames_since_encoding(self, frame):
+        return frame - self.encoded_frame
+
+    def current_confidence(self, frame):
+        """Match confidence, decayed for every frame since it was measured"""
+        return self.confidence * (TRACK_CONFIDENCE_DECAY ** self.frames_since_encoding(frame))
+
+    def needs_refresh(self, frame):
+        if self.person is None:
+            # Unknown faces are retried, but not on every frame
+            return self.frames_since_encoding(frame) >= TRACK_UNKNOWN_RETRY_FRAMES
+        return self.current_confidence(frame) < TRACK_MIN_CONFIDENCE
+
+
+class FaceTracker:
+    """Per-stream set of face tracks"""
+
+    def __init__(self):
+        self.frame = 0
+        self.tracks = []
+
+    def pending(self):
+        """Boxes and refresh flags for the worker, in track order"""
+        next_frame = self.frame + 1
+        return [t.box for t in self.tracks], [t.needs_refresh(next_frame) for t in self.tracks]
+
+    def update(self, face_locations, track_indexes, identities):
+        """
+        Apply one processed frame.
+
+        Args:
+            face_locations (list): Detected boxes
+            track_indexes (list): Track index per detection (None = new track)
+            identities (dict): Detection index -> (person or None, distance)
+                               for every detection that was encoded this frame
+
+        Returns:
+            list: (track, encoded_this_frame) for every detection, in order
+        """
+        self.frame += 1
+        seen = set()
+        results = []
+        for i, (box, t) in enumerate(zip(face_locations, track_indexes)):
+            track = self.tracks[t] if t is not None else Track(box, self.frame)
+            if t is None:
+                self.tracks.append(track)
+            track.box = box
+            track.missed = 0
+            if i in identities:
+                person, distance = identities[i]
+                track.person = person
+                track.confidence = 1 - distance if person is not None else 0.0
+                track.encoded_frame = self.frame
+            seen.add(track.id)
+            results.append((track, i in identities))
+
+        # Age out tracks that have not been seen for a while
+        for track in self.tracks:
+            if track.id not in seen:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= TRACK_MAX_MISSED]
+        return results
+
+
+class StreamSessions:
+    """Live scan sessions, each with its own tracker, expired after STREAM_SESSION_TTL idle seconds"""
+
+    def __init__(self, ttl=STREAM_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        session_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire()
+            # The per-session lock keeps frames of one stream in order
+            self._sessions[session_id] = [FaceTracker(), threading.Lock(), time.monotonic()]
+        return session_id
+
+    def get(self, session_id):
+        """Returns (tracker, lock) or None if the session is unknown or expired"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session[2] = time.monotonic()
+            return session[0], session[1]
+
+    def close(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [s for s, (_, _, seen) in self._sessions.items() if now - seen > self.ttl]:
+            del self._sessions[session_id]
+
+
+# Shared session registry used by the streaming routes
+stream_sessions = StreamSessions()
@@ -0,0 +1,195 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from config import FACE_WORKER_PROCESSES, FACE_WORKER_QUEUE_SIZE, FACE_WORKER_TIMEOUT
+from services.metrics import collect_stages, record_stage
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the job queue is full"""
+
+
+class JobTimeout(Exception):
+    """Raised when a job did not finish within its timeout"""
+
+
+# --- Worker process side ---
+
+def _tasks():
+    # Imported lazily so the web process only loads dlib when running inline
+    import face_utils
+    from services import tracking
+    return {
+        "process_face_image": face_utils.process_face_image,
+        "process_image_with_multiple_faces": face_utils.process_image_with_multiple_faces,
+        "process_tracked_frame": tracking.process_tracked_frame,
+    }
+
+
+def _init_worker():
+    """Load the dlib models once per worker so no job pays the cold start"""
+    from services.face_engine import face_engine
+    try:
+        face_engine.warm_up()
+    except Exception as e:
+        # Not fatal: the first real job will load whatever is missing
+        logger.warning(f"Face worker warm-up failed: {e}")
+
+
+def _run_task(task_name, shm_name, size, args):
+    """
+    Read the image out of shared memory and run a face_utils task on it.
+
+    Returns:
+        tuple: (task result, [(stage, seconds), ...] timed inside the worker)
+    """
+    # The web process owns the segment and unlinks it once the job returns.
+    # Tasks decode straight from the mapping (see services.image_ingest)
+    # instead of from a private copy of the upload.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    image_data = shm.buf[:size]
+    try:
+        # Stage timings are recorded in the web process, which serves /metrics
+        with collect_stages() as stages:
+            result = _tasks()[task_name](image_data, *args)
+    finally:
+        image_data.release()
+        try:
+            shm.close()
+        except BufferError:
+            # A view of the upload outlived the task; the mapping is freed with it
+            pass
+    return result, stages
+
+
+# --- Web process side ---
+
+class FaceWorkerPool:
+    """
+    Pool of preloaded worker processes for CPU-bound face detection and encoding.
+
+    Image bytes are handed to workers through shared memory rather than the
+    pickling pipe. At most max_pending jobs may be queued or running; beyond
+    that run() raises PoolSaturated immediately so the caller can shed load.
+    With processes=0 jobs run inline on the calling thread.
+    """
+
+    def __init__(self, processes=FACE_WORKER_PROCESSES, max_pending=FACE_WORKER_QUEUE_SIZE,
+                 timeout=FACE_WORKER_TIMEOUT):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending = 0  # Jobs queued or running, guarded by _lock
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        """Start the worker processes (also done lazily by the first job)"""
+        with self._lock:
+            if self._executor is None and self.processes > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                # Spin every worker up now rather than on the first jobs
+                for _ in range(self.processes):
+                    self._executor.submit(os.getpid)
+        return self
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def run(self, task_name, image_data, *args, timeout=None):
+        """
+        Run a face_utils task on a worker and wait for its result.
+
+        Args:
+            task_name (str): A face_utils task, e.g. "process_image_with_multiple_faces"
+            image_data (bytes-like): The raw image data, e.g. from image_ingest.read_upload()
+            *args: Extra (picklable) arguments for the task
+            timeout (float): Seconds to wait for the result
+
+        Raises:
+            PoolSaturated: Too many jobs already queued
+            JobTimeout: The job did not finish in time
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolSaturated(f"Face workers are saturated ({self.max_pending} jobs pending)")
+            self._pending += 1
+        if self.processes <= 0:
+            try:
+                return _tasks()[task_name](image_data, *args)
+            finally:
+                self._release()
+        return self._submit(task_name, image_data, args, self.timeout if timeout is None else timeout)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, task_name, image_data, args, timeout):
+        # The slot taken by run() is held until the worker is really done with
+        # the job, not just until we stop waiting for it
+        size = len(image_data)
+        shm = None
+        try:
+            self.start()
+            shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            shm.buf[:size] = image_data
+            submitted = time.perf_counter()
+            future = self._executor.submit(_run_task, task_name, shm.name, size, args)
+        except BaseException:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            self._release()
+            raise
+
+        def finished(_):
+            # A timed-out job may still be reading the image until it completes
+            shm.close()
+            shm.unlink()
+            self._release()
+        future.add_done_callback(finished)
+
+        try:
+            result, stages = future.result(timeout=timeout)
+        except FuturesTimeout:
+            future.cancel()
+            raise JobTimeout(f"Face processing did not finish within {timeout:.0f}s")
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start fresh ones for later jobs
+            self.shutdown()
+            raise
+
+        for name, seconds in stages:
+            record_stage(name, seconds)
+        # Queueing, IPC and pickling: the round trip not spent in the task itself
+        worker_seconds = sum(seconds for _, seconds in stages)
+        record_stage("worker_overhead", max(0.0, time.perf_counter() - submitted - worker_seconds))
+        return result
+
+    def stats(self):
+        """Configured size and current queue occupancy"""
+        return {
+            "processes": self.processes,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+        }
+
+
+# Shared pool used by the route handlers
+face_workers = FaceWorkerPool()